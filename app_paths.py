@@ -0,0 +1,11 @@
+import os
+
+APP_DIR_NAME = "SystemAudioTranscriber"
+
+
+def data_dir(*parts):
+    """Per-user directory for transcripts, caches and logs, created on first use"""
+    base = os.environ.get("LOCALAPPDATA") or os.path.join(os.path.expanduser("~"), ".local", "share")
+    path = os.path.join(base, APP_DIR_NAME, *parts)
+    os.makedirs(path, exist_ok=True)
+    return path
@@ -0,0 +1,253 @@
+import os
+import sys
+import json
+import time
+import threading
+
+from app_paths import data_dir
+
+# Names of devices that capture what is playing rather than a microphone
+LOOPBACK_KEYWORDS = ["stereo mix", "what u hear", "loopback", "wave out", "monitor"]
+# Longest wait between full rescans while the device list keeps not changing
+MAX_POLL_INTERVAL = 60.0
+
+
+def device_cache_path():
+    return os.path.join(data_dir(), "device.json")
+
+
+def is_loopback(info):
+    return any(keyword in info.get('name', '').lower() for keyword in LOOPBACK_KEYWORDS)
+
+
+def device_identity(info):
+    """Indices change when devices come and go; name plus host API does not"""
+    return info.get('name', ''), info.get('hostApi', 0)
+
+
+def device_counts():
+    """(inputs, outputs) as Windows currently sees them, or None where unavailable.
+
+    Unlike PortAudio's device list, winmm's counts follow hot-plugging
+    without re-initialisation and cost next to nothing to query.
+    """
+    if sys.platform != "win32":
+        return None
+    try:
+        import ctypes
+        winmm = ctypes.windll.winmm
+        return winmm.waveInGetNumDevs(), winmm.waveOutGetNumDevs()
+    except (OSError, AttributeError):
+        return None
+
+
+class AudioDevices:
+    """Owns the PyAudio instance; discovery and hot-plug polling run in the background.
+
+    PortAudio only sees new devices after a full re-initialisation, which is
+    expensive with WASAPI and can glitch other PortAudio clients. On Windows
+    the poller therefore only checks the device counts that winmm keeps up to
+    date every poll_interval seconds and re-creates the PyAudio instance when
+    they change. Elsewhere it rescans with a back-off that doubles up to
+    MAX_POLL_INTERVAL while nothing changes. It never re-initialises while a
+    stream is open (between begin_use() and end_use()). The selected capture device is
+    remembered in device.json so the next start can validate one device
+    instead of enumerating all of them before capture is possible.
+
+    Callbacks run on the discovery thread:
+      on_ready()                     first scan finished (check .error)
+      on_change(added, removed)      device names after a hot-plug change
+      on_message(text)
+    """
+
+    def __init__(self, cache_path=None, poll_interval=5.0, on_ready=None, on_change=None, on_message=None):
+        self.cache_path = cache_path or device_cache_path()
+        self.poll_interval = poll_interval
+        self.on_ready = on_ready or (lambda: None)
+        self.on_change = on_change or (lambda added, removed: None)
+        self.on_message = on_message or (lambda text: None)
+
+        self.audio = None
+        self.devices = []
+        self.default_input = None
+        self.default_output = None
+        self.selected = None
+        self.selected_from_cache = False
+        self.error = None
+        self.ready = threading.Event()
+        self.ready_seconds = None
+        self.scan_seconds = None
+        self._started = None
+        # Held while PyAudio is re-created and while a stream is open
+        self._lock = threading.RLock()
+        self._in_use = False
+        self._stop_event = threading.Event()
+        self._refresh = threading.Event()
+        self._thread = None
+
+    @property
+    def selected_index(self):
+        return self.selected['index'] if self.selected else None
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop_event.set()
+        self._refresh.set()
+
+    def refresh(self):
+        """Rescan soon, e.g. when the user opens the device list"""
+        self._refresh.set()
+
+    def begin_use(self):
+        """Pause hot-plug polling while streams are open on self.audio"""
+        with self._lock:
+            self._in_use = True
+
+    def end_use(self):
+        with self._lock:
+            self._in_use = False
+        # Devices may have changed while capturing
+        self.refresh()
+
+    def _run(self):
+        self._started = time.perf_counter()
+        try:
+            self._initial_scan()
+        except Exception as e:
+            self.error = e
+        finally:
+            self._mark_ready()
+        if self.error is not None:
+            return
+
+        interval = self.poll_interval
+        counts = device_counts()
+        while not self._stop_event.is_set():
+            refresh = self._refresh.wait(interval)
+            self._refresh.clear()
+            if self._stop_event.is_set():
+                return
+            if not refresh and counts is not None:
+                # Cheap check first; PortAudio is only re-created when the OS reports a change
+                previous, counts = counts, device_counts()
+                if counts == previous:
+                    continue
+            try:
+                changed = self.rescan()
+            except Exception as e:
+                self.on_message(f"Device refresh failed: {str(e)}")
+                changed = False
+            if counts is None:
+                interval = self.poll_interval if changed else min(interval * 2, MAX_POLL_INTERVAL)
+
+    def _initial_scan(self):
+        # Imported here so the window can appear before PortAudio is loaded
+        import pyaudio
+
+        # Only this thread ever re-creates self.audio, so the first scan needs no lock
+        self.audio = pyaudio.PyAudio()
+        cached = self._validate_cached()
+        if cached:
+            # Capture can start now; the full list is only needed for display and hot-plug
+            self.selected = cached
+            self.selected_from_cache = True
+            self._mark_ready()
+        started = time.perf_counter()
+        self._enumerate()
+        self.scan_seconds = time.perf_counter() - started
+        if not cached:
+            self._select_default()
+
+    def _mark_ready(self):
+        if self.ready.is_set():
+            return
+        self.ready_seconds = time.perf_counter() - self._started
+        self.ready.set()
+        self.on_ready()
+
+    def _validate_cached(self):
+        """The cached device, if it is still at the same index; one PortAudio query"""
+        try:
+            with open(self.cache_path, encoding='utf-8') as f:
+                cached = json.load(f)
+            info = self.audio.get_device_info_by_index(cached['index'])
+        except (OSError, ValueError, KeyError, TypeError, IOError):
+            return None
+        if device_identity(info) != (cached.get('name'), cached.get('hostApi', 0)):
+            return None
+        if info.get('maxInputChannels', 0) <= 0:
+            return None
+        return info
+
+    def _enumerate(self):
+        self.devices = [self.audio.get_device_info_by_index(i) for i in range(self.audio.get_device_count())]
+        try:
+            self.default_input = self.audio.get_default_input_device_info()
+        except IOError:
+            self.default_input = None
+        try:
+            self.default_output = self.audio.get_default_output_device_info()
+        except IOError:
+            self.default_output = None
+
+    def _find(self, identity):
+        for info in self.devices:
+            if device_identity(info) == identity and info.get('maxInputChannels', 0) > 0:
+                return info
+        return None
+
+    def _select_default(self):
+        """Prefer a loopback device, otherwise the default input"""
+        self.selected_from_cache = False
+        inputs = [info for info in self.devices if info.get('maxInputChannels', 0) > 0]
+        self.selected = next((info for info in inputs if is_loopback(info)), None) or self.default_input
+        if self.selected:
+            self.save_selection()
+
+    def save_selection(self):
+        info = self.selected
+        try:
+            with open(self.cache_path, 'w', encoding='utf-8') as f:
+                json.dump({'index': info['index'], 'name': info.get('name', ''),
+                           'hostApi': info.get('hostApi', 0)}, f)
+        except OSError as e:
+            self.on_message(f"Could not remember the capture device: {str(e)}")
+
+    def rescan(self):
+        """Re-initialise PortAudio to pick up hot-plugged devices; skipped while capturing"""
+        import pyaudio
+
+        with self._lock:
+            if self._in_use or self.audio is None:
+                return False
+            before = {device_identity(info) for info in self.devices}
+            self.audio.terminate()
+            self.audio = pyaudio.PyAudio()
+            self._enumerate()
+            after = {device_identity(info) for info in self.devices}
+            if before == after:
+                return False
+
+            previous = self.selected
+            self.selected = self._find(device_identity(previous)) if previous else None
+            if self.selected is None:
+                self._select_default()
+            elif self.selected['index'] != previous['index']:
+                self.save_selection()
+        added = sorted(name for name, _ in after - before)
+        removed = sorted(name for name, _ in before - after)
+        self.on_change(added, removed)
+        return True
+
+    def input_devices(self):
+        return [info for info in self.devices if info.get('maxInputChannels', 0) > 0]
+
+    def close(self):
+        self.stop()
+        with self._lock:
+            if self.audio is not None:
+                self.audio.terminate()
+                self.audio = None
@@ -0,0 +1,134 @@
+"""Rolling history of captured audio, kept in a memory-mapped file.
+
+The capture thread copies each converted block straight into the mapping,
+so the last few minutes stay available for export or re-transcription
+while resident memory stays flat: the OS pages the file in and out as
+needed.
+"""
+import json
+import wave
+import threading
+import numpy as np
+
+
+class AudioHistory:
+    """Fixed-size ring of int16 samples backed by a memory-mapped spill file.
+
+    Positions are stream samples since the last reset(), the same clock as
+    TranscriptionPipeline's result times; started_at maps them to wall-clock
+    time. Only the newest `capacity` samples are kept.
+    """
+
+    def __init__(self, path, capacity, rate=16000):
+        self.path = path
+        self.capacity = int(capacity)
+        self.rate = rate
+        self.started_at = None
+        self._data = np.memmap(path, dtype=np.int16, mode='w+', shape=(self.capacity,))
+        self._write_pos = 0
+        self._lock = threading.Lock()
+
+    def reset(self, started_at):
+        """Start a new stream; earlier audio is no longer readable"""
+        with self._lock:
+            self._write_pos = 0
+            self.started_at = started_at
+
+    @property
+    def end_seconds(self):
+        """Stream time just after the newest sample"""
+        return self._write_pos / self.rate
+
+    @property
+    def start_seconds(self):
+        """Stream time of the oldest sample still kept"""
+        return max(0, self._write_pos - self.capacity) / self.rate
+
+    def write(self, samples):
+        total = len(samples)
+        # A block longer than the ring only leaves its tail, but the clock still covers all of it
+        samples = samples[-self.capacity:]
+        n = len(samples)
+        with self._lock:
+            if self._data is None:
+                return
+            start = (self._write_pos + total - n) % self.capacity
+            first = min(n, self.capacity - start)
+            self._data[start:start + first] = samples[:first]
+            if first < n:
+                self._data[:n - first] = samples[first:]
+            self._write_pos += total
+
+    def write_silence(self, n):
+        """Advance the clock by n samples of silence, zeroed in place without a buffer"""
+        zeroed = min(n, self.capacity)
+        with self._lock:
+            if self._data is None:
+                return
+            start = self._write_pos % self.capacity
+            first = min(zeroed, self.capacity - start)
+            self._data[start:start + first] = 0
+            if first < zeroed:
+                self._data[:zeroed - first] = 0
+            self._write_pos += n
+
+    def read(self, start_seconds, end_seconds):
+        """Copy of the kept audio between two stream times, clipped to what is available.
+
+        Returns (samples, actual start in stream seconds).
+        """
+        with self._lock:
+            if self._data is None:
+                return np.zeros(0, dtype=np.int16), start_seconds
+            oldest = max(0, self._write_pos - self.capacity)
+            start = max(oldest, int(start_seconds * self.rate))
+            end = min(self._write_pos, int(end_seconds * self.rate))
+            out = np.zeros(max(0, end - start), dtype=np.int16)
+            if len(out):
+                i = start % self.capacity
+                first = min(len(out), self.capacity - i)
+                out[:first] = self._data[i:i + first]
+                out[first:] = self._data[:len(out) - first]
+        return out, start / self.rate
+
+    def read_recent(self, seconds_ago, until_seconds_ago=0.0):
+        """E.g. read_recent(30) for the last half minute"""
+        end = self.end_seconds
+        return self.read(end - seconds_ago, end - until_seconds_ago)
+
+    def close(self):
+        with self._lock:
+            if self._data is not None:
+                self._data.flush()
+                self._data = None
+
+
+def write_wav(path, samples, rate=16000):
+    with wave.open(path, 'wb') as wf:
+        wf.setnchannels(1)
+        wf.setsampwidth(2)
+        wf.setframerate(rate)
+        wf.writeframes(samples.tobytes())
+
+
+def transcribe_samples(recognizer, samples, rate=16000, offset=0.0, step=4000):
+    """Decode a block of audio with a fresh recognizer; results with times shifted by offset"""
+    results = []
+    data = samples.tobytes()
+    for pos in range(0, len(data), step * 2):
+        if recognizer.AcceptWaveform(data[pos:pos + step * 2]):
+            results.append(json.loads(recognizer.Result()))
+    results.append(json.loads(recognizer.FinalResult()))
+
+    finals = []
+    for result in results:
+        if not result.get('text', '').strip():
+            continue
+        words = result.get('result', [])
+        for word in words:
+            word['start'] += offset
+            word['end'] += offset
+        result['start'] = words[0]['start'] if words else offset
+        result['end'] = words[-1]['end'] if words else offset + len(samples) / rate
+        finals.append(result)
+    return finals
@@ -0,0 +1,232 @@
+import time
+import threading
+import numpy as np
+
+from metrics import MetricsRegistry
+
+# PortAudio error code raised by stream.read() when the input buffer overflowed
+PA_INPUT_OVERFLOWED = -9981
+
+
+class AudioRingBuffer:
+    """Bounded, preallocated ring buffer of int16 samples shared by capture and decode.
+
+    The capture side never blocks: when the decoder falls behind and the buffer
+    is full, the oldest unread samples are overwritten and counted as dropped,
+    so latency stays bounded and the loss is visible in the stats.
+    """
+
+    def __init__(self, capacity):
+        self.capacity = int(capacity)
+        self._buffer = np.zeros(self.capacity, dtype=np.int16)
+        # Absolute sample positions; the buffer index is position % capacity
+        self._read_pos = 0
+        self._write_pos = 0
+        self._cond = threading.Condition()
+        self._closed = False
+        self.dropped_samples = 0
+        # Stream position of the first sample returned by the last read_into()
+        self.last_read_start = 0
+        # Optional threading.Event set on every write or close, for readers polling several buffers
+        self.data_event = None
+
+    @property
+    def fill(self):
+        """Number of samples waiting to be decoded"""
+        with self._cond:
+            return self._write_pos - self._read_pos
+
+    @property
+    def fill_ratio(self):
+        return self.fill / self.capacity
+
+    @property
+    def closed(self):
+        return self._closed
+
+    def write(self, samples):
+        """Copy samples into the buffer and return how many unread samples were dropped"""
+        samples = np.asarray(samples, dtype=np.int16).ravel()
+        n = len(samples)
+        if n == 0:
+            return 0
+        if n > self.capacity:
+            # Only the newest `capacity` samples can ever be read
+            skipped = n - self.capacity
+            samples = samples[skipped:]
+            n = self.capacity
+        else:
+            skipped = 0
+
+        with self._cond:
+            start = self._write_pos % self.capacity
+            first = min(n, self.capacity - start)
+            self._buffer[start:start + first] = samples[:first]
+            if first < n:
+                self._buffer[:n - first] = samples[first:]
+            self._write_pos += n
+
+            dropped = skipped
+            overrun = self._write_pos - self._read_pos - self.capacity
+            if overrun > 0:
+                self._read_pos += overrun
+                dropped += overrun
+            self.dropped_samples += dropped
+            self._cond.notify_all()
+        if self.data_event is not None:
+            self.data_event.set()
+        return dropped
+
+    def read_into(self, out, timeout=None):
+        """Fill `out` with the next len(out) samples.
+
+        Blocks until enough audio is available, the timeout expires or the
+        buffer is closed. Returns the number of samples copied, which is only
+        short of len(out) after close().
+        """
+        n = len(out)
+        with self._cond:
+            self._cond.wait_for(
+                lambda: self._closed or self._write_pos - self._read_pos >= n,
+                timeout=timeout,
+            )
+            available = self._write_pos - self._read_pos
+            if available < n and not self._closed:
+                return 0
+            n = min(n, available)
+            self.last_read_start = self._read_pos
+            start = self._read_pos % self.capacity
+            first = min(n, self.capacity - start)
+            out[:first] = self._buffer[start:start + first]
+            if first < n:
+                out[first:n] = self._buffer[:n - first]
+            self._read_pos += n
+            return n
+
+    def close(self):
+        """Wake up any waiting reader; remaining samples can still be drained"""
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+        if self.data_event is not None:
+            self.data_event.set()
+
+
+class PipelineStats:
+    """Counters shared between the capture and decode stages"""
+
+    def __init__(self, rate):
+        self.rate = rate
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self.captured_frames = 0
+            self.dropped_frames = 0
+            self.overflows = 0
+            self.decoded_frames = 0
+            self.decode_seconds = 0.0
+            self.buffer_fill = 0.0
+            self.decode_lag = 0.0
+
+    def record_capture(self, frames, dropped):
+        with self._lock:
+            self.captured_frames += frames
+            self.dropped_frames += dropped
+
+    def record_overflow(self):
+        with self._lock:
+            self.overflows += 1
+
+    def record_decode(self, frames, elapsed, ring):
+        with self._lock:
+            self.decoded_frames += frames
+            self.decode_seconds += elapsed
+            self.buffer_fill = ring.fill_ratio
+            # Audio still waiting in the ring is how far decoding trails capture
+            self.decode_lag = ring.fill / self.rate
+
+    @property
+    def real_time_factor(self):
+        """Decode time per second of audio; above 1.0 the decoder cannot keep up"""
+        audio_seconds = self.decoded_frames / self.rate
+        return self.decode_seconds / audio_seconds if audio_seconds else 0.0
+
+    def snapshot(self):
+        with self._lock:
+            return {
+                "captured_frames": self.captured_frames,
+                "dropped_frames": self.dropped_frames,
+                "overflows": self.overflows,
+                "decoded_frames": self.decoded_frames,
+                "buffer_fill": self.buffer_fill,
+                "decode_lag": self.decode_lag,
+                "real_time_factor": self.real_time_factor,
+            }
+
+
+class CaptureThread(threading.Thread):
+    """Reads fixed-size chunks from a PyAudio input stream into an AudioRingBuffer.
+
+    An optional converter (see resample.PolyphaseResampler) turns each raw
+    device block into mono samples at the recognizer rate before it is
+    written to the ring. An optional history (see audio_history.AudioHistory)
+    receives the same samples; while `paused` is set it receives silence
+    instead, which keeps its clock in step with the stream.
+    """
+
+    def __init__(self, stream, ring, chunk, stats, converter=None, metrics=None, history=None):
+        super().__init__(daemon=True)
+        self.stream = stream
+        self.ring = ring
+        self.chunk = chunk
+        self.stats = stats
+        self.converter = converter
+        self.history = history
+        self.paused = False
+        self.error = None
+        self._stop_event = threading.Event()
+        metrics = metrics or MetricsRegistry()
+        self._read_timer = metrics.histogram("capture_read_seconds", "Time blocked in stream.read()")
+        self._convert_timer = metrics.histogram("resample_seconds", "Downmix and resampling per device block")
+        self._write_timer = metrics.histogram("ring_write_seconds", "Copying a block into the ring buffer (and history)")
+
+    def stop(self):
+        self._stop_event.set()
+
+    def run(self):
+        try:
+            while not self._stop_event.is_set():
+                start = time.perf_counter()
+                try:
+                    data = self.stream.read(self.chunk, exception_on_overflow=True)
+                except IOError as e:
+                    # PortAudio discarded input before we could read it
+                    if getattr(e, "errno", None) == PA_INPUT_OVERFLOWED or "Input overflowed" in str(e):
+                        self.stats.record_overflow()
+                        continue
+                    raise
+                read_done = time.perf_counter()
+                self._read_timer.observe(read_done - start)
+                if self.converter:
+                    samples = self.converter.process(data)
+                else:
+                    samples = np.frombuffer(data, dtype=np.int16)
+                converted = time.perf_counter()
+                self._convert_timer.observe(converted - read_done)
+                dropped = self.ring.write(samples)
+                if self.history is not None:
+                    if self.paused:
+                        self.history.write_silence(len(samples))
+                    else:
+                        self.history.write(samples)
+                self._write_timer.observe(time.perf_counter() - converted)
+                self.stats.record_capture(len(samples), dropped)
+        except EOFError:
+            pass  # Replayed streams end this way; the decoder drains what is left
+        except Exception as e:
+            self.error = e
+        finally:
+            self.ring.close()
+
@@ -0,0 +1,282 @@
+"""Headless batch transcription of recorded WAV files.
+
+Long files are split at the quietest point near each segment boundary, the
+segments are decoded on a pool of worker processes (each loads the Vosk model
+once) and the results are stitched back together in order with timestamps.
+The parent only streams each file once to find the cuts, just before its
+segments are handed out, so memory use does not grow with the batch and
+decoding starts after the first file has been scanned.
+
+Usage:
+    python batch_transcribe.py --model models/vosk-model-small-en-us-0.15 recordings/*.wav
+"""
+import os
+import sys
+import json
+import time
+import wave
+import argparse
+import multiprocessing
+import numpy as np
+
+FRAME_SECONDS = 0.03   # Analysis frame used to look for silence
+READ_FRAMES = 4000     # Frames fed to the recognizer per AcceptWaveform call
+SCAN_SECONDS = 30.0    # Audio read at once while looking for silence
+
+# Per-process model, loaded once by init_worker()
+_model = None
+
+
+def read_wav_mono(path, start_frame=0, n_frames=None):
+    """Read 16-bit PCM from a WAV file, downmixed to mono int16. Returns (samples, rate)"""
+    with wave.open(path, 'rb') as wf:
+        if wf.getsampwidth() != 2 or wf.getcomptype() != 'NONE':
+            raise ValueError(f"{path}: only uncompressed 16-bit PCM WAV files are supported")
+        channels = wf.getnchannels()
+        rate = wf.getframerate()
+        if n_frames is None:
+            n_frames = wf.getnframes() - start_frame
+        wf.setpos(start_frame)
+        data = wf.readframes(n_frames)
+    samples = np.frombuffer(data, dtype=np.int16)
+    if channels > 1:
+        samples = samples.reshape(-1, channels).mean(axis=1).astype(np.int16)
+    return samples, rate
+
+
+def frame_energy(samples, rate, frame_seconds=FRAME_SECONDS):
+    """Mean square energy of consecutive non-overlapping frames"""
+    frame_len = max(1, int(rate * frame_seconds))
+    n = len(samples) // frame_len
+    frames = samples[:n * frame_len].astype(np.float32).reshape(n, frame_len)
+    return np.einsum('ij,ij->i', frames, frames) / frame_len, frame_len
+
+
+def file_frame_energy(path, frame_seconds=FRAME_SECONDS, scan_seconds=SCAN_SECONDS):
+    """frame_energy() of a WAV file read in blocks. Returns (energy, frame_len, total samples, rate)"""
+    with wave.open(path, 'rb') as wf:
+        rate = wf.getframerate()
+        total = wf.getnframes()
+    frame_len = max(1, int(rate * frame_seconds))
+    block = max(1, int(scan_seconds * rate) // frame_len) * frame_len
+    energies = []
+    for start in range(0, total, block):
+        samples, _ = read_wav_mono(path, start, min(block, total - start))
+        energies.append(frame_energy(samples, rate, frame_seconds)[0])
+    energy = np.concatenate(energies) if energies else np.zeros(0, dtype=np.float32)
+    return energy, frame_len, total, rate
+
+
+def split_at_silence(samples, rate, max_segment_seconds=30.0, min_segment_seconds=10.0):
+    """Return (start, end) sample ranges no longer than max_segment_seconds.
+
+    Each cut is placed at the lowest-energy frame between min_segment_seconds
+    and max_segment_seconds after the previous cut, so words are not split.
+    """
+    if len(samples) <= int(max_segment_seconds * rate):
+        return [(0, len(samples))]
+    energy, frame_len = frame_energy(samples, rate)
+    return split_energy(energy, frame_len, len(samples), rate, max_segment_seconds, min_segment_seconds)
+
+
+def split_energy(energy, frame_len, total, rate, max_segment_seconds=30.0, min_segment_seconds=10.0):
+    """split_at_silence() from precomputed frame energies of `total` samples"""
+    max_len = int(max_segment_seconds * rate)
+    if total <= max_len:
+        return [(0, total)]
+
+    min_frames = max(1, int(min_segment_seconds * rate) // frame_len)
+    max_frames = max(min_frames + 1, max_len // frame_len)
+
+    segments = []
+    start_frame = 0
+    while total - start_frame * frame_len > max_len:
+        window = energy[start_frame + min_frames:start_frame + max_frames]
+        cut_frame = start_frame + min_frames + int(np.argmin(window))
+        segments.append((start_frame * frame_len, cut_frame * frame_len))
+        start_frame = cut_frame
+    segments.append((start_frame * frame_len, total))
+    return segments
+
+
+def init_worker(model_path):
+    """Pool initializer: load the model once per worker process"""
+    global _model
+    from vosk import Model, SetLogLevel
+    SetLogLevel(-1)
+    _model = Model(model_path)
+
+
+def transcribe_segment(task):
+    """Decode one segment of a file. Runs inside a worker process"""
+    from vosk import KaldiRecognizer
+
+    file_index, segment_index, path, start, end = task
+    samples, rate = read_wav_mono(path, start, end - start)
+    offset = start / rate
+
+    cpu_start = time.process_time()
+    recognizer = KaldiRecognizer(_model, rate)
+    recognizer.SetWords(True)
+
+    results = []
+    data = samples.tobytes()
+    step = READ_FRAMES * 2
+    for pos in range(0, len(data), step):
+        if recognizer.AcceptWaveform(data[pos:pos + step]):
+            results.append(json.loads(recognizer.Result()))
+    results.append(json.loads(recognizer.FinalResult()))
+
+    lines = []
+    for result in results:
+        text = result.get('text', '').strip()
+        if not text:
+            continue
+        words = result.get('result', [])
+        if words:
+            line_start = words[0]['start'] + offset
+            line_end = words[-1]['end'] + offset
+        else:
+            line_start = line_end = offset
+        lines.append({
+            'start': line_start,
+            'end': line_end,
+            'text': text,
+            'words': [dict(w, start=w['start'] + offset, end=w['end'] + offset) for w in words],
+        })
+    return file_index, segment_index, lines, time.process_time() - cpu_start
+
+
+def format_timestamp(seconds):
+    hours, remainder = divmod(seconds, 3600)
+    minutes, seconds = divmod(remainder, 60)
+    return f"{int(hours):02d}:{int(minutes):02d}:{seconds:05.2f}"
+
+
+def output_paths(paths, output_dir, output_format):
+    """Transcript path for each input.
+
+    Next to each input by default. With output_dir, the inputs' directory
+    layout below their common parent is kept, so a/x.wav and b/x.wav do not
+    overwrite each other. Raises ValueError if two inputs would still share one.
+    """
+    extension = '.json' if output_format == 'json' else '.txt'
+    absolute = [os.path.abspath(path) for path in paths]
+    if output_dir:
+        root = os.path.commonpath([os.path.dirname(path) for path in absolute])
+        targets = [os.path.join(output_dir, os.path.relpath(os.path.splitext(path)[0], root)) + extension
+                   for path in absolute]
+    else:
+        targets = [os.path.splitext(path)[0] + extension for path in absolute]
+    seen = {}
+    for path, target in zip(paths, targets):
+        key = os.path.normcase(target)
+        if key in seen:
+            raise ValueError(f"{seen[key]} and {path} would both be transcribed to {target}")
+        seen[key] = path
+    return targets
+
+
+def write_transcript(path, lines, out_path, output_format):
+    os.makedirs(os.path.dirname(out_path), exist_ok=True)
+    if output_format == 'json':
+        with open(out_path, 'w', encoding='utf-8') as f:
+            json.dump({'file': path, 'segments': lines}, f, indent=2)
+    else:
+        with open(out_path, 'w', encoding='utf-8') as f:
+            for line in lines:
+                f.write(f"[{format_timestamp(line['start'])} - {format_timestamp(line['end'])}] {line['text']}\n")
+    return out_path
+
+
+def run_batch(model_path, paths, workers=None, max_segment_seconds=30.0,
+              output_dir=None, output_format='txt', log=print):
+    """Transcribe all files on a process pool and return per-file summaries"""
+    workers = workers or os.cpu_count() or 1
+    targets = output_paths(paths, output_dir, output_format)
+
+    # Headers only: lengths for scheduling, and bad files are reported before any decoding
+    files = []
+    for path, target in zip(paths, targets):
+        with wave.open(path, 'rb') as wf:
+            if wf.getsampwidth() != 2 or wf.getcomptype() != 'NONE':
+                raise ValueError(f"{path}: only uncompressed 16-bit PCM WAV files are supported")
+            duration = wf.getnframes() / wf.getframerate()
+        files.append({'path': path, 'output': target, 'duration': duration, 'pending': None,
+                      'segments': {}, 'cpu_seconds': 0.0})
+
+    def tasks():
+        # Longest files first so one big file does not finish last on a single core.
+        # Runs on the pool's task thread, so each file is scanned just before it is needed.
+        for file_index in sorted(range(len(files)), key=lambda i: -files[i]['duration']):
+            info = files[file_index]
+            energy, frame_len, total, rate = file_frame_energy(info['path'])
+            segments = split_energy(energy, frame_len, total, rate, max_segment_seconds,
+                                    min_segment_seconds=max_segment_seconds / 3)
+            info['pending'] = len(segments)
+            for segment_index, (start, end) in enumerate(segments):
+                yield file_index, segment_index, info['path'], start, end
+
+    log(f"Transcribing {len(paths)} file(s) on {workers} worker(s)")
+    summaries = []
+    batch_start = time.perf_counter()
+    with multiprocessing.Pool(workers, initializer=init_worker, initargs=(model_path,)) as pool:
+        for file_index, segment_index, lines, cpu_seconds in pool.imap_unordered(transcribe_segment, tasks()):
+            info = files[file_index]
+            info['segments'][segment_index] = lines
+            info['cpu_seconds'] += cpu_seconds
+            info['pending'] -= 1
+            if info['pending']:
+                continue
+
+            # All segments of this file are done: stitch them back in order
+            ordered = [line for i in sorted(info['segments']) for line in info['segments'][i]]
+            out_path = write_transcript(info['path'], ordered, info['output'], output_format)
+            wall = time.perf_counter() - batch_start
+            rtf = info['cpu_seconds'] / info['duration'] if info['duration'] else 0.0
+            summary = {
+                'file': info['path'],
+                'output': out_path,
+                'audio_seconds': info['duration'],
+                'cpu_seconds': info['cpu_seconds'],
+                'real_time_factor': rtf,
+                'finished_after': wall,
+            }
+            summaries.append(summary)
+            info['segments'] = None
+            log(f"{info['path']}: {info['duration']:.1f}s audio, RTF {rtf:.3f} -> {out_path}")
+
+    elapsed = time.perf_counter() - batch_start
+    total_audio = sum(f['duration'] for f in files)
+    if elapsed > 0:
+        log(f"Done: {total_audio:.1f}s of audio in {elapsed:.1f}s ({total_audio / elapsed:.1f}x real time)")
+    return summaries
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Transcribe WAV files with a Vosk model on all CPU cores")
+    parser.add_argument('files', nargs='+', help="16-bit PCM WAV files to transcribe")
+    parser.add_argument('--model', required=True, help="Path to a Vosk model directory")
+    parser.add_argument('--workers', type=int, default=None,
+                        help="Number of worker processes (default: number of CPU cores)")
+    parser.add_argument('--max-segment', type=float, default=30.0,
+                        help="Longest segment in seconds handed to one worker (default: 30)")
+    parser.add_argument('--output-dir', default=None,
+                        help="Directory for transcripts (default: next to each input file)")
+    parser.add_argument('--format', choices=['txt', 'json'], default='txt', help="Transcript format")
+    args = parser.parse_args(argv)
+
+    if not os.path.isdir(args.model):
+        parser.error(f"model directory not found: {args.model}")
+
+    try:
+        run_batch(args.model, args.files, args.workers, args.max_segment,
+                  args.output_dir, args.format)
+    except (OSError, ValueError, wave.Error) as e:
+        print(f"Error: {e}", file=sys.stderr)
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,377 @@
+"""Replay benchmark for the live transcription pipeline.
+
+PyAudio is replaced by a fake stream that replays WAV fixtures, either paced
+at real time or as fast as the pipeline can consume them. Everything after
+the device (capture thread, ring buffer, VAD, recognizer, result parsing)
+is the real TranscriptionPipeline. Every case runs in a fresh process so peak
+RSS is measured per model and chunk size.
+
+Usage:
+    python benchmark.py --model models/vosk-model-small-en-us-0.15 --wav fixtures/meeting.wav \\
+        --profile low-latency balanced auto --chunk 2000 4000 8000 --output bench.json
+    python benchmark.py ... --baseline bench.json   # exit code 1 on regressions
+    python benchmark.py ... --decode full keywords both --keywords "budget, release date"
+    python benchmark.py ... --cache off on   # fixture played twice; the second pass can reuse the first
+    python benchmark.py ... --endpoint 0 0.5 0.8 1.2   # seconds of pause before a forced final (0: off)
+"""
+import os
+import sys
+import json
+import time
+import bisect
+import shutil
+import argparse
+import itertools
+import platform
+import tempfile
+import threading
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+
+from batch_transcribe import read_wav_mono
+from latency import LATENCY_PROFILES, DEFAULT_PROFILE
+from keywords import KeywordSpotter, parse_phrases
+
+RECOGNIZER_RATE = 16000
+
+# Metrics compared against a baseline, all "lower is better"
+REGRESSION_METRICS = [
+    ("real_time_factor",),
+    ("cpu_per_audio_second",),
+    ("final_latency", "p90"),
+    ("partial_latency", "p90"),
+    ("peak_rss_mb",),
+]
+
+
+class FakeStream:
+    """Stands in for a PyAudio input stream, replaying samples from memory"""
+
+    def __init__(self, samples, rate, realtime, backpressure=None):
+        self.samples = samples
+        self.rate = rate
+        self.realtime = realtime
+        # Returns True while the consumer has no room for n more samples
+        self.backpressure = backpressure
+        self.position = 0
+        self.started = None
+        # (stream position after the read, wall time the read returned)
+        self._delivered_positions = []
+        self._delivered_times = []
+        self._lock = threading.Lock()
+
+    def read(self, n, exception_on_overflow=True):
+        if self.started is None:
+            self.started = time.perf_counter()
+        if self.position >= len(self.samples):
+            raise EOFError
+        end = min(self.position + n, len(self.samples))
+        if self.realtime:
+            # A real device returns a buffer once it has been fully recorded
+            delay = self.started + end / self.rate - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+        elif self.backpressure:
+            # At max speed, wait for the decoder instead of overrunning the ring buffer
+            while self.backpressure(end - self.position):
+                time.sleep(0.001)
+        data = self.samples[self.position:end].tobytes()
+        self.position = end
+        with self._lock:
+            self._delivered_positions.append(end)
+            self._delivered_times.append(time.perf_counter())
+        return data
+
+    def delivery_time(self, stream_seconds):
+        """Wall time at which audio up to stream_seconds had been handed to the pipeline"""
+        position = int(round(stream_seconds * self.rate))
+        with self._lock:
+            i = bisect.bisect_left(self._delivered_positions, position)
+            i = min(i, len(self._delivered_times) - 1)
+            return self._delivered_times[i]
+
+    def stop_stream(self):
+        pass
+
+    def close(self):
+        pass
+
+
+class FakePyAudio:
+    """Just enough of pyaudio.PyAudio for TranscriptionPipeline"""
+
+    def __init__(self, samples, rate, realtime):
+        self.samples = samples
+        self.rate = rate
+        self.realtime = realtime
+        self.backpressure = None
+        self.stream = None
+
+    def open(self, format=None, channels=1, rate=16000, input=True,
+             frames_per_buffer=1024, input_device_index=None):
+        if rate != self.rate or channels != 1:
+            raise ValueError(f"fixture is {self.rate} Hz mono but the pipeline opened {rate} Hz x{channels}")
+        self.stream = FakeStream(self.samples, self.rate, self.realtime, self.backpressure)
+        return self.stream
+
+    def get_default_input_device_info(self):
+        # Report the fixture's format so the pipeline resamples it like a real device
+        return {'index': 0, 'name': 'replay', 'defaultSampleRate': float(self.rate), 'maxInputChannels': 1}
+
+
+def peak_rss_bytes():
+    """Peak resident set size of this process"""
+    try:
+        import resource
+    except ImportError:
+        return _windows_peak_rss()
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports kilobytes, macOS bytes
+    return peak if sys.platform == 'darwin' else peak * 1024
+
+
+def _windows_peak_rss():
+    import ctypes
+    from ctypes import wintypes
+
+    class PROCESS_MEMORY_COUNTERS(ctypes.Structure):
+        _fields_ = [
+            ("cb", wintypes.DWORD),
+            ("PageFaultCount", wintypes.DWORD),
+            ("PeakWorkingSetSize", ctypes.c_size_t),
+            ("WorkingSetSize", ctypes.c_size_t),
+            ("QuotaPeakPagedPoolUsage", ctypes.c_size_t),
+            ("QuotaPagedPoolUsage", ctypes.c_size_t),
+            ("QuotaPeakNonPagedPoolUsage", ctypes.c_size_t),
+            ("QuotaNonPagedPoolUsage", ctypes.c_size_t),
+            ("PagefileUsage", ctypes.c_size_t),
+            ("PeakPagefileUsage", ctypes.c_size_t),
+        ]
+
+    counters = PROCESS_MEMORY_COUNTERS()
+    counters.cb = ctypes.sizeof(counters)
+    process = ctypes.windll.kernel32.GetCurrentProcess()
+    ctypes.windll.psapi.GetProcessMemoryInfo(process, ctypes.byref(counters), counters.cb)
+    return counters.PeakWorkingSetSize
+
+
+def percentiles(values):
+    if not values:
+        return {"count": 0}
+    values = np.asarray(values)
+    return {
+        "count": int(len(values)),
+        "p50": float(np.percentile(values, 50)),
+        "p90": float(np.percentile(values, 90)),
+        "p99": float(np.percentile(values, 99)),
+        "max": float(values.max()),
+    }
+
+
+def run_case(model_path, wav_path, profile, chunk, realtime, vad_mode, decode="full", keywords=None, cache="off",
+             endpoint=None):
+    """Run one benchmark case. Executed in a fresh worker process.
+
+    decode is "full" (open vocabulary), "keywords" (grammar recognizer only)
+    or "both", as in the window's decode modes. With cache="on" the fixture
+    is played twice through an empty fingerprint cache, so the second pass
+    measures how much decoding repeats save. endpoint is the pause in seconds
+    after which a sentence is finalized (None: the profile's, 0: off).
+    """
+    from vosk import Model, KaldiRecognizer, SetLogLevel
+    from transcription import TranscriptionPipeline
+
+    SetLogLevel(-1)
+    samples, rate = read_wav_mono(wav_path)
+    fingerprint_cache = None
+    if cache == "on":
+        from fingerprint_cache import FingerprintCache
+        samples = np.concatenate((samples, samples))
+        cache_dir = tempfile.mkdtemp()
+        fingerprint_cache = FingerprintCache(os.path.join(cache_dir, "fingerprints.db"), rate=RECOGNIZER_RATE)
+        # Started as in the app, so stored sentences are written while the fixture plays
+        fingerprint_cache.start()
+
+    load_start = time.perf_counter()
+    model = Model(model_path)
+    model_load_seconds = time.perf_counter() - load_start
+
+    recognizer = None
+    if decode != "keywords":
+        recognizer = KaldiRecognizer(model, RECOGNIZER_RATE)
+        recognizer.SetWords(True)
+    spotter = KeywordSpotter(model, keywords, RECOGNIZER_RATE) if decode != "full" else None
+    audio = FakePyAudio(samples, rate, realtime)
+    final_latencies = []
+    partial_latencies = []
+    words = []
+
+    def on_final(result):
+        final_latencies.append(time.perf_counter() - audio.stream.delivery_time(result['end']))
+        words.extend(w['word'] for w in result.get('result', []))
+
+    def on_partial(text):
+        partial_latencies.append(time.perf_counter() - audio.stream.delivery_time(pipeline.decoded_until))
+
+    pipeline = TranscriptionPipeline(audio, None, recognizer, rate=RECOGNIZER_RATE, profile=profile, chunk=chunk,
+                                     vad_mode=vad_mode, spotter=spotter, fingerprint_cache=fingerprint_cache,
+                                     endpoint_seconds=endpoint, on_final=on_final, on_partial=on_partial)
+    audio.backpressure = lambda n: pipeline.ring.capacity - pipeline.ring.fill < n * RECOGNIZER_RATE / rate
+
+    cpu_start = time.process_time()
+    wall_start = time.perf_counter()
+    try:
+        pipeline.run()
+    finally:
+        if fingerprint_cache is not None:
+            # Flushing the queued writes is part of what the cache costs
+            fingerprint_cache.close()
+    wall_seconds = time.perf_counter() - wall_start
+    cpu_seconds = time.process_time() - cpu_start
+
+    audio_seconds = len(samples) / rate
+    stats = pipeline.stats.snapshot()
+    matcher = pipeline.matcher
+    if fingerprint_cache is not None:
+        shutil.rmtree(cache_dir, ignore_errors=True)
+    return {
+        "model": os.path.basename(os.path.normpath(model_path)),
+        "wav": os.path.basename(wav_path),
+        "profile": profile,
+        "chunk": chunk,
+        "final_chunk": pipeline.chunk,
+        "mode": "realtime" if realtime else "max",
+        "vad": vad_mode,
+        "decode": decode,
+        "cache": cache,
+        "endpoint": endpoint,
+        "endpoint_seconds": pipeline.endpointer.pause_seconds,
+        "audio_seconds": audio_seconds,
+        "wall_seconds": wall_seconds,
+        "model_load_seconds": model_load_seconds,
+        "real_time_factor": stats["real_time_factor"],
+        "throughput_x_realtime": audio_seconds / wall_seconds if wall_seconds else 0.0,
+        "cpu_per_audio_second": cpu_seconds / audio_seconds if audio_seconds else 0.0,
+        "final_latency": percentiles(final_latencies),
+        "partial_latency": percentiles(partial_latencies),
+        "peak_rss_mb": peak_rss_bytes() / (1024 * 1024),
+        "dropped_frames": stats["dropped_frames"],
+        "fixture_rate": rate,
+        "resample_us_per_block": pipeline.resampler.mean_chunk_us,
+        "vad_skipped_ratio": pipeline.vad.stats.skipped_ratio,
+        "words": len(words),
+        "keyword_alerts": spotter.alerts if spotter else 0,
+        "cache_hit_rate": matcher.hit_rate if matcher else 0.0,
+        "cache_skipped_seconds": matcher.skipped_seconds if matcher else 0.0,
+        "cache_entries": len(fingerprint_cache) if fingerprint_cache is not None else 0,
+        "forced_finals": pipeline.endpointer.forced,
+    }
+
+
+def case_key(result):
+    return (result["model"], result["wav"], result.get("profile"), result["chunk"], result["mode"], result["vad"],
+            result.get("decode", "full"), result.get("cache", "off"), result.get("endpoint"))
+
+
+def metric_value(result, path):
+    value = result
+    for part in path:
+        value = value.get(part) if isinstance(value, dict) else None
+    return value
+
+
+def find_regressions(results, baseline, tolerance):
+    """Compare against a previous run; returns human-readable regression lines"""
+    previous = {case_key(r): r for r in baseline.get("results", [])}
+    regressions = []
+    for result in results:
+        old = previous.get(case_key(result))
+        if old is None:
+            continue
+        for path in REGRESSION_METRICS:
+            new_value = metric_value(result, path)
+            old_value = metric_value(old, path)
+            if new_value is None or not old_value:
+                continue
+            if new_value > old_value * (1 + tolerance):
+                name = ".".join(path)
+                regressions.append(f"{'/'.join(map(str, case_key(result)))}: {name} "
+                                   f"{old_value:.4g} -> {new_value:.4g} (+{new_value / old_value - 1:.0%})")
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the transcription pipeline by replaying WAV files")
+    parser.add_argument('--model', action='append', required=True,
+                        help="Vosk model directory; repeat to compare model sizes")
+    parser.add_argument('--wav', action='append', required=True,
+                        help="16-bit PCM WAV fixture at any rate, resampled like a device; repeat for several")
+    parser.add_argument('--profile', nargs='+', default=[DEFAULT_PROFILE], choices=list(LATENCY_PROFILES),
+                        help="Latency profiles to compare")
+    parser.add_argument('--chunk', type=int, nargs='+', default=[None],
+                        help="Chunk sizes in frames, overriding the profile's chunk size")
+    parser.add_argument('--vad', nargs='+', default=["energy"], help="VAD modes to compare")
+    parser.add_argument('--decode', nargs='+', default=["full"], choices=["full", "keywords", "both"],
+                        help="Decoders to compare: open vocabulary, keyword grammar only, or both")
+    parser.add_argument('--keywords', default="",
+                        help="Comma-separated phrases for the keyword decode modes")
+    parser.add_argument('--cache', nargs='+', default=["off"], choices=["off", "on"],
+                        help="Compare without and with the fingerprint transcript cache")
+    parser.add_argument('--endpoint', type=float, nargs='+', default=[None],
+                        help="Seconds of pause after which a sentence is finalized (default: the profile's, 0: off)")
+    parser.add_argument('--realtime', action='store_true',
+                        help="Pace replay at real time instead of feeding as fast as possible")
+    parser.add_argument('--output', default=None, help="Write results to this JSON file")
+    parser.add_argument('--baseline', default=None, help="Previous JSON results to check for regressions")
+    parser.add_argument('--tolerance', type=float, default=0.15,
+                        help="Allowed relative slowdown before a metric counts as a regression")
+    args = parser.parse_args(argv)
+    keywords = parse_phrases(args.keywords)
+    if set(args.decode) - {"full"} and not keywords:
+        parser.error("--keywords is required for the keywords and both decode modes")
+
+    results = []
+    for model_path in args.model:
+        for wav_path in args.wav:
+            for profile, chunk, vad_mode, decode, cache, endpoint in itertools.product(
+                    args.profile, args.chunk, args.vad, args.decode, args.cache, args.endpoint):
+                # A fresh process per case keeps peak RSS and model caches independent
+                context = multiprocessing.get_context('spawn')
+                with ProcessPoolExecutor(max_workers=1, mp_context=context) as executor:
+                    result = executor.submit(run_case, model_path, wav_path, profile, chunk,
+                                             args.realtime, vad_mode, decode, keywords, cache,
+                                             endpoint).result()
+                results.append(result)
+                print(f"{result['model']} {result['wav']} profile={profile} "
+                      f"chunk={chunk or 'profile'}->{result['final_chunk']} vad={vad_mode} decode={decode} "
+                      f"cache={cache} endpoint={result['endpoint_seconds']:g}s: "
+                      f"RTF {result['real_time_factor']:.3f}, "
+                      f"final p90 {result['final_latency'].get('p90', float('nan')):.3f}s, "
+                      f"partial p90 {result['partial_latency'].get('p90', float('nan')):.3f}s, "
+                      f"CPU {result['cpu_per_audio_second']:.3f}s/s, "
+                      f"peak RSS {result['peak_rss_mb']:.0f} MB")
+
+    report = {
+        "created": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "platform": platform.platform(),
+        "python": platform.python_version(),
+        "cpu_count": os.cpu_count(),
+        "results": results,
+    }
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(report, f, indent=2)
+
+    if args.baseline:
+        with open(args.baseline, encoding='utf-8') as f:
+            regressions = find_regressions(results, json.load(f), args.tolerance)
+        for line in regressions:
+            print(f"REGRESSION {line}")
+        if regressions:
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,457 @@
+"""Live transcription without a user interface.
+
+TranscriptionEngine owns everything between the sound card and finished
+text: device discovery, the loaded model, recognizers (in this process or
+in worker processes), the capture pipelines, and optional refinement,
+keyword spotting, audio history and transcript storage. Results are
+delivered as event dicts, to listeners called on the engine's threads or
+through the async iterator events(), so scripts and services can use it
+without a display:
+
+    engine = TranscriptionEngine("models/vosk-model-small-en-us-0.15")
+    engine.start()
+    async for event in engine.events():
+        if event['type'] == "final":
+            print(event['text'])
+"""
+import os
+import time
+import asyncio
+import itertools
+import threading
+
+from latency import DEFAULT_PROFILE
+from model_cache import model_cache
+from app_paths import data_dir
+from audio_devices import AudioDevices
+from refinement import Refiner
+from metrics import MetricsRegistry
+from transcript_store import segment_from_result
+
+RECOGNIZER_RATE = 16000
+# What the recognizers decode: full transcript, listed keywords only, or both
+DECODE_MODES = ["transcribe", "keywords", "both"]
+# Captured audio kept on disk per source for export and re-transcription
+HISTORY_SECONDS = 600
+
+
+class TranscriptionEngine:
+    """Capture, decode and deliver transcripts; one session at a time.
+
+    Settings (profile, vad_mode, decode_mode, keywords, mic, processes,
+    cache_entries, endpoint_seconds, endpoint_mode, word_times) are read when
+    a session starts. With cache_entries > 0, sentences heard before are taken
+    from a fingerprint cache of that many entries instead of being decoded
+    again. A sentence is finalized once speech pauses for endpoint_seconds
+    (None: the profile's, 0: only when the recognizer decides); word_times=False
+    skips per-word timing for slightly cheaper finals. start() returns at once and the session
+    waits for the model and the audio devices by itself. pause() and
+    resume() keep the streams open and the model loaded.
+
+    Events are dicts with a 'type':
+      final            id, source, text, start, end (wall clock), result, refining, cached
+      partial          source, text
+      refined          id, source, text, start, end, result
+      unrefined        id   (refinement was dropped; the live text stays)
+      keyword          source, phrase, time, conf
+      status           text (short state for a status bar)
+      message          text (informational lines and warnings)
+      state            state: "starting", "running", "paused" or "stopped", previous
+                       (the state before: "paused" when running again after resume())
+      model            path, error, seconds   (a background model load finished)
+      devices          error   (device discovery finished)
+      devices_changed  added, removed
+    """
+
+    def __init__(self, model_path=None, profile=DEFAULT_PROFILE, vad_mode="energy", decode_mode="transcribe",
+                 keywords=(), mic=False, processes=0, history_seconds=HISTORY_SECONDS, cache_entries=0,
+                 endpoint_seconds=None, endpoint_mode="final", word_times=True, store=None, metrics=None, on_event=None):
+        self.model_path = model_path
+        self.profile = profile
+        self.vad_mode = vad_mode
+        self.decode_mode = decode_mode
+        self.keywords = list(keywords)
+        self.mic = mic
+        self.processes = processes
+        self.history_seconds = history_seconds
+        self.cache_entries = cache_entries
+        self.endpoint_seconds = endpoint_seconds
+        self.endpoint_mode = endpoint_mode
+        self.word_times = word_times
+        self.store = store
+        if store is not None:
+            # Failed transcript writes are reported like the other background stages' problems
+            store.on_message = self._message
+        self.metrics = metrics or MetricsRegistry()
+
+        self.state = "stopped"
+        self.model = None
+        self.session_id = None
+        self.transcriber = None
+        self.refiner = None
+        self.recognizer_pool = None
+        self.fingerprint_cache = None
+        # Source name -> AudioHistory, reused by every session
+        self.histories = {}
+        self._listeners = [on_event] if on_event else []
+        self._lock = threading.Lock()
+        self._thread = None
+        self._stop_requested = False
+        self._segment_ids = itertools.count()
+
+        # Discovery runs in the background from the start, so capture can begin as soon as possible
+        self.devices = AudioDevices(
+            on_ready=lambda: self._emit("devices", error=self.devices.error),
+            on_change=lambda added, removed: self._emit("devices_changed", added=added, removed=removed),
+            on_message=self._message,
+        )
+        self.devices.start()
+
+    # Events
+
+    def add_listener(self, callback):
+        """callback(event) runs on an engine thread for every event"""
+        self._listeners.append(callback)
+
+    def remove_listener(self, callback):
+        if callback in self._listeners:
+            self._listeners.remove(callback)
+
+    def _emit(self, kind, **fields):
+        event = dict(fields, type=kind)
+        for listener in list(self._listeners):
+            listener(event)
+
+    def _message(self, text):
+        self._emit("message", text=text)
+
+    def _status(self, text):
+        self._emit("status", text=text)
+
+    def _set_state(self, state):
+        previous, self.state = self.state, state
+        self._emit("state", state=state, previous=previous)
+
+    async def events(self, until_stopped=True):
+        """Async iterator over events from the first iteration on.
+
+        Ends after the session stops (at once if none is running), or never
+        with until_stopped=False.
+        """
+        loop = asyncio.get_running_loop()
+        queue = asyncio.Queue()
+
+        def listener(event):
+            try:
+                loop.call_soon_threadsafe(queue.put_nowait, event)
+            except RuntimeError:
+                pass  # The loop has been closed
+
+        self.add_listener(listener)
+        try:
+            if until_stopped and self.state == "stopped":
+                return
+            while True:
+                event = await queue.get()
+                yield event
+                if until_stopped and event['type'] == "state" and event['state'] == "stopped":
+                    return
+        finally:
+            self.remove_listener(listener)
+
+    # Models
+
+    def load_model(self, path=None):
+        """Start loading a model in the background; a 'model' event follows"""
+        path = path or self.model_path
+        self.model_path = path
+        started = time.monotonic()
+        if model_cache.is_loading(path):
+            return
+        model_cache.load_async(path, lambda model, error: self._emit(
+            "model", path=path, error=error, seconds=time.monotonic() - started))
+
+    def model_loading(self, path=None):
+        return model_cache.is_loading(path or self.model_path)
+
+    def set_refine_model(self, path):
+        """Re-decode finished sentences with a larger model; None turns refinement off"""
+        if self.refiner:
+            self.refiner.stop()
+            self.refiner = None
+        if not path:
+            return
+        # Loaded by the refiner's own low-priority thread; live transcription does not wait for it
+        self.refiner = Refiner(
+            path,
+            busy=lambda: self.transcriber is not None and self.transcriber.busy(),
+            metrics=self.metrics,
+            on_refined=self._on_refined,
+            on_dropped=lambda key, context: self._emit("unrefined", id=key),
+            on_message=self._message,
+        )
+        self.refiner.start()
+
+    # Session control
+
+    def start(self):
+        """Start a session on a background thread; False if one is already running"""
+        with self._lock:
+            if self.state != "stopped":
+                return False
+            if not self.model_path:
+                raise ValueError("No model selected")
+            if self.decode_mode != "transcribe" and not self.keywords:
+                raise ValueError("No keywords to listen for")
+            self._stop_requested = False
+            self._set_state("starting")
+            self._thread = threading.Thread(target=self._run, daemon=True)
+            self._thread.start()
+        return True
+
+    def stop(self):
+        """Finish the session; pending results are still delivered"""
+        self._stop_requested = True
+        if self.transcriber:
+            self.transcriber.stop()
+
+    def pause(self):
+        if self.state != "running" or not self.transcriber:
+            return False
+        self.transcriber.pause()
+        self._set_state("paused")
+        return True
+
+    def resume(self):
+        if self.state != "paused" or not self.transcriber:
+            return False
+        self.transcriber.resume()
+        self._set_state("running")
+        self._status("Resumed")
+        return True
+
+    def wait(self, timeout=None):
+        """Block until the current session has stopped"""
+        if self._thread:
+            self._thread.join(timeout)
+
+    def close(self):
+        self.stop()
+        self.wait(10)
+        self.set_refine_model(None)
+        for history in self.histories.values():
+            history.close()
+        if self.recognizer_pool:
+            self.recognizer_pool.close()
+        if self.fingerprint_cache:
+            self.fingerprint_cache.close()
+        self.devices.close()
+
+    @property
+    def source_count(self):
+        return len(self.transcriber.sources) if self.transcriber else 1
+
+    def _run(self):
+        try:
+            if self._prepare():
+                self.transcribe()
+        except Exception as e:
+            self._message(f"Transcription error: {str(e)}")
+            self._status("Error")
+        finally:
+            self._set_state("stopped")
+
+    def _prepare(self):
+        """Wait for the model and the devices; False if the session cannot start"""
+        try:
+            model = model_cache.get_cached(self.model_path)
+            if model is None:
+                self._message("Loading speech recognition model...")
+                model = model_cache.get(self.model_path)
+        except Exception as e:
+            self._message(f"Error loading model: {str(e)}")
+            self._status("Error")
+            return False
+        # Reuse the cached model; only the recognizers are per session
+        self.model = model
+
+        if not self.devices.ready.is_set():
+            self._message("Waiting for audio devices...")
+            self.devices.ready.wait()
+        if self.devices.error is not None:
+            self._message(f"Error initializing audio: {str(self.devices.error)}")
+            return False
+        if self.devices.selected_index is None:
+            self._message("No audio input device available.")
+            return False
+        return not self._stop_requested
+
+    def transcribe(self):
+        """Run one session on the calling thread until stop()"""
+        from multi_source import MultiSourceTranscriber
+
+        decode_mode = self.decode_mode
+        create_recognizer = self.create_live_recognizer if decode_mode != "keywords" else (lambda: None)
+        create_spotter = self.create_spotter if decode_mode != "transcribe" else None
+        self.session_id = time.strftime("%Y%m%d-%H%M%S")
+
+        # No hot-plug re-initialisation of PortAudio while its streams are open
+        self.devices.begin_use()
+        try:
+            if self.processes > 0 and decode_mode != "keywords":
+                self.open_recognizer_pool()
+            sources = self.capture_sources()
+            self.open_histories([name for name, _ in sources])
+            use_cache = decode_mode != "keywords" and self.cache_entries > 0
+            if use_cache:
+                self.open_fingerprint_cache()
+            self.transcriber = MultiSourceTranscriber(
+                self.devices.audio, sources, create_recognizer,
+                rate=RECOGNIZER_RATE,
+                profile=self.profile,
+                vad_mode=self.vad_mode,
+                metrics=self.metrics,
+                keep_audio=self.refiner is not None,
+                histories=self.histories,
+                create_spotter=create_spotter,
+                fingerprint_cache=self.fingerprint_cache if use_cache else None,
+                endpoint_seconds=self.endpoint_seconds,
+                endpoint_mode=self.endpoint_mode,
+                on_final=self._on_final,
+                on_partial=lambda source, text: self._emit("partial", source=source, text=text),
+                on_status=self._status,
+                on_message=self._message,
+            )
+            if self._stop_requested:
+                return
+            self._set_state("running")
+            self._status("Transcribing...")
+            self.transcriber.run()
+            if self.refiner:
+                self._message(self.refiner.stats_line())
+        finally:
+            if self.recognizer_pool:
+                self.recognizer_pool.close_recognizers()
+                if self.recognizer_pool.restarts:
+                    self._message(f"Recognizer processes restarted {self.recognizer_pool.restarts} time(s)")
+            self.devices.end_use()
+
+    # Building blocks of a session
+
+    def create_recognizer(self):
+        """In-process recognizer on the loaded model"""
+        from vosk import KaldiRecognizer
+        recognizer = KaldiRecognizer(self.model, RECOGNIZER_RATE)
+        recognizer.SetWords(True)
+        return recognizer
+
+    def create_live_recognizer(self):
+        """Recognizer for a capture source; hosted by a worker process when configured"""
+        if self.recognizer_pool:
+            recognizer = self.recognizer_pool.create_recognizer()
+        else:
+            recognizer = self.create_recognizer()
+        recognizer.SetWords(self.word_times)
+        return recognizer
+
+    def open_recognizer_pool(self):
+        """Start (or keep) the worker processes for the selected model; blocks while they load it"""
+        from process_recognizer import RecognizerProcessPool
+        pool = self.recognizer_pool
+        if pool and pool.model_path == self.model_path and len(pool.workers) == self.processes:
+            return
+        if pool:
+            pool.close()
+        self.recognizer_pool = None
+        self._message(f"Starting {self.processes} recognizer process(es)...")
+        self.recognizer_pool = RecognizerProcessPool(self.model_path, self.processes, RECOGNIZER_RATE,
+                                                     on_message=self._message)
+
+    def create_spotter(self, source):
+        from keywords import KeywordSpotter
+        return KeywordSpotter(self.model, self.keywords, RECOGNIZER_RATE,
+                              on_alert=lambda alert: self._on_keyword(source, alert))
+
+    def capture_sources(self):
+        """(name, device index) pairs to transcribe; all share the loaded model"""
+        system_index = self.devices.selected_index
+        sources = [("System", system_index)]
+        if self.mic:
+            default_input = self.devices.default_input or self.devices.audio.get_default_input_device_info()
+            if default_input['index'] != system_index:
+                sources.append(("Mic", default_input['index']))
+        return sources
+
+    def open_histories(self, names):
+        """Create the memory-mapped history file of each source on first use"""
+        if not self.history_seconds:
+            return
+        from audio_history import AudioHistory
+        # Replaced rather than updated, since readers may be iterating it on another thread
+        histories = dict(self.histories)
+        for name in names:
+            if name in histories:
+                continue
+            try:
+                histories[name] = AudioHistory(os.path.join(data_dir("history"), f"{name.lower()}.pcm"),
+                                               self.history_seconds * RECOGNIZER_RATE, RECOGNIZER_RATE)
+            except (OSError, ValueError) as e:
+                self._message(f"Audio history disabled for {name}: {str(e)}")
+        self.histories = histories
+
+    def open_fingerprint_cache(self):
+        """Load the transcript cache on first use; it stays open across sessions"""
+        if self.cache_entries <= 0:
+            return
+        if self.fingerprint_cache:
+            self.fingerprint_cache.max_entries = self.cache_entries
+            return
+        from fingerprint_cache import FingerprintCache
+        try:
+            self.fingerprint_cache = FingerprintCache(max_entries=self.cache_entries, rate=RECOGNIZER_RATE,
+                                                      metrics=self.metrics, on_message=self._message)
+        except Exception as e:
+            self._message(f"Fingerprint cache disabled: {str(e)}")
+            return
+        self.fingerprint_cache.start()
+        self._message(f"Fingerprint cache: {len(self.fingerprint_cache)} sentence(s) remembered")
+
+    def retranscribe(self, samples, time_base=0.0):
+        """Decode audio (e.g. from a history) again with a fresh recognizer; blocks, safe while capturing.
+
+        Result times are time_base plus seconds into samples.
+        """
+        from audio_history import transcribe_samples
+        if self.model is None:
+            raise RuntimeError("Start transcription once to load the model first.")
+        return transcribe_samples(self.create_recognizer(), samples, RECOGNIZER_RATE, offset=time_base)
+
+    # Results
+
+    def _on_final(self, source, result, time_base):
+        """Called on a decoding thread for every finalized sentence, in start-time order"""
+        audio = result.pop('audio', None)
+        cached = result.pop('cached', False)
+        segment_id = f"segment{next(self._segment_ids)}"
+        refining = self.refiner is not None and audio is not None
+        self._emit("final", id=segment_id, source=source, text=result['text'],
+                   start=time_base + result['start'], end=time_base + result['end'], result=result,
+                   refining=refining, cached=cached)
+        if self.store:
+            self.store.append(segment_from_result(result, time_base, self.session_id, source=source.lower()))
+        if refining:
+            self.refiner.submit(segment_id, audio, (source, time_base, self.session_id, result['start']))
+
+    def _on_refined(self, key, result, context):
+        source, time_base, session, live_start = context
+        if self.store:
+            self.store.replace(segment_from_result(result, time_base, session, source=source.lower()),
+                               time_base + live_start)
+        self._emit("refined", id=key, source=source, text=result['text'], start=time_base + result['start'],
+                   end=time_base + result['end'], result=result)
+
+    def _on_keyword(self, source, alert):
+        self.metrics.child(source=source).counter("keyword_alerts_total", "Keywords spotted").inc()
+        time_base = self.transcriber.time_base(source) if self.transcriber else None
+        self._emit("keyword", source=source, phrase=alert['phrase'],
+                   time=(time_base or time.time()) + alert['start'], conf=alert['conf'])
@@ -0,0 +1,590 @@
+"""Transcript cache for audio that has been heard before.
+
+System audio repeats a lot: notification sounds, ad spots, intro jingles,
+re-watched videos. Each finished sentence is stored with a compact spectral
+fingerprint of the audio it was decoded from. When a new sentence starts,
+its first second or so is held back and looked up; if it matches a stored
+sentence, the rest is followed frame by frame and the stored transcript is
+emitted without calling AcceptWaveform at all. If the audio diverges, the
+held samples go to the recognizer as usual.
+
+Fingerprints follow Haitsma and Kalker: every 16 ms, the energy of 33
+log-spaced bands between 300 and 3000 Hz is computed over a 256 ms frame
+(all frames in one batched FFT), and each of the 32 bits records whether
+the energy difference between two neighbouring bands rose or fell since the
+previous frame. The long, heavily overlapping frames make the bits barely
+depend on where a repeat happens to fall on the frame grid. Matching counts
+differing bits, so level changes and mild noise do not matter.
+
+Entries live in an SQLite file with least-recently-used eviction.
+
+Usage:
+    python fingerprint_cache.py stats
+    python fingerprint_cache.py clear
+"""
+import os
+import sys
+import json
+import time
+import queue
+import hashlib
+import sqlite3
+import argparse
+import threading
+from collections import OrderedDict
+import numpy as np
+
+from app_paths import data_dir
+from metrics import MetricsRegistry
+from transcript_store import RETRY_SECONDS, MAX_RETRY_SECONDS, MAX_UNSAVED, SHUTDOWN_ATTEMPTS
+
+FRAME_SECONDS = 0.256
+HOP_SECONDS = 0.016
+BANDS = 33
+LOW_HZ = 300
+HIGH_HZ = 3000
+# Share of differing bits below which two fingerprints are the same audio
+BER_THRESHOLD = 0.25
+# Speech held back from the recognizer while a new sentence is looked up
+PROBE_SECONDS = 1.0
+# Shortest overlap accepted as a match
+MIN_MATCH_SECONDS = 0.5
+# How far the start of a repeat may be from the start of the stored sentence
+MAX_OFFSET_SECONDS = 0.3
+# Followed audio is re-checked against the stored fingerprint in blocks of this length
+VERIFY_SECONDS = 1.0
+# Sentences outside these lengths are not stored
+MIN_STORE_SECONDS = 0.5
+MAX_STORE_SECONDS = 30.0
+MAX_ENTRIES = 2000
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS entries (
+    key TEXT PRIMARY KEY,
+    fingerprint BLOB NOT NULL,
+    samples INTEGER NOT NULL,
+    rate INTEGER NOT NULL,
+    result TEXT NOT NULL,
+    last_used REAL NOT NULL,
+    hits INTEGER NOT NULL DEFAULT 0
+);
+CREATE INDEX IF NOT EXISTS entries_last_used ON entries(last_used);
+"""
+
+_band_matrices = {}
+
+
+def default_cache_path():
+    return os.path.join(data_dir(), "fingerprints.db")
+
+
+def _frame_sizes(rate):
+    return int(rate * FRAME_SECONDS), int(rate * HOP_SECONDS)
+
+
+def _band_matrix(rate):
+    """(FFT bins x BANDS) 0/1 matrix that sums power spectra into the bands"""
+    matrix = _band_matrices.get(rate)
+    if matrix is None:
+        frame, _ = _frame_sizes(rate)
+        freqs = np.fft.rfftfreq(frame, 1 / rate)
+        edges = np.geomspace(LOW_HZ, min(HIGH_HZ, rate / 2), BANDS + 1)
+        matrix = ((freqs[:, None] >= edges[None, :-1]) & (freqs[:, None] < edges[None, 1:])).astype(np.float32)
+        _band_matrices[rate] = matrix
+    return matrix
+
+
+def frame_count(n_samples, rate=16000):
+    frame, hop = _frame_sizes(rate)
+    return 0 if n_samples < frame else (n_samples - frame) // hop + 1
+
+
+def band_energies(samples, rate=16000):
+    """Band energies of every full frame, (frames x BANDS), in one batched FFT"""
+    frame, hop = _frame_sizes(rate)
+    n = frame_count(len(samples), rate)
+    if n == 0:
+        return np.zeros((0, BANDS), dtype=np.float32)
+    frames = np.lib.stride_tricks.sliding_window_view(samples, frame)[::hop][:n]
+    spectrum = np.fft.rfft(frames.astype(np.float32) * np.hanning(frame).astype(np.float32), axis=1)
+    power = spectrum.real ** 2 + spectrum.imag ** 2
+    return power @ _band_matrix(rate)
+
+
+def fingerprint_from_energies(energies):
+    """32-bit sub-fingerprint per frame after the first, as uint32"""
+    if len(energies) < 2:
+        return np.zeros(0, dtype=np.uint32)
+    band_diff = energies[:, :-1] - energies[:, 1:]
+    bits = (band_diff[1:] - band_diff[:-1]) > 0
+    return np.packbits(bits, axis=1).view('>u4').ravel().astype(np.uint32)
+
+
+def fingerprint(samples, rate=16000):
+    return fingerprint_from_energies(band_energies(samples, rate))
+
+
+def bit_error_rate(a, b):
+    """Share of differing bits between two equally long fingerprints"""
+    if not len(a):
+        return 1.0
+    return np.unpackbits((a ^ b).view(np.uint8)).sum() / (32 * len(a))
+
+
+class CacheEntry:
+    def __init__(self, key, fingerprint, samples, result, last_used, hits=0):
+        self.key = key
+        self.fingerprint = fingerprint
+        self.samples = samples
+        self.result = result
+        self.last_used = last_used
+        self.hits = hits
+
+
+class FingerprintCache:
+    """Stored sentences keyed by fingerprint, shared by all pipelines.
+
+    Everything is loaded into memory at start; only the first frames of each
+    entry are indexed, since a repeat is only looked up when a sentence
+    starts. Writes go through a background thread like TranscriptStore's,
+    and failed writes are retried and reported the same way.
+    """
+
+    def __init__(self, path=None, max_entries=MAX_ENTRIES, rate=16000, metrics=None, on_message=None):
+        self.path = path or default_cache_path()
+        self.max_entries = max_entries
+        self.rate = rate
+        _, hop = _frame_sizes(rate)
+        self.frames_per_second = rate / hop
+        self.max_offset = int(MAX_OFFSET_SECONDS * self.frames_per_second)
+        self.min_match = int(MIN_MATCH_SECONDS * self.frames_per_second)
+        self._index_frames = int(PROBE_SECONDS * self.frames_per_second) + self.max_offset
+        self._entries = OrderedDict()   # key -> CacheEntry, least recently used first
+        self._index = {}                # sub-fingerprint -> [(key, frame)]
+        self._lock = threading.Lock()
+        self._queue = queue.Queue()
+        self._writer = None
+        # on_message(text) reports write failures and recoveries from the writer thread
+        self.on_message = on_message or (lambda text: None)
+        self.lost = 0
+        self.error = None
+
+        metrics = metrics or MetricsRegistry()
+        self._entries_gauge = metrics.gauge("fingerprint_cache_entries", "Sentences in the fingerprint cache")
+        self._evicted_counter = metrics.counter("fingerprint_cache_evictions_total", "Least recently used entries dropped")
+
+        conn = self._connect()
+        try:
+            conn.executescript(SCHEMA)
+            rows = conn.execute("SELECT key, fingerprint, samples, result, last_used, hits FROM entries "
+                                "WHERE rate = ? ORDER BY last_used", (rate,)).fetchall()
+        finally:
+            conn.close()
+        for key, blob, samples, result, last_used, hits in rows:
+            self._insert(CacheEntry(key, np.frombuffer(blob, dtype=np.uint32), samples, json.loads(result),
+                                    last_used, hits))
+        for key in self._evict():
+            self._queue.put(("DELETE FROM entries WHERE key = ?", (key,)))
+
+    def _connect(self):
+        conn = sqlite3.connect(self.path, timeout=10)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        return conn
+
+    def __len__(self):
+        return len(self._entries)
+
+    def start(self):
+        if self._writer is None:
+            self._writer = threading.Thread(target=self._write_loop, daemon=True)
+            self._writer.start()
+
+    def close(self):
+        """Write what is queued and stop the writer"""
+        if self._writer is not None:
+            self._queue.put(None)
+            self._writer.join()
+            self._writer = None
+
+    def _insert(self, entry):
+        self._entries[entry.key] = entry
+        for frame, value in enumerate(entry.fingerprint[:self._index_frames].tolist()):
+            self._index.setdefault(value, []).append((entry.key, frame))
+        self._entries_gauge.set(len(self._entries))
+
+    def _remove(self, key):
+        entry = self._entries.pop(key)
+        for value in set(entry.fingerprint[:self._index_frames].tolist()):
+            postings = [p for p in self._index.get(value, ()) if p[0] != key]
+            if postings:
+                self._index[value] = postings
+            else:
+                self._index.pop(value, None)
+
+    def _evict(self):
+        evicted = []
+        while len(self._entries) > self.max_entries:
+            key = next(iter(self._entries))
+            self._remove(key)
+            evicted.append(key)
+        if evicted:
+            self._evicted_counter.inc(len(evicted))
+            self._entries_gauge.set(len(self._entries))
+        return evicted
+
+    def lookup(self, fp):
+        """Best stored entry whose start matches fp: (entry, frame offset) or None.
+
+        The offset is the stored frame aligned with fp's first frame, within
+        MAX_OFFSET_SECONDS either way.
+        """
+        with self._lock:
+            votes = {}
+            for i, value in enumerate(fp[:self._index_frames].tolist()):
+                for key, j in self._index.get(value, ()):
+                    offset = j - i
+                    if -self.max_offset <= offset <= self.max_offset:
+                        votes[key, offset] = votes.get((key, offset), 0) + 1
+            best = None
+            # Exact sub-fingerprint hits only pick candidates; the bit error rate decides
+            for (key, offset), _ in sorted(votes.items(), key=lambda v: -v[1])[:5]:
+                entry = self._entries[key]
+                ber = self.compare(fp, entry, offset)
+                if ber <= BER_THRESHOLD and (best is None or ber < best[2]):
+                    best = (entry, offset, ber)
+        return best[:2] if best else None
+
+    def compare(self, fp, entry, offset, first=0):
+        """Bit error rate of fp[first:] against the entry shifted by offset frames"""
+        start = max(first, -offset)
+        end = min(len(fp), len(entry.fingerprint) - offset)
+        if end - start < min(self.min_match, len(fp) - first):
+            return 1.0
+        return bit_error_rate(fp[start:end], entry.fingerprint[start + offset:end + offset])
+
+    def add(self, fp, samples, result):
+        """Store a decoded sentence; result times are seconds from the start of its audio"""
+        key = hashlib.sha1(fp.tobytes()).hexdigest()
+        now = time.time()
+        with self._lock:
+            if key in self._entries:
+                return
+            self._insert(CacheEntry(key, fp, samples, result, now))
+            evicted = self._evict()
+        self._queue.put(("INSERT OR REPLACE INTO entries (key, fingerprint, samples, rate, result, last_used) "
+                         "VALUES (?, ?, ?, ?, ?, ?)",
+                         (key, fp.tobytes(), samples, self.rate, json.dumps(result), now)))
+        for key in evicted:
+            self._queue.put(("DELETE FROM entries WHERE key = ?", (key,)))
+
+    def used(self, entry):
+        """Record a hit, making the entry the most recently used"""
+        now = time.time()
+        with self._lock:
+            if entry.key in self._entries:
+                self._entries.move_to_end(entry.key)
+            entry.last_used = now
+            entry.hits += 1
+        self._queue.put(("UPDATE entries SET last_used = ?, hits = hits + 1 WHERE key = ?", (now, entry.key)))
+
+    def _write_loop(self):
+        conn = self._connect()
+        unsaved = []   # statements of failed writes, retried ahead of newer ones
+        retry = RETRY_SECONDS
+        running = True
+        try:
+            while running:
+                try:
+                    batch = [self._queue.get(timeout=retry if unsaved else None)]
+                except queue.Empty:
+                    batch = []
+                while batch:
+                    try:
+                        batch.append(self._queue.get_nowait())
+                    except queue.Empty:
+                        break
+                if None in batch:
+                    running = False
+                    batch = [op for op in batch if op is not None]
+                batch = unsaved + batch
+                if not batch:
+                    continue
+                try:
+                    self._write_batch(conn, batch)
+                except sqlite3.Error as e:
+                    unsaved = self._failed(conn, batch, e, first=not unsaved)
+                    retry = min(retry * 2, MAX_RETRY_SECONDS)
+                    continue
+                if unsaved:
+                    self.on_message(f"Fingerprint cache: saved {len(unsaved)} delayed change(s)")
+                    self.error = None
+                unsaved = []
+                retry = RETRY_SECONDS
+            for _ in range(SHUTDOWN_ATTEMPTS):
+                if not unsaved:
+                    break
+                time.sleep(RETRY_SECONDS)
+                try:
+                    self._write_batch(conn, unsaved)
+                    unsaved = []
+                except sqlite3.Error as e:
+                    self.error = e
+            if unsaved:
+                self.lost += len(unsaved)
+                self.on_message(f"Fingerprint cache: {len(unsaved)} change(s) could not be saved ({str(self.error)})")
+        finally:
+            conn.close()
+
+    def _failed(self, conn, batch, error, first):
+        """Statements of a failed batch that are worth retrying"""
+        self.error = error
+        if not isinstance(error, sqlite3.OperationalError):
+            # Not a passing condition like a lock or a full disk: apply what can be applied one by one
+            keep = []
+            for op in batch:
+                try:
+                    self._write_batch(conn, [op])
+                except sqlite3.OperationalError:
+                    keep.append(op)
+                except sqlite3.Error as e:
+                    self.lost += 1
+                    self.on_message(f"Fingerprint cache: dropped a change that cannot be saved ({str(e)})")
+            batch = keep
+        if len(batch) > MAX_UNSAVED:
+            self.lost += len(batch) - MAX_UNSAVED
+            self.on_message(f"Fingerprint cache: gave up on {len(batch) - MAX_UNSAVED} unsaved change(s)")
+            batch = batch[-MAX_UNSAVED:]
+        if first and batch:
+            self.on_message(f"Fingerprint cache: write failed ({str(error)}); keeping {len(batch)} change(s) "
+                            f"and retrying")
+        return batch
+
+    def _write_batch(self, conn, batch):
+        with conn:
+            for sql, params in batch:
+                conn.execute(sql, params)
+
+
+class SegmentMatcher:
+    """Per-pipeline state that decides, sentence by sentence, whether to decode or reuse.
+
+    Sits between the VAD and the recognizer and sees every fed sample.
+    accept() and resolve() return actions in order: ("decode", samples) for
+    audio the recognizer must see and ("hit", result) for a reused sentence,
+    whose word times are in fed seconds like the recognizer's own.
+
+      probing    the start of a new sentence is held until PROBE_SECONDS are in
+      following  the held audio matches a stored sentence; still held and checked
+      decoding   no match; everything goes to the recognizer until its next final
+    """
+
+    def __init__(self, cache, rate=16000, metrics=None):
+        self.cache = cache
+        self.rate = rate
+        self._frame, self._hop = _frame_sizes(rate)
+        self.probe_samples = int(PROBE_SECONDS * rate)
+        self.end_tolerance = int(MAX_OFFSET_SECONDS * rate)
+        self.verify_frames = int(VERIFY_SECONDS * cache.frames_per_second)
+        # Fed samples seen, and fed samples the recognizer never got because they were reused
+        self.position = 0
+        self.skipped_samples = 0
+        self.lookups = 0
+        self.hits = 0
+        metrics = metrics or MetricsRegistry()
+        self._lookup_timer = metrics.histogram("fingerprint_seconds", "Fingerprinting and cache lookup per chunk")
+        self._lookup_counter = metrics.counter("fingerprint_lookups_total", "Sentences looked up in the cache")
+        self._hit_counter = metrics.counter("fingerprint_hits_total", "Sentences reused from the cache")
+        self._skipped_counter = metrics.counter("fingerprint_skipped_seconds_total", "Audio not decoded thanks to hits")
+        self._hit_rate_gauge = metrics.gauge("fingerprint_hit_ratio", "Share of looked-up sentences reused")
+        self._new_segment()
+
+    @property
+    def skipped_seconds(self):
+        return self.skipped_samples / self.rate
+
+    @property
+    def hit_rate(self):
+        return self.hits / self.lookups if self.lookups else 0.0
+
+    def _new_segment(self):
+        self.state = "probing"
+        self.segment_start = self.position
+        self._held = []
+        self._held_samples = 0
+        self._segment_samples = 0
+        self._tail = np.zeros(0, dtype=np.int16)
+        self._energies = []
+        self._entry = None
+        self._offset = 0
+        self._length = 0
+        self._verified = 0
+
+    def _analyse(self, samples):
+        """Band energies of the frames completed by samples"""
+        self._segment_samples += len(samples)
+        if self._segment_samples > MAX_STORE_SECONDS * self.rate and self.state == "decoding":
+            return  # Too long to store; no need to fingerprint it
+        data = np.concatenate((self._tail, samples)) if len(self._tail) else samples
+        n = frame_count(len(data), self.rate)
+        if n:
+            self._energies.append(band_energies(data[:(n - 1) * self._hop + self._frame], self.rate))
+            data = data[n * self._hop:]
+        self._tail = data.copy()
+
+    def _fingerprint(self):
+        if len(self._energies) > 1:
+            self._energies = [np.concatenate(self._energies)]
+        return fingerprint_from_energies(self._energies[0]) if self._energies else np.zeros(0, dtype=np.uint32)
+
+    def _decode_held(self, actions):
+        self.state = "decoding"
+        if self._held:
+            actions.append(("decode", np.concatenate(self._held)))
+        self._held = []
+        self._held_samples = 0
+
+    def _hit(self, actions):
+        entry = self._entry
+        start = self.segment_start / self.rate - self._offset / self.cache.frames_per_second
+        words = [dict(w, start=max(0.0, w['start'] + start), end=max(0.0, w['end'] + start))
+                 for w in entry.result.get('result', [])]
+        actions.append(("hit", {'text': entry.result['text'], 'result': words, 'cached': True}))
+        self.cache.used(entry)
+        self.hits += 1
+        self._hit_counter.inc()
+        self._hit_rate_gauge.set(self.hit_rate)
+        self.skipped_samples += self._held_samples
+        self._skipped_counter.inc(self._held_samples / self.rate)
+        self._new_segment()
+
+    def _lookup(self):
+        self.lookups += 1
+        self._lookup_counter.inc()
+        self._hit_rate_gauge.set(self.hit_rate)
+        return self.cache.lookup(self._fingerprint())
+
+    def _probe(self, actions):
+        """Look the held start of the sentence up; follow a match or decode"""
+        match = self._lookup()
+        if match is None:
+            self._decode_held(actions)
+            return
+        self._entry, self._offset = match
+        self._length = self._entry.samples - self._offset * self._hop
+        self.state = "following"
+
+    def _still_matching(self, final=False):
+        fp = self._fingerprint()
+        if len(fp) - self._verified < (1 if final else self.verify_frames):
+            return True
+        matching = self.cache.compare(fp, self._entry, self._offset, self._verified) <= BER_THRESHOLD
+        self._verified = len(fp)
+        return matching
+
+    def accept(self, samples):
+        started = time.perf_counter()
+        actions = []
+        while len(samples):
+            if self.state == "decoding":
+                self.position += len(samples)
+                self._analyse(samples)
+                actions.append(("decode", samples))
+                break
+            # Held audio stops exactly at the end of a followed sentence; the rest starts the next one
+            take = len(samples) if self.state == "probing" else max(1, self._length - self._held_samples)
+            part, samples = samples[:take], samples[take:]
+            self.position += len(part)
+            self._held.append(part.copy())
+            self._held_samples += len(part)
+            self._analyse(part)
+            if self.state == "probing" and self._held_samples >= self.probe_samples:
+                self._probe(actions)
+            if self.state == "following":
+                if self._held_samples >= self._length:
+                    self._resolve_following(actions)
+                elif not self._still_matching():
+                    self._decode_held(actions)
+        self._lookup_timer.observe(time.perf_counter() - started)
+        return actions
+
+    def _resolve_following(self, actions):
+        if self._held_samples >= self._length - self.end_tolerance and self._still_matching(final=True):
+            self._hit(actions)
+        else:
+            self._decode_held(actions)
+
+    def resolve(self):
+        """Decide on held audio at once, e.g. when speech pauses or the session ends"""
+        actions = []
+        if self.state == "probing" and self._held_samples:
+            match = None
+            if self._held_samples >= self.cache.min_match * self._hop:
+                match = self._lookup()
+            if match is None:
+                self._decode_held(actions)
+            else:
+                # A short sentence heard whole, e.g. a notification
+                self._entry, self._offset = match
+                self._length = self._entry.samples - self._offset * self._hop
+                self._resolve_following(actions)
+        elif self.state == "following":
+            self._resolve_following(actions)
+        return actions
+
+    def finish_segment(self, result):
+        """Called with every decoded final: moves its times onto the fed clock and stores it.
+
+        The recognizer never saw reused audio, so its clock is behind by
+        skipped_seconds.
+        """
+        if self.skipped_samples:
+            for word in result.get('result', []):
+                word['start'] += self.skipped_seconds
+                word['end'] += self.skipped_seconds
+        seconds = self._segment_samples / self.rate
+        if (self.state == "decoding" and result.get('text', '').strip()
+                and MIN_STORE_SECONDS <= seconds <= MAX_STORE_SECONDS):
+            start = self.segment_start / self.rate
+            words = [dict(w, start=max(0.0, w['start'] - start), end=max(0.0, w['end'] - start))
+                     for w in result.get('result', [])]
+            self.cache.add(self._fingerprint(), self._segment_samples, {'text': result['text'], 'result': words})
+        if self.state == "decoding":
+            self._new_segment()
+
+    def summary(self):
+        return (f"Fingerprint cache: reused {self.hits} of {self.lookups} sentence(s) looked up "
+                f"({self.hit_rate:.0%}), skipped {self.skipped_seconds:.1f}s of decoding")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Inspect or clear the transcript fingerprint cache")
+    parser.add_argument("command", choices=["stats", "clear"])
+    parser.add_argument("--db", help="Cache file (default: per-user data directory)")
+    args = parser.parse_args()
+
+    path = args.db or default_cache_path()
+    if not os.path.exists(path):
+        print("No fingerprint cache yet.")
+        return 0
+    conn = sqlite3.connect(path)
+    try:
+        conn.executescript(SCHEMA)
+        if args.command == "clear":
+            with conn:
+                conn.execute("DELETE FROM entries")
+            print("Fingerprint cache cleared.")
+            return 0
+        count, samples, hits = conn.execute(
+            "SELECT COUNT(*), COALESCE(SUM(samples * 1.0 / rate), 0), COALESCE(SUM(hits), 0) FROM entries").fetchone()
+        print(f"{count} sentence(s), {samples:.0f}s of audio, reused {hits} time(s)")
+        for result, hits in conn.execute("SELECT result, hits FROM entries WHERE hits > 0 "
+                                         "ORDER BY hits DESC LIMIT 10"):
+            print(f"{hits:5d}  {json.loads(result)['text']}")
+    finally:
+        conn.close()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,86 @@
+"""Keyword spotting with a grammar-restricted recognizer.
+
+A KaldiRecognizer built with a grammar only considers the listed phrases
+(plus "[unk]" for everything else), which makes decoding much cheaper than
+open-vocabulary recognition. KeywordSpotter is fed the same speech as the
+live recognizer, shares its model and reports each phrase it hears as an
+alert with stream times and a confidence score.
+"""
+import re
+import json
+import time
+
+
+def parse_phrases(text):
+    """Phrases from comma- or newline-separated text, lower-cased and de-duplicated"""
+    phrases = []
+    for part in re.split(r"[,\n]", text):
+        phrase = " ".join(part.lower().split())
+        if phrase and phrase not in phrases:
+            phrases.append(phrase)
+    return phrases
+
+
+def grammar_json(phrases):
+    return json.dumps(list(phrases) + ["[unk]"])
+
+
+def find_phrases(words, phrases, min_confidence=0.0):
+    """Alerts for every phrase found as consecutive words of a result.
+
+    Confidence is the mean of the matched words' confidences.
+    """
+    tokens = [w['word'].lower() for w in words]
+    alerts = []
+    for phrase in phrases:
+        parts = phrase.split()
+        n = len(parts)
+        for i in range(len(tokens) - n + 1):
+            if tokens[i:i + n] != parts:
+                continue
+            matched = words[i:i + n]
+            confidence = sum(w.get('conf', 1.0) for w in matched) / n
+            if confidence >= min_confidence:
+                alerts.append({'phrase': phrase, 'start': matched[0]['start'], 'end': matched[-1]['end'],
+                               'conf': confidence})
+    return sorted(alerts, key=lambda a: a['start'])
+
+
+class KeywordSpotter:
+    """Grammar-restricted recognizer that turns spoken phrases into alerts.
+
+    accept() takes the same samples as TranscriptionPipeline.accept() and
+    the pipeline's FedTimeline, so alert times are stream seconds like the
+    transcript's. on_alert(alert) runs on the decoding thread with
+    {'phrase', 'start', 'end', 'conf'}.
+    """
+
+    def __init__(self, model, phrases, rate=16000, min_confidence=0.5, on_alert=None):
+        from vosk import KaldiRecognizer
+
+        if not phrases:
+            raise ValueError("No keywords to spot")
+        self.phrases = list(phrases)
+        self.min_confidence = min_confidence
+        self.on_alert = on_alert or (lambda alert: None)
+        self.recognizer = KaldiRecognizer(model, rate, grammar_json(self.phrases))
+        self.recognizer.SetWords(True)
+        self.alerts = 0
+        self.decode_seconds = 0.0
+
+    def accept(self, samples, timeline):
+        start = time.perf_counter()
+        accepted = self.recognizer.AcceptWaveform(samples.tobytes())
+        self.decode_seconds += time.perf_counter() - start
+        if accepted:
+            self._emit(json.loads(self.recognizer.Result()), timeline)
+
+    def flush(self, timeline):
+        self._emit(json.loads(self.recognizer.FinalResult()), timeline)
+
+    def _emit(self, result, timeline):
+        for alert in find_phrases(result.get('result', []), self.phrases, self.min_confidence):
+            alert['start'] = timeline.to_stream_seconds(alert['start'])
+            alert['end'] = timeline.to_stream_seconds(alert['end'])
+            self.alerts += 1
+            self.on_alert(alert)
@@ -0,0 +1,73 @@
+import collections
+
+# chunk_ms:            audio handed to the recognizer per AcceptWaveform call
+# partial_interval_ms: minimum time between PartialResult() polls
+# buffer_seconds:      capture ring buffer size
+# auto:                let ChunkTuner adjust the chunk size at runtime
+# endpoint_ms:         pause after which the sentence is finalized without waiting for more speech
+LatencyProfile = collections.namedtuple(
+    "LatencyProfile", "name chunk_ms partial_interval_ms buffer_seconds auto endpoint_ms")
+
+LATENCY_PROFILES = {
+    "low-latency": LatencyProfile("low-latency", 100, 100, 5, False, 500),
+    "balanced": LatencyProfile("balanced", 250, 250, 10, False, 800),
+    "high-throughput": LatencyProfile("high-throughput", 500, 1000, 20, False, 1200),
+    "auto": LatencyProfile("auto", 250, 250, 20, True, 800),
+}
+
+DEFAULT_PROFILE = "balanced"
+
+
+def get_profile(name):
+    try:
+        return LATENCY_PROFILES[name]
+    except KeyError:
+        raise ValueError(f"Unknown latency profile '{name}', expected one of: {', '.join(LATENCY_PROFILES)}")
+
+
+class ChunkTuner:
+    """Adjusts the decode chunk size from measured decode time versus audio time.
+
+    Every AcceptWaveform/PartialResult round trip has a fixed cost, so when
+    decoding takes more than high_load of real time (or the ring buffer starts
+    filling up) the chunk is doubled to amortize it. When there is plenty of
+    headroom the chunk is halved again for snappier partials. Changes are at
+    least `window` decoded chunks apart to avoid oscillating.
+    """
+
+    def __init__(self, rate, chunk, min_ms=100, max_ms=1000, window=8,
+                 high_load=0.8, low_load=0.35, smoothing=0.2):
+        self.rate = rate
+        self.min_chunk = int(rate * min_ms / 1000)
+        self.max_chunk = int(rate * max_ms / 1000)
+        self.chunk = min(max(chunk, self.min_chunk), self.max_chunk)
+        self.window = window
+        self.high_load = high_load
+        self.low_load = low_load
+        self.smoothing = smoothing
+        self.load = None
+        self.changes = 0
+        self._since_change = 0
+
+    def record(self, audio_samples, decode_seconds, buffer_fill):
+        """Feed one decoded chunk's timing; returns the chunk size to use next"""
+        sample_load = decode_seconds / (audio_samples / self.rate)
+        if self.load is None:
+            self.load = sample_load
+        else:
+            self.load += (sample_load - self.load) * self.smoothing
+
+        self._since_change += 1
+        if self._since_change < self.window:
+            return self.chunk
+
+        if (self.load > self.high_load or buffer_fill > 0.5) and self.chunk < self.max_chunk:
+            self._set_chunk(min(self.chunk * 2, self.max_chunk))
+        elif self.load < self.low_load and buffer_fill < 0.1 and self.chunk > self.min_chunk:
+            self._set_chunk(max(self.chunk // 2, self.min_chunk))
+        return self.chunk
+
+    def _set_chunk(self, chunk):
+        self.chunk = chunk
+        self.changes += 1
+        self._since_change = 0
@@ -0,0 +1,174 @@
+"""Load test for server.py: many concurrent WebSocket clients replaying WAV files.
+
+Each client streams a fixture in --block-ms messages, paced at real time or
+as fast as the server accepts them, and records when every final result
+arrives relative to when the audio it covers was sent.
+
+Usage:
+    python loadtest.py --wav fixtures/meeting.wav --clients 16 --realtime
+    python loadtest.py --url ws://10.0.0.5:2700/ --wav a.wav --wav b.wav --clients 32 --output load.json
+"""
+import sys
+import json
+import time
+import bisect
+import asyncio
+import argparse
+import itertools
+from urllib.parse import urlsplit
+
+from batch_transcribe import read_wav_mono
+from benchmark import percentiles
+from server import (OP_BINARY, OP_TEXT, OP_CLOSE, read_http_head, read_message, write_frame,
+                    websocket_accept)
+
+
+class Rejected(Exception):
+    pass
+
+
+async def connect(url, rate):
+    parts = urlsplit(url)
+    reader, writer = await asyncio.open_connection(parts.hostname, parts.port or 80)
+    key = "dGhlIHNhbXBsZSBub25jZQ=="
+    path = f"{parts.path or '/'}?rate={rate}"
+    writer.write((f"GET {path} HTTP/1.1\r\nHost: {parts.netloc}\r\nUpgrade: websocket\r\n"
+                  f"Connection: Upgrade\r\nSec-WebSocket-Key: {key}\r\nSec-WebSocket-Version: 13\r\n\r\n")
+                 .encode('latin-1'))
+    await writer.drain()
+    status_line, headers = await read_http_head(reader)
+    status = int(status_line.split()[1])
+    if status == 503:
+        writer.close()
+        raise Rejected()
+    if status != 101 or headers.get('sec-websocket-accept') != websocket_accept(key):
+        writer.close()
+        raise ConnectionError(f"handshake failed: {status_line}")
+    return reader, writer
+
+
+async def run_client(url, samples, rate, block_ms, realtime):
+    """Stream one fixture; returns per-client timings"""
+    reader, writer = await connect(url, rate)
+    block = int(rate * block_ms / 1000)
+    sent_positions = []
+    sent_times = []
+    final_latencies = []
+    partials = 0
+    words = 0
+
+    def sent_time(stream_seconds):
+        i = bisect.bisect_left(sent_positions, int(round(stream_seconds * rate)))
+        return sent_times[min(i, len(sent_times) - 1)]
+
+    async def send_audio():
+        started = time.perf_counter()
+        for start in range(0, len(samples), block):
+            end = min(start + block, len(samples))
+            if realtime:
+                # Like a live device, a block is available once it has been recorded
+                delay = started + end / rate - time.perf_counter()
+                if delay > 0:
+                    await asyncio.sleep(delay)
+            write_frame(writer, OP_BINARY, samples[start:end].tobytes(), mask=True)
+            await writer.drain()
+            sent_positions.append(end)
+            sent_times.append(time.perf_counter())
+        write_frame(writer, OP_TEXT, b'{"eof": 1}', mask=True)
+        await writer.drain()
+
+    started = time.perf_counter()
+    sender = asyncio.ensure_future(send_audio())
+    try:
+        while True:
+            opcode, payload = await read_message(reader, writer, mask=True)
+            if opcode == OP_CLOSE:
+                break
+            message = json.loads(payload)
+            if 'partial' in message:
+                partials += 1
+            elif sent_times:
+                final_latencies.append(time.perf_counter() - sent_time(message['end']))
+                words += len(message.get('result', []))
+        await sender
+    finally:
+        sender.cancel()
+        writer.close()
+
+    return {
+        'wall_seconds': time.perf_counter() - started,
+        'audio_seconds': len(samples) / rate,
+        'final_latencies': final_latencies,
+        'partials': partials,
+        'words': words,
+    }
+
+
+async def run_load(url, fixtures, clients, block_ms, realtime, stagger):
+    async def one(i, fixture):
+        await asyncio.sleep(i * stagger)
+        try:
+            return await run_client(url, *fixture, block_ms, realtime)
+        except Rejected:
+            return 'rejected'
+        except Exception as e:
+            return e
+
+    started = time.perf_counter()
+    outcomes = await asyncio.gather(*(one(i, fixture) for i, fixture in
+                                      zip(range(clients), itertools.cycle(fixtures))))
+    wall_seconds = time.perf_counter() - started
+
+    completed = [o for o in outcomes if isinstance(o, dict)]
+    errors = [o for o in outcomes if isinstance(o, Exception)]
+    audio_seconds = sum(c['audio_seconds'] for c in completed)
+    return {
+        'url': url,
+        'clients': clients,
+        'mode': "realtime" if realtime else "max",
+        'completed': len(completed),
+        'rejected': sum(1 for o in outcomes if o == 'rejected'),
+        'errors': [str(e) or type(e).__name__ for e in errors],
+        'wall_seconds': wall_seconds,
+        'audio_seconds': audio_seconds,
+        'throughput_x_realtime': audio_seconds / wall_seconds if wall_seconds else 0.0,
+        'final_latency': percentiles([l for c in completed for l in c['final_latencies']]),
+        'partials': sum(c['partials'] for c in completed),
+        'words': sum(c['words'] for c in completed),
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Replay WAV files against server.py from many concurrent clients")
+    parser.add_argument('--url', default="ws://127.0.0.1:2700/")
+    parser.add_argument('--wav', action='append', required=True,
+                        help="16-bit PCM WAV fixture, sent at its own rate; repeat to mix several")
+    parser.add_argument('--clients', type=int, default=8)
+    parser.add_argument('--block-ms', type=int, default=100, help="Audio per WebSocket message")
+    parser.add_argument('--realtime', action='store_true', help="Pace clients at real time instead of max speed")
+    parser.add_argument('--stagger', type=float, default=0.05, help="Seconds between client starts")
+    parser.add_argument('--output', default=None, help="Write the report to this JSON file")
+    args = parser.parse_args(argv)
+
+    fixtures = [read_wav_mono(path) for path in args.wav]
+    report = asyncio.run(run_load(args.url, fixtures, args.clients, args.block_ms, args.realtime, args.stagger))
+
+    latency = report['final_latency']
+    print(f"{report['completed']}/{args.clients} clients completed, {report['rejected']} rejected, "
+          f"{len(report['errors'])} failed")
+    print(f"{report['audio_seconds']:.1f}s of audio in {report['wall_seconds']:.1f}s "
+          f"({report['throughput_x_realtime']:.1f}x real time), {report['words']} words")
+    if latency['count']:
+        print(f"Final latency p50 {latency['p50']:.3f}s, p90 {latency['p90']:.3f}s, "
+              f"p99 {latency['p99']:.3f}s, max {latency['max']:.3f}s")
+    for error in report['errors'][:5]:
+        print(f"Error: {error}")
+
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(report, f, indent=2)
+    return 1 if report['errors'] else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
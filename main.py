@@ -1,17 +1,30 @@
+import time
+# Taken before the other imports so startup timing includes them
+PROCESS_STARTED = time.perf_counter()
 import os
 import sys
 import json
 import threading
 import tkinter as tk
-from tkinter import ttk, filedialog
-import pyaudio
-import numpy as np
-import wave
-import tempfile
-from vosk import Model, KaldiRecognizer
+from tkinter import ttk, filedialog, messagebox
+from latency import LATENCY_PROFILES, DEFAULT_PROFILE
+from model_cache import model_cache, model_disk_size, format_size
+from ui_queue import UIUpdateQueue, BoundedTranscript, spill_file_name
+from app_paths import data_dir
+from transcript_store import TranscriptStore, format_row
+from metrics import MetricsRegistry, MetricsExporter, summary_lines
+from keywords import parse_phrases
+from engine import TranscriptionEngine, DECODE_MODES
+# vosk, numpy and pyaudio are imported on first use so the window appears without waiting for them
+IMPORTS_DONE = time.perf_counter()
+
+# UI refresh rate for queued updates and the line limit of the transcript widget
+UI_FRAME_MS = 50
+MAX_TRANSCRIPT_LINES = 2000
+STATS_REFRESH_MS = 1000
 
 class FloatingTranscriptionWindow:
-    def __init__(self, root):
+    def __init__(self, root, measure_startup=False):
         self.root = root
         self.root.title("System Audio Transcriber")
         self.root.attributes('-topmost', True)  # Always on top
@@ -58,6 +71,11 @@ class FloatingTranscriptionWindow:
         
         self.text_area.config(yscrollcommand=self.scrollbar.set)
         
+        # Worker threads post UI updates here; the Tk loop applies them once per frame
+        self.ui_queue = UIUpdateQueue()
+        self.transcript = BoundedTranscript(self.text_area, MAX_TRANSCRIPT_LINES,
+                                            os.path.join(data_dir("spill"), spill_file_name()))
+        
         # Write initialization message to text area
         self.text_area.insert(tk.END, "System Audio Transcriber initialized.\n")
         self.text_area.insert(tk.END, "1. Select a Vosk model directory using the 'Select Model' button.\n")
@@ -71,6 +89,12 @@ class FloatingTranscriptionWindow:
         self.status_label = ttk.Label(self.status_bar, text="Ready")
         self.status_label.pack(side=tk.LEFT, padx=5)
         
+        # Latency profile, applied when transcription starts
+        self.profile_var = tk.StringVar(value=DEFAULT_PROFILE)
+        self.profile_menu = ttk.Combobox(self.status_bar, textvariable=self.profile_var, width=14,
+                                         values=list(LATENCY_PROFILES), state="readonly")
+        self.profile_menu.pack(side=tk.RIGHT, padx=5)
+        
         # Control panel
         self.control_panel = ttk.Frame(self.frame)
         self.control_panel.pack(fill=tk.X, side=tk.BOTTOM, before=self.status_bar, pady=5)
@@ -81,16 +105,69 @@ class FloatingTranscriptionWindow:
         self.stop_button = ttk.Button(self.control_panel, text="Stop", command=self.stop_transcription, state=tk.DISABLED)
         self.stop_button.pack(side=tk.LEFT, padx=5)
         
+        # Pause keeps the streams open and the model loaded; nothing is decoded meanwhile
+        self.pause_button = ttk.Button(self.control_panel, text="Pause", command=self.toggle_pause, state=tk.DISABLED)
+        self.pause_button.pack(side=tk.LEFT, padx=5)
+        
         self.clear_button = ttk.Button(self.control_panel, text="Clear", command=self.clear_text)
         self.clear_button.pack(side=tk.LEFT, padx=5)
         
         self.model_button = ttk.Button(self.control_panel, text="Select Model", command=self.select_model)
         self.model_button.pack(side=tk.LEFT, padx=5)
         
+        # Optional larger model that re-decodes finished sentences in the background
+        self.refine_button = ttk.Button(self.control_panel, text="Refine Model", command=self.select_refine_model)
+        self.refine_button.pack(side=tk.LEFT, padx=5)
+        
         # Debug button to list audio devices
         self.debug_button = ttk.Button(self.control_panel, text="List Devices", command=self.list_audio_devices)
         self.debug_button.pack(side=tk.LEFT, padx=5)
         
+        # Transcribe the default microphone alongside system audio
+        self.mic_var = tk.BooleanVar(value=False)
+        self.mic_check = ttk.Checkbutton(self.control_panel, text="Mic", variable=self.mic_var)
+        self.mic_check.pack(side=tk.LEFT, padx=5)
+        
+        self.stats_button = ttk.Button(self.control_panel, text="Stats", command=self.toggle_stats)
+        self.stats_button.pack(side=tk.LEFT, padx=5)
+        
+        # Rewind: export or re-transcribe recently captured audio
+        self.history_button = ttk.Button(self.control_panel, text="History", command=self.show_history)
+        self.history_button.pack(side=tk.LEFT, padx=5)
+        
+        # Search bar for stored transcripts
+        self.search_bar = ttk.Frame(self.frame)
+        self.search_bar.pack(fill=tk.X, side=tk.BOTTOM, before=self.control_panel)
+        
+        self.search_var = tk.StringVar()
+        self.search_entry = ttk.Entry(self.search_bar, textvariable=self.search_var)
+        self.search_entry.pack(fill=tk.X, expand=True, side=tk.LEFT, padx=5)
+        self.search_entry.bind("<Return>", lambda event: self.search_transcripts())
+        
+        self.search_button = ttk.Button(self.search_bar, text="Search", command=self.search_transcripts)
+        self.search_button.pack(side=tk.RIGHT, padx=5)
+        
+        # Keyword spotting: phrases to listen for and whether to transcribe as well
+        self.keyword_bar = ttk.Frame(self.frame)
+        self.keyword_bar.pack(fill=tk.X, side=tk.BOTTOM, before=self.search_bar)
+        
+        ttk.Label(self.keyword_bar, text="Keywords:").pack(side=tk.LEFT, padx=5)
+        self.keywords_var = tk.StringVar()
+        self.keywords_entry = ttk.Entry(self.keyword_bar, textvariable=self.keywords_var)
+        self.keywords_entry.pack(fill=tk.X, expand=True, side=tk.LEFT, padx=5)
+        
+        self.decode_mode_var = tk.StringVar(value=DECODE_MODES[0])
+        self.decode_mode_menu = ttk.Combobox(self.keyword_bar, textvariable=self.decode_mode_var, width=10,
+                                             values=DECODE_MODES, state="readonly")
+        self.decode_mode_menu.pack(side=tk.RIGHT, padx=5)
+        
+        # Per-stage timings, hidden until the Stats button is pressed
+        self.stats_panel = ttk.Frame(self.frame)
+        self.stats_label = tk.Label(self.stats_panel, font=("Consolas", 8), justify=tk.LEFT, anchor=tk.W)
+        self.stats_label.pack(fill=tk.X, padx=5)
+        self.stats_visible = False
+        self.stats_refresh = None
+        
         # Bind event handlers for dragging
         self.title_bar.bind("<ButtonPress-1>", self.start_drag)
         self.title_bar.bind("<ButtonRelease-1>", self.stop_drag)
@@ -102,17 +179,51 @@ class FloatingTranscriptionWindow:
         self.root.bind("<B3-Motion>", self.do_resize)
         
         # Transcription variables
-        self.is_transcribing = False
-        self.transcription_thread = None
-        self.audio_stream = None
-        self.audio = None
-        self.model = None
-        self.recognizer = None
         self.model_path = None
-        self.loopback_device_index = None
-        
-        # Initialize Audio
-        self.initialize_audio()
+        self.model_load_started = None
+        self.model_load_size = None
+        self.measure_startup = measure_startup
+        self.startup = {'imports_seconds': IMPORTS_DONE - PROCESS_STARTED}
+        
+        # Hot-path timings from every pipeline; exported when TRANSCRIBER_METRICS_FILE is set
+        self.metrics = MetricsRegistry()
+        self._ui_frame_timer = self.metrics.histogram("ui_frame_seconds", "Applying one batch of UI updates")
+        self._ui_delay_timer = self.metrics.histogram("ui_frame_delay_seconds", "Tk after() callback lateness")
+        self._ui_depth_gauge = self.metrics.gauge("ui_queue_depth", "UI updates waiting for the next frame")
+        self._last_ui_frame = None
+        self.metrics_exporter = None
+        metrics_file = os.environ.get("TRANSCRIBER_METRICS_FILE")
+        if metrics_file:
+            self.metrics_exporter = MetricsExporter(
+                self.metrics, metrics_file, float(os.environ.get("TRANSCRIBER_METRICS_INTERVAL", 10)))
+            self.metrics_exporter.start()
+        
+        # Every finalized segment is saved; writes happen on the store's own thread
+        try:
+            self.transcript_store = TranscriptStore()
+            self.transcript_store.start()
+        except Exception as e:
+            self.transcript_store = None
+            self.update_text(f"Transcript history disabled: {str(e)}")
+        
+        # The engine does the capture and decoding; the window only shows its events.
+        # Device discovery starts right away in the background; the window is usable meanwhile
+        self.update_text("Looking for audio devices...")
+        self.engine = TranscriptionEngine(
+            # Decode in worker processes instead of this one (TRANSCRIBER_RECOGNIZER_PROCESSES=N)
+            processes=int(os.environ.get("TRANSCRIBER_RECOGNIZER_PROCESSES", 0)),
+            # Reuse transcripts of audio heard before (TRANSCRIBER_FINGERPRINT_CACHE=max sentences)
+            cache_entries=int(os.environ.get("TRANSCRIBER_FINGERPRINT_CACHE", 0)),
+            # Finalize after this many seconds of pause instead of the profile's (TRANSCRIBER_ENDPOINT=0 turns it off)
+            endpoint_seconds=float(os.environ["TRANSCRIBER_ENDPOINT"]) if os.environ.get("TRANSCRIBER_ENDPOINT") else None,
+            endpoint_mode=os.environ.get("TRANSCRIBER_ENDPOINT_MODE", "final"),
+            store=self.transcript_store,
+            metrics=self.metrics,
+            on_event=self.on_engine_event,
+        )
+        
+        self.root.after(UI_FRAME_MS, self.drain_ui_queue)
+        self.root.after_idle(self.on_window_shown)
         
     def start_drag(self, event):
         self.x_offset = event.x
@@ -161,56 +272,99 @@ class FloatingTranscriptionWindow:
         icon.destroy()
     
     def close_window(self):
-        self.stop_transcription()
+        self.engine.close()
+        if self.transcript_store:
+            self.transcript_store.close()
+        if self.metrics_exporter:
+            self.metrics_exporter.stop()
         self.root.destroy()
         sys.exit()
     
     def clear_text(self):
-        self.text_area.delete(1.0, tk.END)
-        self.text_area.insert(tk.END, "Transcription cleared.\n")
+        self.ui_queue.discard_lines()
+        self.transcript.clear()
+        self.update_text("Transcription cleared.")
     
-    def initialize_audio(self):
-        try:
-            self.audio = pyaudio.PyAudio()
-            self.update_text("Audio system initialized.")
-            self.find_loopback_device()
-        except Exception as e:
-            self.update_text(f"Error initializing audio: {str(e)}")
+    @property
+    def devices(self):
+        return self.engine.devices
     
-    def find_loopback_device(self):
-        """Find and store the loopback device index"""
-        found_devices = []
-        for i in range(self.audio.get_device_count()):
-            device_info = self.audio.get_device_info_by_index(i)
-            device_name = device_info.get('name', '')
-            if device_info.get('maxInputChannels', 0) > 0:
-                found_devices.append(f"Device {i}: {device_name} (in: {device_info.get('maxInputChannels')}, out: {device_info.get('maxOutputChannels')})")
-                
-                # Look for common loopback device names
-                if any(keyword in device_name.lower() for keyword in ["stereo mix", "what u hear", "loopback", "wave out", "monitor"]):
-                    self.loopback_device_index = i
-                    self.update_text(f"Found loopback device: {device_name} (Device {i})")
-                    return
-        
-        # Log all found devices
+    @property
+    def loopback_device_index(self):
+        return self.devices.selected_index
+    
+    def on_window_shown(self):
+        self.record_startup(window_seconds=time.perf_counter() - PROCESS_STARTED)
+    
+    def on_devices_ready(self):
+        devices = self.devices
+        if devices.error is not None:
+            self.update_text(f"Error initializing audio: {str(devices.error)}")
+            return
+        
+        self.update_text("Audio system initialized.")
+        self.record_startup(devices_seconds=time.perf_counter() - PROCESS_STARTED,
+                            cached_device=devices.selected_from_cache)
+        selected = devices.selected
+        if selected is None:
+            self.update_text("No audio input device found.")
+        elif devices.selected_from_cache:
+            self.update_text(f"Using capture device: {selected['name']} (Device {selected['index']})")
+        elif selected is not devices.default_input:
+            self.update_text(f"Found loopback device: {selected['name']} (Device {selected['index']})")
+        else:
+            self.report_no_loopback()
+    
+    def report_no_loopback(self):
         self.update_text("All input devices:")
-        for device in found_devices:
-            self.update_text(device)
-            
-        # Default to default input if no loopback device found
-        default_input = self.audio.get_default_input_device_info()
-        self.loopback_device_index = default_input['index']
-        self.update_text(f"No loopback device found. Using default input: {default_input['name']} (Device {self.loopback_device_index})")
+        for info in self.devices.input_devices():
+            self.update_text(f"Device {info['index']}: {info.get('name', '')} (in: {info.get('maxInputChannels')}, "
+                             f"out: {info.get('maxOutputChannels')})")
+        selected = self.devices.selected
+        self.update_text(f"No loopback device found. Using default input: {selected['name']} "
+                         f"(Device {selected['index']})")
         self.update_text("NOTE: Default device will likely capture microphone, not system audio.")
         self.update_text("Enable 'Stereo Mix' in Windows Sound settings or use a virtual audio cable.")
     
+    def on_devices_changed(self, added, removed):
+        for name in added:
+            self.update_text(f"Audio device connected: {name}")
+        for name in removed:
+            self.update_text(f"Audio device removed: {name}")
+        selected = self.devices.selected
+        if selected:
+            self.status_label.config(text=f"Capture device: {selected['name']}")
+    
+    def record_startup(self, **values):
+        """Collect startup timings; logged and appended to startup.jsonl once complete"""
+        self.startup.update(values)
+        if 'window_seconds' not in self.startup or 'devices_seconds' not in self.startup:
+            return
+        startup = dict(self.startup, time=time.time(), device_scan_seconds=self.devices.scan_seconds)
+        for name in ('window_seconds', 'devices_seconds'):
+            self.metrics.gauge(f"startup_{name}", "Seconds from process start").set(startup[name])
+        self.update_text(f"Window shown after {startup['window_seconds'] * 1000:.0f} ms, "
+                         f"audio ready after {startup['devices_seconds'] * 1000:.0f} ms")
+        try:
+            with open(os.path.join(data_dir(), "startup.jsonl"), 'a', encoding='utf-8') as f:
+                f.write(json.dumps(startup) + "\n")
+        except OSError:
+            pass
+        if self.measure_startup:
+            print(json.dumps(startup))
+            self.root.after(0, self.close_window)
+    
     def list_audio_devices(self):
         """Debug function to list all audio devices"""
-        self.text_area.delete(1.0, tk.END)
+        if not self.devices.ready.is_set():
+            self.update_text("Still looking for audio devices...")
+            return
+        self.ui_queue.discard_lines()
+        self.transcript.clear()
         self.update_text("Available Audio Devices:")
         
-        for i in range(self.audio.get_device_count()):
-            device_info = self.audio.get_device_info_by_index(i)
+        for device_info in self.devices.devices:
+            i = device_info['index']
             device_name = device_info.get('name', '')
             inputs = device_info.get('maxInputChannels', 0)
             outputs = device_info.get('maxOutputChannels', 0)
@@ -223,10 +377,12 @@ class FloatingTranscriptionWindow:
             
             self.update_text("")
         
-        default_input = self.audio.get_default_input_device_info()
-        default_output = self.audio.get_default_output_device_info()
-        self.update_text(f"Default input: Device {default_input['index']} - {default_input['name']}")
-        self.update_text(f"Default output: Device {default_output['index']} - {default_output['name']}")
+        default_input = self.devices.default_input
+        default_output = self.devices.default_output
+        if default_input:
+            self.update_text(f"Default input: Device {default_input['index']} - {default_input['name']}")
+        if default_output:
+            self.update_text(f"Default output: Device {default_output['index']} - {default_output['name']}")
         
         self.update_text("\nTo capture system audio, enable 'Stereo Mix' in Windows Sound settings")
         self.update_text("or use a virtual audio cable solution like VB-Cable.")
@@ -235,140 +391,305 @@ class FloatingTranscriptionWindow:
         model_dir = filedialog.askdirectory(title="Select Vosk Model Directory")
         if model_dir:
             self.model_path = model_dir
-            self.status_label.config(text=f"Model: {os.path.basename(model_dir)}")
             self.update_text(f"Selected model: {os.path.basename(model_dir)}")
+            self.preload_model()
+    
+    def preload_model(self):
+        """Start loading the selected model on a background thread"""
+        path = self.model_path
+        name = os.path.basename(path)
+        try:
+            if model_cache.get_cached(path) is not None:
+                self.status_label.config(text=f"Model ready: {name}")
+                return
+            if self.engine.model_loading(path):
+                return
+            self.model_load_started = time.monotonic()
+            self.model_load_size = format_size(model_disk_size(path))
+        except OSError as e:
+            self.update_text(f"Error loading model: {str(e)}")
+            self.status_label.config(text="Error")
+            return
+        
+        self.engine.load_model(path)
+        self.show_model_progress(path)
+    
+    def show_model_progress(self, path):
+        """Tick the loading status until the background load finishes"""
+        if path != self.model_path or not self.engine.model_loading(path):
+            return
+        elapsed = time.monotonic() - self.model_load_started
+        self.status_label.config(text=f"Loading {os.path.basename(path)} ({self.model_load_size})... {elapsed:.0f}s")
+        self.root.after(500, lambda: self.show_model_progress(path))
+    
+    def on_model_loaded(self, path, error, seconds):
+        if path != self.model_path:
+            return  # Another model was selected while this one loaded
+        
+        if error is not None:
+            self.update_text(f"Error loading model: {str(error)}")
+            self.status_label.config(text="Error")
+            return
+        
+        if self.engine.state == "stopped":
+            self.status_label.config(text=f"Model ready: {os.path.basename(path)}")
+        self.update_text(f"Model loaded in {seconds:.1f}s")
+    
+    def select_refine_model(self):
+        model_dir = filedialog.askdirectory(title="Select a larger Vosk model for refinement")
+        if not model_dir:
+            return
+        self.engine.set_refine_model(model_dir)
+        self.update_text(f"Refining sentences with: {os.path.basename(model_dir)} "
+                         f"(takes effect from the next Start)")
+    
+    def show_history(self):
+        """Dialog to export or re-transcribe a range of recently captured audio"""
+        histories = {name: h for name, h in self.engine.histories.items() if h.started_at is not None}
+        if not histories:
+            self.update_text("No audio captured yet.")
+            return
+        
+        dialog = tk.Toplevel(self.root)
+        dialog.title("Audio History")
+        dialog.attributes('-topmost', True)
+        
+        source_var = tk.StringVar(value=next(iter(histories)))
+        from_var = tk.StringVar(value="30")
+        to_var = tk.StringVar(value="0")
+        ttk.Label(dialog, text="Source").grid(row=0, column=0, sticky=tk.W, padx=5, pady=2)
+        ttk.Combobox(dialog, textvariable=source_var, values=list(histories), state="readonly",
+                     width=10).grid(row=0, column=1, sticky=tk.W, padx=5, pady=2)
+        ttk.Label(dialog, text="From (seconds ago)").grid(row=1, column=0, sticky=tk.W, padx=5, pady=2)
+        ttk.Entry(dialog, textvariable=from_var, width=8).grid(row=1, column=1, sticky=tk.W, padx=5, pady=2)
+        ttk.Label(dialog, text="To (seconds ago)").grid(row=2, column=0, sticky=tk.W, padx=5, pady=2)
+        ttk.Entry(dialog, textvariable=to_var, width=8).grid(row=2, column=1, sticky=tk.W, padx=5, pady=2)
+        
+        def selection():
+            try:
+                seconds_ago, until = float(from_var.get()), float(to_var.get())
+            except ValueError:
+                messagebox.showerror("Audio History", "Enter the range in seconds.", parent=dialog)
+                return None
+            history = histories[source_var.get()]
+            samples, start = history.read_recent(seconds_ago, until)
+            if not len(samples):
+                messagebox.showinfo("Audio History", "No audio in that range.", parent=dialog)
+                return None
+            return source_var.get(), history, samples, start
+        
+        buttons = ttk.Frame(dialog)
+        buttons.grid(row=3, column=0, columnspan=2, pady=5)
+        ttk.Button(buttons, text="Export WAV", command=lambda: self.export_history(selection(), dialog)).pack(
+            side=tk.LEFT, padx=5)
+        ttk.Button(buttons, text="Transcribe", command=lambda: self.retranscribe_history(selection())).pack(
+            side=tk.LEFT, padx=5)
+    
+    def export_history(self, selected, dialog):
+        if selected is None:
+            return
+        from audio_history import write_wav
+        name, history, samples, start = selected
+        stamp = time.strftime("%Y%m%d-%H%M%S", time.localtime(history.started_at + start))
+        path = filedialog.asksaveasfilename(parent=dialog, defaultextension=".wav", filetypes=[("WAV", "*.wav")],
+                                            initialfile=f"{name.lower()}-{stamp}.wav")
+        if not path:
+            return
+        try:
+            write_wav(path, samples, history.rate)
+        except (OSError, EOFError) as e:
+            self.update_text(f"Export failed: {str(e)}")
+            return
+        self.update_text(f"Exported {len(samples) / history.rate:.1f}s of {name} audio to {path}")
+    
+    def retranscribe_history(self, selected):
+        """Decode a range again on a background thread with its own recognizer; capture keeps running"""
+        if selected is None:
+            return
+        name, history, samples, start = selected
+        
+        def run():
+            try:
+                results = self.engine.retranscribe(samples, history.started_at + start)
+            except Exception as e:
+                self.update_text(f"Re-transcription failed: {str(e)}")
+                return
+            self.update_text(f"Replay of {len(samples) / history.rate:.0f}s of {name} audio:")
+            for result in results:
+                stamp = time.strftime("%H:%M:%S", time.localtime(result['start']))
+                self.update_text(f"  [{stamp}] {result['text']}")
+            if not results:
+                self.update_text("  (no speech)")
+        
+        threading.Thread(target=run, daemon=True).start()
+    
+    def search_transcripts(self):
+        """Show stored segments matching the search box in a popup"""
+        query = self.search_var.get().strip()
+        if not query or not self.transcript_store:
+            return
+        
+        try:
+            started = time.perf_counter()
+            rows = self.transcript_store.search(query, limit=200)
+            elapsed = time.perf_counter() - started
+        except Exception as e:
+            self.update_text(f"Search error: {str(e)}")
+            return
+        
+        results = tk.Toplevel(self.root)
+        results.title(f"Search: {query}")
+        results.attributes('-topmost', True)
+        results.geometry("500x300")
+        
+        text = tk.Text(results, wrap=tk.WORD)
+        text.pack(fill=tk.BOTH, expand=True)
+        text.insert(tk.END, f"{len(rows)} result(s) in {elapsed * 1000:.1f} ms\n\n")
+        for row in reversed(rows):
+            text.insert(tk.END, format_row(row) + "\n")
+        text.config(state=tk.DISABLED)
     
     def update_text(self, text):
-        """Add text to the transcription window and scroll to show it"""
-        self.text_area.insert(tk.END, text + "\n")
-        self.text_area.see(tk.END)
+        """Queue a line for the transcription window; safe to call from any thread"""
+        self.ui_queue.post_line(text)
+    
+    def drain_ui_queue(self):
+        """Apply everything queued since the last frame in one batch"""
+        frame_start = time.perf_counter()
+        if self._last_ui_frame is not None:
+            # How far behind schedule Tk ran this callback
+            self._ui_delay_timer.observe(max(0.0, frame_start - self._last_ui_frame - UI_FRAME_MS / 1000))
+        self._last_ui_frame = frame_start
+        self._ui_depth_gauge.set(self.ui_queue.depth)
+        calls, lines, status = self.ui_queue.drain()
+        # Lines first, so a refinement queued in the same frame finds its sentence
+        self.transcript.append(lines)
+        for call in calls:
+            call()
+        if status is not None:
+            self.status_label.config(text=status)
+        self._ui_frame_timer.observe(time.perf_counter() - frame_start)
+        self.root.after(UI_FRAME_MS, self.drain_ui_queue)
+    
+    def toggle_stats(self):
+        self.stats_visible = not self.stats_visible
+        if self.stats_visible:
+            self.stats_panel.pack(fill=tk.X, side=tk.BOTTOM, before=self.keyword_bar)
+            self.refresh_stats()
+        else:
+            self.stats_panel.pack_forget()
+            if self.stats_refresh:
+                self.root.after_cancel(self.stats_refresh)
+                self.stats_refresh = None
+    
+    def refresh_stats(self):
+        lines = summary_lines(self.metrics)
+        self.stats_label.config(text="\n".join(lines) or "No measurements yet")
+        self.stats_refresh = self.root.after(STATS_REFRESH_MS, self.refresh_stats)
     
     def start_transcription(self):
-        if self.is_transcribing:
+        if self.engine.state != "stopped":
             return
         
         if not self.model_path:
             self.update_text("Please select a Vosk model directory first.")
             return
         
+        if self.decode_mode_var.get() != "transcribe" and not parse_phrases(self.keywords_var.get()):
+            self.update_text("Enter the keywords to listen for, separated by commas.")
+            return
+        
+        # Settings are read by the engine when the session starts
+        engine = self.engine
+        engine.model_path = self.model_path
+        engine.profile = self.profile_var.get()
+        engine.decode_mode = self.decode_mode_var.get()
+        engine.keywords = parse_phrases(self.keywords_var.get())
+        engine.mic = self.mic_var.get()
         try:
-            # Load the model
-            self.update_text("Loading speech recognition model...")
-            self.model = Model(self.model_path)
-            self.recognizer = KaldiRecognizer(self.model, 16000)
-            
-            # Update UI
-            self.start_button.config(state=tk.DISABLED)
-            self.stop_button.config(state=tk.NORMAL)
-            self.status_label.config(text="Transcribing...")
-            
-            # Start transcription in a separate thread
-            self.is_transcribing = True
-            self.transcription_thread = threading.Thread(target=self.transcribe)
-            self.transcription_thread.daemon = True
-            self.transcription_thread.start()
-            
-            self.update_text("Started transcription. Speaking will appear here...")
-            
+            # Returns at once; the session waits for the model and the devices by itself
+            engine.start()
         except Exception as e:
             self.update_text(f"Error starting transcription: {str(e)}")
             self.status_label.config(text="Error")
     
     def stop_transcription(self):
-        if not self.is_transcribing:
+        if self.engine.state == "stopped":
             return
         
-        self.is_transcribing = False
-        
-        if self.audio_stream:
-            self.audio_stream.stop_stream()
-            self.audio_stream.close()
-            self.audio_stream = None
-        
-        # Update UI
-        self.start_button.config(state=tk.NORMAL)
+        # The decoding threads stop capture and close the streams themselves,
+        # so the stream is never closed underneath a blocking read
+        self.engine.stop()
         self.stop_button.config(state=tk.DISABLED)
-        self.status_label.config(text="Stopped")
-        self.update_text("Transcription stopped.")
+        self.pause_button.config(state=tk.DISABLED)
     
-    def transcribe(self):
-        try:
-            # Setup audio capture parameters
-            FORMAT = pyaudio.paInt16
-            CHANNELS = 1
-            RATE = 16000
-            CHUNK = 4000
-            
-            self.update_text(f"Opening audio stream from device {self.loopback_device_index}")
-            
-            # Open stream for capturing
-            self.audio_stream = self.audio.open(
-                format=FORMAT,
-                channels=CHANNELS,
-                rate=RATE,
-                input=True,
-                frames_per_buffer=CHUNK,
-                input_device_index=self.loopback_device_index
-            )
-            
-            self.update_text("Audio stream opened successfully")
-            silent_chunks = 0
-            
-            while self.is_transcribing:
-                # Read audio data
-                try:
-                    data = self.audio_stream.read(CHUNK, exception_on_overflow=False)
-                    
-                    # Simple check if audio data is not silent
-                    audio_data = np.frombuffer(data, dtype=np.int16)
-                    if np.abs(audio_data).mean() < 100:
-                        silent_chunks += 1
-                        if silent_chunks >= 10:  # About 2.5 seconds of silence
-                            silent_chunks = 0
-                            self.root.after(0, lambda: self.status_label.config(text="Listening (silent)"))
-                        continue
-                    else:
-                        silent_chunks = 0
-                        self.root.after(0, lambda: self.status_label.config(text="Transcribing..."))
-                    
-                    # Process audio for transcription
-                    if self.recognizer.AcceptWaveform(data):
-                        result = self.recognizer.Result()
-                        result_dict = json.loads(result)
-                        if 'text' in result_dict and result_dict['text'].strip():
-                            transcript_text = result_dict['text']
-                            # Update UI from the main thread
-                            self.root.after(0, lambda t=transcript_text: self.update_text(t))
-                    else:
-                        # Get partial results
-                        partial = json.loads(self.recognizer.PartialResult())
-                        if 'partial' in partial and partial['partial'].strip():
-                            partial_text = partial['partial']
-                            # Update status with partial text
-                            self.root.after(0, lambda t=partial_text: self.status_label.config(text=f"Partial: {t[:20]}{'...' if len(t) > 20 else ''}"))
-                            
-                except IOError as e:
-                    # Handle buffer overflow gracefully
-                    if "Input overflowed" in str(e):
-                        continue
-                    else:
-                        self.root.after(0, lambda e=e: self.update_text(f"Audio error: {str(e)}"))
-                except Exception as e:
-                    self.root.after(0, lambda e=e: self.update_text(f"Error processing audio: {str(e)}"))
-                
-        except Exception as e:
-            self.root.after(0, lambda e=e: self.update_text(f"Transcription error: {str(e)}"))
-            self.root.after(0, lambda: self.status_label.config(text="Error"))
-            
-        finally:
-            # Clean up
-            self.is_transcribing = False
-            self.root.after(0, lambda: self.start_button.config(state=tk.NORMAL))
-            self.root.after(0, lambda: self.stop_button.config(state=tk.DISABLED))
+    def toggle_pause(self):
+        if self.engine.state == "paused":
+            self.engine.resume()
+        else:
+            self.engine.pause()
+    
+    def on_engine_event(self, event):
+        """Called on engine threads; hands every event to the Tk loop through the UI queue"""
+        kind = event['type']
+        if kind == "final":
+            text = self.labelled(event['source'], event['text'])
+            self.ui_queue.post_line(text, event['id'] if event['refining'] else None)
+        elif kind == "partial":
+            self.ui_queue.post_partial(self.labelled(event['source'], event['text']))
+        elif kind == "status":
+            self.ui_queue.post_status(event['text'])
+        elif kind == "message":
+            self.update_text(event['text'])
+        elif kind == "refined":
+            text = self.labelled(event['source'], event['text'])
+            self.ui_queue.post_call(lambda: self.transcript.replace(event['id'], text))
+        elif kind == "unrefined":
+            self.ui_queue.post_call(lambda: self.text_area.tag_delete(event['id']))
+        elif kind == "keyword":
+            self.ui_queue.post_call(lambda: self.on_keyword_alert(event))
+        elif kind == "state":
+            self.ui_queue.post_call(lambda: self.on_state_changed(event['state'], event['previous']))
+        elif kind == "model":
+            self.ui_queue.post_call(lambda: self.on_model_loaded(event['path'], event['error'], event['seconds']))
+        elif kind == "devices":
+            self.ui_queue.post_call(self.on_devices_ready)
+        elif kind == "devices_changed":
+            self.ui_queue.post_call(lambda: self.on_devices_changed(event['added'], event['removed']))
+    
+    def labelled(self, source, text):
+        """Prefix the source name when more than one source is transcribed"""
+        return f"[{source}] {text}" if self.engine.source_count > 1 else text
+    
+    def on_keyword_alert(self, event):
+        """Show a spotted keyword with its time and confidence, and beep"""
+        stamp = time.strftime("%H:%M:%S", time.localtime(event['time']))
+        self.update_text(self.labelled(event['source'], f"*** Keyword \"{event['phrase']}\" at {stamp} "
+                                                        f"(confidence {event['conf']:.0%})"))
+        self.root.bell()
+    
+    def on_state_changed(self, state, previous=None):
+        running = state in ("running", "paused")
+        self.start_button.config(state=tk.NORMAL if state == "stopped" else tk.DISABLED)
+        self.stop_button.config(state=tk.DISABLED if state == "stopped" else tk.NORMAL)
+        self.pause_button.config(state=tk.NORMAL if running else tk.DISABLED,
+                                 text="Resume" if state == "paused" else "Pause")
+        if state == "running" and previous == "paused":
+            self.update_text("Transcription resumed.")
+        elif state == "running":
+            self.update_text("Started transcription. Speaking will appear here...")
+        elif state == "paused":
+            self.status_label.config(text="Paused")
+            self.update_text("Transcription paused.")
+        elif state == "stopped":
+            if self.status_label.cget("text") != "Error":
+                self.status_label.config(text="Stopped")
+            self.update_text("Transcription stopped.")
 
 def main():
     root = tk.Tk()
-    app = FloatingTranscriptionWindow(root)
+    # --measure-startup prints the startup timings as JSON and exits once audio is ready
+    app = FloatingTranscriptionWindow(root, measure_startup="--measure-startup" in sys.argv[1:])
     root.mainloop()
 
 if __name__ == "__main__":
@@ -0,0 +1,259 @@
+"""Low-overhead metrics for the transcription hot path.
+
+Stages record durations into RollingHistograms (fixed log-spaced buckets, so
+an observation is one bisect and two increments under an uncontended lock).
+Percentiles cover the last `window` seconds; the cumulative buckets are what
+gets exported in Prometheus text format or as JSON by MetricsExporter.
+"""
+import os
+import json
+import time
+import bisect
+import threading
+
+# Bucket upper bounds in seconds: 5 per decade from 10 us to 10 s
+BUCKET_BOUNDS = [round(10 ** (e / 5), 9) for e in range(-25, 6)]
+
+
+class Counter:
+    kind = "counter"
+
+    def __init__(self):
+        self.value = 0
+
+    def inc(self, n=1):
+        self.value += n
+
+    def set(self, value):
+        """For counters mirrored from another monotonic source"""
+        self.value = value
+
+
+class Gauge:
+    kind = "gauge"
+
+    def __init__(self):
+        self.value = 0.0
+
+    def set(self, value):
+        self.value = value
+
+
+class RollingHistogram:
+    """Histogram with cumulative totals plus a sliding window for percentiles.
+
+    The window is split into `slices` time slices; the oldest slice is
+    cleared as time moves on, so percentiles reflect recent behaviour while
+    exported totals stay monotonic.
+    """
+
+    kind = "histogram"
+
+    def __init__(self, window=60.0, slices=6, bounds=BUCKET_BOUNDS):
+        self.bounds = bounds
+        self.slice_seconds = window / slices
+        self._lock = threading.Lock()
+        self._slices = [[0] * (len(bounds) + 1) for _ in range(slices)]
+        self._slice_max = [0.0] * slices
+        self._current = 0
+        self._slice_started = time.monotonic()
+        self.counts = [0] * (len(bounds) + 1)
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, value):
+        i = bisect.bisect_left(self.bounds, value)
+        with self._lock:
+            self._rotate(time.monotonic())
+            self._slices[self._current][i] += 1
+            if value > self._slice_max[self._current]:
+                self._slice_max[self._current] = value
+            self.counts[i] += 1
+            self.count += 1
+            self.sum += value
+
+    def _rotate(self, now):
+        elapsed = int((now - self._slice_started) / self.slice_seconds)
+        if elapsed <= 0:
+            return
+        for _ in range(min(elapsed, len(self._slices))):
+            self._current = (self._current + 1) % len(self._slices)
+            self._slices[self._current] = [0] * len(self.counts)
+            self._slice_max[self._current] = 0.0
+        self._slice_started += elapsed * self.slice_seconds
+
+    def window(self):
+        """(bucket counts, max) over the rolling window"""
+        with self._lock:
+            self._rotate(time.monotonic())
+            counts = [sum(column) for column in zip(*self._slices)]
+            return counts, max(self._slice_max)
+
+    def percentiles(self, qs=(0.5, 0.95, 0.99)):
+        """Rolling percentiles, interpolated geometrically inside a bucket"""
+        counts, peak = self.window()
+        total = sum(counts)
+        result = {'count': total, 'max': peak}
+        for q in qs:
+            result[f"p{round(q * 100)}"] = self._quantile(counts, total, q, peak) if total else 0.0
+        return result
+
+    def _quantile(self, counts, total, q, peak):
+        rank = q * total
+        seen = 0
+        for i, n in enumerate(counts):
+            if n and seen + n >= rank:
+                upper = self.bounds[i] if i < len(self.bounds) else peak
+                lower = self.bounds[i - 1] if i > 0 else upper / 10 ** 0.2
+                fraction = (rank - seen) / n
+                return min(lower * (upper / lower) ** fraction, peak)
+            seen += n
+        return peak
+
+
+class MetricsRegistry:
+    """Named metrics with optional labels; child() adds labels and shares storage"""
+
+    def __init__(self, prefix="transcriber", labels=None, _store=None):
+        self.prefix = prefix
+        self.labels = dict(labels or {})
+        self._store = _store if _store is not None else {'metrics': {}, 'help': {}, 'lock': threading.Lock()}
+
+    def child(self, **labels):
+        return MetricsRegistry(self.prefix, {**self.labels, **labels}, self._store)
+
+    def _get(self, cls, name, help_text):
+        key = (name, tuple(sorted(self.labels.items())))
+        metrics = self._store['metrics']
+        metric = metrics.get(key)
+        if metric is None:
+            with self._store['lock']:
+                metric = metrics.setdefault(key, cls())
+                if help_text:
+                    self._store['help'].setdefault(name, help_text)
+        return metric
+
+    def counter(self, name, help_text=""):
+        return self._get(Counter, name, help_text)
+
+    def gauge(self, name, help_text=""):
+        return self._get(Gauge, name, help_text)
+
+    def histogram(self, name, help_text=""):
+        return self._get(RollingHistogram, name, help_text)
+
+    def items(self):
+        """[(name, labels dict, metric)] sorted by name"""
+        with self._store['lock']:
+            entries = list(self._store['metrics'].items())
+        return [(name, dict(labels), metric) for (name, labels), metric in sorted(entries, key=lambda e: e[0])]
+
+    def snapshot(self):
+        """JSON-friendly view; histograms report rolling percentiles and totals"""
+        metrics = []
+        for name, labels, metric in self.items():
+            entry = {'name': f"{self.prefix}_{name}", 'labels': labels, 'type': metric.kind}
+            if metric.kind == "histogram":
+                entry.update(metric.percentiles(), total_count=metric.count, total_sum=metric.sum)
+            else:
+                entry['value'] = metric.value
+            metrics.append(entry)
+        return {'time': time.time(), 'metrics': metrics}
+
+    def prometheus_text(self):
+        lines = []
+        described = set()
+        for name, labels, metric in self.items():
+            full_name = f"{self.prefix}_{name}"
+            if full_name not in described:
+                described.add(full_name)
+                help_text = self._store['help'].get(name)
+                if help_text:
+                    lines.append(f"# HELP {full_name} {help_text}")
+                lines.append(f"# TYPE {full_name} {metric.kind}")
+            if metric.kind != "histogram":
+                lines.append(f"{full_name}{_label_text(labels)} {metric.value}")
+                continue
+            cumulative = 0
+            for bound, n in zip(metric.bounds + [float('inf')], list(metric.counts)):
+                cumulative += n
+                le = "+Inf" if bound == float('inf') else repr(bound)
+                lines.append(f"{full_name}_bucket{_label_text(dict(labels, le=le))} {cumulative}")
+            lines.append(f"{full_name}_sum{_label_text(labels)} {metric.sum}")
+            lines.append(f"{full_name}_count{_label_text(labels)} {metric.count}")
+        return "\n".join(lines) + "\n"
+
+
+def _label_text(labels):
+    if not labels:
+        return ""
+    escaped = (str(v).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n') for v in labels.values())
+    return "{" + ",".join(f'{k}="{v}"' for k, v in zip(labels, escaped)) + "}"
+
+
+def format_seconds(seconds):
+    if seconds >= 1:
+        return f"{seconds:.2f}s"
+    if seconds >= 1e-3:
+        return f"{seconds * 1e3:.1f}ms"
+    return f"{seconds * 1e6:.0f}us"
+
+
+def summary_lines(registry):
+    """Compact text for the stats panel: one line per metric"""
+    lines = []
+    for name, labels, metric in registry.items():
+        label = f"{name} [{','.join(str(v) for v in labels.values())}]" if labels else name
+        if metric.kind == "histogram":
+            p = metric.percentiles()
+            if p['count']:
+                lines.append(f"{label:<34} p50 {format_seconds(p['p50']):>7} p95 {format_seconds(p['p95']):>7} "
+                             f"p99 {format_seconds(p['p99']):>7} n={p['count']}")
+        elif isinstance(metric.value, float):
+            lines.append(f"{label:<34} {metric.value:.3f}")
+        else:
+            lines.append(f"{label:<34} {metric.value}")
+    return lines
+
+
+class MetricsExporter(threading.Thread):
+    """Periodically writes the registry to a file for monitoring agents to scrape.
+
+    The format follows the extension: .json for JSON, anything else for the
+    Prometheus text format (e.g. for node_exporter's textfile collector).
+    Files are replaced atomically so readers never see a partial write.
+    """
+
+    def __init__(self, registry, path, interval=10.0):
+        super().__init__(daemon=True)
+        self.registry = registry
+        self.path = path
+        self.interval = interval
+        self.format = "json" if path.lower().endswith(".json") else "prometheus"
+        self.error = None
+        self._stop_event = threading.Event()
+
+    def export(self):
+        if self.format == "json":
+            content = json.dumps(self.registry.snapshot(), indent=2)
+        else:
+            content = self.registry.prometheus_text()
+        temp_path = f"{self.path}.tmp"
+        with open(temp_path, 'w', encoding='utf-8') as f:
+            f.write(content)
+        os.replace(temp_path, self.path)
+
+    def run(self):
+        while not self._stop_event.wait(self.interval):
+            try:
+                self.export()
+            except OSError as e:
+                self.error = e
+
+    def stop(self):
+        """Stop and write one last time"""
+        self._stop_event.set()
+        try:
+            self.export()
+        except OSError as e:
+            self.error = e
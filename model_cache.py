@@ -0,0 +1,158 @@
+import os
+import threading
+from collections import OrderedDict
+
+# Default memory budget for loaded models; a loaded Vosk model takes roughly
+# as much memory as its files on disk
+DEFAULT_BUDGET_BYTES = 4 * 1024 ** 3
+
+
+def model_disk_size(path):
+    """Total size of the files in a model directory, used as its memory estimate"""
+    total = 0
+    for dirpath, _, filenames in os.walk(path):
+        for name in filenames:
+            try:
+                total += os.path.getsize(os.path.join(dirpath, name))
+            except OSError:
+                pass
+    return total
+
+
+def model_key(path):
+    """Cache key: absolute path plus the newest modification time in the model directory"""
+    path = os.path.abspath(path)
+    mtime = os.stat(path).st_mtime
+    for entry in os.scandir(path):
+        try:
+            mtime = max(mtime, entry.stat().st_mtime)
+        except OSError:
+            pass
+    return path, mtime
+
+
+def format_size(size):
+    for unit in ("B", "KB", "MB"):
+        if size < 1024:
+            return f"{size:.0f} {unit}"
+        size /= 1024
+    return f"{size:.1f} GB"
+
+
+def _load_vosk_model(path):
+    from vosk import Model
+    return Model(path)
+
+
+class ModelCache:
+    """LRU cache of loaded Vosk models keyed by path and modification time.
+
+    Loads run on background threads and concurrent requests for the same
+    model share a single load. Least recently used models are released
+    before a new one is loaded whenever the budget would be exceeded, so
+    switching models does not briefly hold both in memory.
+    """
+
+    def __init__(self, budget_bytes=DEFAULT_BUDGET_BYTES, loader=_load_vosk_model):
+        self.budget_bytes = budget_bytes
+        self.loader = loader
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()   # key -> (model, size)
+        self._loading = {}              # key -> list of callbacks waiting for the load
+        self.hits = 0
+        self.misses = 0
+
+    @property
+    def used_bytes(self):
+        with self._lock:
+            return sum(size for _, size in self._entries.values())
+
+    def get_cached(self, path):
+        """Return the loaded model for path, or None if it is not loaded yet"""
+        key = model_key(path)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[0]
+
+    def is_loading(self, path):
+        with self._lock:
+            return model_key(path) in self._loading
+
+    def load_async(self, path, callback=None):
+        """Load path in the background; callback(model, error) runs on the loader thread.
+
+        A cached model is handed to the callback immediately on the calling thread.
+        """
+        key = model_key(path)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+            elif key in self._loading:
+                if callback:
+                    self._loading[key].append(callback)
+                return
+            else:
+                self.misses += 1
+                self._loading[key] = [callback] if callback else []
+                threading.Thread(target=self._load, args=(key,), daemon=True).start()
+                return
+        if callback:
+            callback(entry[0], None)
+
+    def get(self, path):
+        """Blocking variant of load_async() for scripts and worker threads"""
+        done = threading.Event()
+        outcome = {}
+
+        def on_loaded(model, error):
+            outcome['model'] = model
+            outcome['error'] = error
+            done.set()
+
+        self.load_async(path, on_loaded)
+        done.wait()
+        if outcome['error'] is not None:
+            raise outcome['error']
+        return outcome['model']
+
+    def _load(self, key):
+        path = key[0]
+        model = None
+        error = None
+        try:
+            size = model_disk_size(path)
+            self._make_room(path, size)
+            model = self.loader(path)
+            with self._lock:
+                self._entries[key] = (model, size)
+        except Exception as e:
+            error = e
+        finally:
+            with self._lock:
+                callbacks = self._loading.pop(key, [])
+        for callback in callbacks:
+            callback(model, error)
+
+    def _make_room(self, path, size):
+        """Drop stale versions of path and least recently used models to fit size"""
+        with self._lock:
+            for key in [k for k in self._entries if k[0] == path]:
+                del self._entries[key]
+            used = sum(s for _, s in self._entries.values())
+            while self._entries and used + size > self.budget_bytes:
+                _, (_, evicted_size) = self._entries.popitem(last=False)
+                used -= evicted_size
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+# Shared by everything in the process that needs a model
+model_cache = ModelCache()
@@ -0,0 +1,553 @@
+"""Resumable, verified Vosk model downloads with extraction overlapping the download.
+
+The archive is written to <dest>/<model>.zip.part. A second thread follows
+that file as it grows and unpacks members straight from their local headers
+into a staging directory, so extraction finishes shortly after the last
+byte arrives. Interrupted downloads continue with an HTTP Range request.
+Archives that cannot be streamed (e.g. stored members with data
+descriptors) are extracted after the download, in parallel across members.
+The model only replaces anything in <dest> once its SHA-256 has been
+checked (when a hash is known) and every member's CRC matched.
+
+Usage:
+    python model_download.py vosk-model-small-en-us-0.15 --dest models
+    python model_download.py NAME --base-url http://127.0.0.1:8000 --sha256 <hex>
+"""
+import os
+import sys
+import time
+import zlib
+import shutil
+import struct
+import hashlib
+import argparse
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from urllib.error import HTTPError, URLError
+from urllib.request import Request, urlopen
+import zipfile
+
+# Override to download from a mirror or a local test server
+DEFAULT_BASE_URL = os.environ.get("VOSK_MODEL_BASE_URL", "https://alphacephei.com/vosk/models")
+
+LOCAL_HEADER = b"PK\x03\x04"
+DATA_DESCRIPTOR = b"PK\x07\x08"
+# Anything after the last member: central directory, zip64 end records, end of central directory
+DIRECTORY_SIGNATURES = (b"PK\x01\x02", b"PK\x06\x06", b"PK\x06\x07", b"PK\x05\x06")
+
+
+class DownloadCancelled(Exception):
+    pass
+
+
+class ChecksumMismatch(Exception):
+    pass
+
+
+class StreamingUnsupported(Exception):
+    """The archive needs its central directory to be extracted"""
+
+
+class GrowingFile:
+    """Reads a file that another thread is still appending to"""
+
+    def __init__(self, path):
+        self.path = path
+        self._file = None
+        self._position = 0
+        self._size = 0
+        self._finished = False
+        self._error = None
+        self._cond = threading.Condition()
+
+    def grew(self, size):
+        with self._cond:
+            self._size = size
+            self._cond.notify_all()
+
+    def finish(self, error=None):
+        with self._cond:
+            self._finished = True
+            self._error = error
+            self._cond.notify_all()
+
+    def read(self, n):
+        """Up to n bytes; fewer only at the end of a finished file"""
+        with self._cond:
+            self._cond.wait_for(lambda: self._size - self._position >= n or self._finished)
+            if self._error is not None:
+                raise self._error
+            n = min(n, self._size - self._position)
+        if self._file is None:
+            self._file = open(self.path, 'rb')
+        data = self._file.read(n)
+        self._position += len(data)
+        return data
+
+    def close(self):
+        if self._file:
+            self._file.close()
+            self._file = None
+
+
+class _Reader:
+    """Exact reads with push-back over a GrowingFile"""
+
+    def __init__(self, source):
+        self.source = source
+        self._pending = b""
+        self.position = 0
+
+    def read_some(self, n):
+        if self._pending:
+            data, self._pending = self._pending[:n], self._pending[n:]
+        else:
+            data = self.source.read(n)
+        self.position += len(data)
+        return data
+
+    def read_exact(self, n):
+        parts = []
+        while n > 0:
+            data = self.read_some(n)
+            if not data:
+                raise EOFError("archive ended unexpectedly")
+            parts.append(data)
+            n -= len(data)
+        return b"".join(parts)
+
+    def unread(self, data):
+        self._pending = data + self._pending
+        self.position -= len(data)
+
+
+def safe_member_path(root, name):
+    """Destination for an archive member, refusing absolute paths and '..'"""
+    parts = [p for p in name.replace('\\', '/').split('/') if p not in ('', '.')]
+    if not parts or '..' in parts or ':' in parts[0] or name.startswith(('/', '\\')):
+        raise ValueError(f"unsafe path in archive: {name}")
+    return os.path.join(root, *parts)
+
+
+def stream_extract(source, dest, progress=None, block_size=1 << 20):
+    """Extract a zip from a forward-only stream using local file headers.
+
+    progress(archive_bytes_consumed, extracted_bytes) is called after every
+    member. Raises StreamingUnsupported for archives this cannot handle.
+    """
+    reader = _Reader(source)
+    extracted = 0
+    while True:
+        signature = reader.read_exact(4)
+        if signature in DIRECTORY_SIGNATURES:
+            return extracted
+        if signature != LOCAL_HEADER:
+            raise StreamingUnsupported(f"unexpected record {signature!r} at offset {reader.position - 4}")
+
+        (_, flags, method, _, _, crc, compressed_size, size,
+         name_length, extra_length) = struct.unpack('<HHHHHIIIHH', reader.read_exact(26))
+        raw_name = reader.read_exact(name_length)
+        extra = reader.read_exact(extra_length)
+        name = raw_name.decode('utf-8' if flags & 0x800 else 'cp437')
+        has_descriptor = bool(flags & 0x8)
+        if flags & 0x1:
+            raise StreamingUnsupported(f"{name} is encrypted")
+        if method not in (zipfile.ZIP_STORED, zipfile.ZIP_DEFLATED):
+            raise StreamingUnsupported(f"{name} uses compression method {method}")
+        if has_descriptor and method == zipfile.ZIP_STORED:
+            raise StreamingUnsupported(f"{name} is stored without its size")
+        zip64 = 0xFFFFFFFF in (compressed_size, size) or _has_zip64_extra(extra)
+        if zip64 and not has_descriptor:
+            size, compressed_size = _zip64_sizes(extra, size, compressed_size)
+
+        target = safe_member_path(dest, name)
+        if name.endswith('/'):
+            os.makedirs(target, exist_ok=True)
+            # Directory entries can still carry an (empty) compressed stream
+            target = os.devnull
+        else:
+            os.makedirs(os.path.dirname(target), exist_ok=True)
+        with open(target, 'wb') as out:
+            actual_crc, written = _copy_member(reader, out, method, compressed_size,
+                                               has_descriptor, block_size)
+        if has_descriptor:
+            crc = _read_descriptor(reader, zip64)
+        if actual_crc != crc:
+            raise zipfile.BadZipFile(f"CRC mismatch in {name}")
+        extracted += written
+        if progress:
+            progress(reader.position, extracted)
+
+
+def _has_zip64_extra(extra):
+    offset = 0
+    while offset + 4 <= len(extra):
+        header_id, length = struct.unpack_from('<HH', extra, offset)
+        if header_id == 0x0001:
+            return True
+        offset += 4 + length
+    return False
+
+
+def _zip64_sizes(extra, size, compressed_size):
+    offset = 0
+    while offset + 4 <= len(extra):
+        header_id, length = struct.unpack_from('<HH', extra, offset)
+        if header_id == 0x0001:
+            values = list(struct.unpack_from(f'<{length // 8}Q', extra, offset + 4))
+            if size == 0xFFFFFFFF:
+                size = values.pop(0)
+            if compressed_size == 0xFFFFFFFF:
+                compressed_size = values.pop(0)
+            return size, compressed_size
+        offset += 4 + length
+    raise zipfile.BadZipFile("zip64 sizes missing from local header")
+
+
+def _copy_member(reader, out, method, compressed_size, has_descriptor, block_size):
+    crc = 0
+    written = 0
+    decompressor = zlib.decompressobj(-15) if method == zipfile.ZIP_DEFLATED else None
+    remaining = compressed_size
+    while has_descriptor or remaining > 0:
+        block = reader.read_some(block_size if has_descriptor else min(block_size, remaining))
+        if not block:
+            raise EOFError("archive ended inside a member")
+        remaining -= len(block)
+        data = decompressor.decompress(block) if decompressor else block
+        out.write(data)
+        crc = zlib.crc32(data, crc)
+        written += len(data)
+        if decompressor and decompressor.eof:
+            # The deflate stream marks its own end; the rest belongs to the next record
+            reader.unread(decompressor.unused_data)
+            break
+    if decompressor:
+        tail = decompressor.flush()
+        out.write(tail)
+        crc = zlib.crc32(tail, crc)
+        written += len(tail)
+    return crc, written
+
+
+def _read_descriptor(reader, zip64):
+    first = reader.read_exact(4)
+    crc_bytes = reader.read_exact(4) if first == DATA_DESCRIPTOR else first
+    reader.read_exact(16 if zip64 else 8)
+    return struct.unpack('<I', crc_bytes)[0]
+
+
+def extract_parallel(zip_path, dest, workers=None, progress=None):
+    """Extract with one ZipFile handle per thread; zlib releases the GIL"""
+    with zipfile.ZipFile(zip_path) as archive:
+        members = archive.infolist()
+    for member in members:
+        safe_member_path(dest, member.filename)
+    workers = workers or min(8, os.cpu_count() or 1)
+    # Largest first, dealt round-robin, so the threads finish at about the same time
+    members.sort(key=lambda m: m.file_size, reverse=True)
+    batches = [members[i::workers] for i in range(workers)]
+    lock = threading.Lock()
+    totals = {'extracted': 0}
+
+    def extract_batch(batch):
+        with zipfile.ZipFile(zip_path) as archive:
+            for member in batch:
+                archive.extract(member, dest)
+                with lock:
+                    totals['extracted'] += member.file_size
+                    if progress:
+                        progress(None, totals['extracted'])
+
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        list(executor.map(extract_batch, batches))
+    return totals['extracted']
+
+
+def fetch_expected_sha256(url, timeout=10):
+    """Hash published next to the archive as <url>.sha256, if any"""
+    try:
+        with urlopen(url + ".sha256", timeout=timeout) as response:
+            text = response.read(4096).decode('ascii', 'replace').split()
+    except (HTTPError, URLError, OSError):
+        return None
+    return text[0].lower() if text and len(text[0]) == 64 else None
+
+
+class ModelDownload:
+    """Downloads and installs one model on a worker thread.
+
+    Progress is exposed as attributes (stage, downloaded, total,
+    extracted) for the caller to poll at whatever rate suits its UI;
+    on_message(text) is called from the worker thread.
+    """
+
+    def __init__(self, model_name, dest_dir, base_url=None, sha256=None, retries=5,
+                 block_size=1 << 20, timeout=30, on_message=None):
+        self.model_name = model_name
+        self.dest_dir = dest_dir
+        self.url = f"{(base_url or DEFAULT_BASE_URL).rstrip('/')}/{model_name}.zip"
+        self.expected_sha256 = sha256.lower() if sha256 else None
+        self.retries = retries
+        self.block_size = block_size
+        self.timeout = timeout
+        self.on_message = on_message or (lambda text: None)
+
+        self.part_path = os.path.join(dest_dir, f"{model_name}.zip.part")
+        self.staging_dir = os.path.join(dest_dir, f".{model_name}.partial")
+        self.stage = "pending"
+        self.downloaded = 0
+        self.resumed_from = 0
+        self.total = None
+        self.extracted = 0
+        self.sha256 = None
+        self.model_path = None
+        self.error = None
+        self.started = None
+        self.finished = None
+        self._cancel = threading.Event()
+        self._thread = None
+
+    def start(self):
+        self._thread = threading.Thread(target=self.run, daemon=True)
+        self._thread.start()
+
+    def cancel(self):
+        """Stop at the next block; the partial download is kept for resuming"""
+        self._cancel.set()
+
+    def join(self, timeout=None):
+        if self._thread:
+            self._thread.join(timeout)
+
+    @property
+    def done(self):
+        return self.finished is not None
+
+    @property
+    def download_rate(self):
+        """Bytes per second fetched in this run"""
+        elapsed = (self.finished or time.monotonic()) - self.started if self.started else 0
+        return (self.downloaded - self.resumed_from) / elapsed if elapsed > 0 else 0.0
+
+    def run(self):
+        self.started = time.monotonic()
+        try:
+            os.makedirs(self.dest_dir, exist_ok=True)
+            self.install()
+            self.stage = "done"
+        except DownloadCancelled as e:
+            self.error = e
+            self.stage = "cancelled"
+            self.on_message(f"Download paused at {self.downloaded / 2**20:.0f} MB; start again to resume.")
+        except Exception as e:
+            self.error = e
+            self.stage = "failed"
+            self.on_message(f"Error: {str(e)}")
+        finally:
+            self.finished = time.monotonic()
+
+    def install(self):
+        if self.expected_sha256 is None:
+            self.expected_sha256 = fetch_expected_sha256(self.url)
+        hasher = hashlib.sha256()
+        offset = self._hash_existing(hasher)
+        response = self._open(offset)
+        if offset and not self.resumed_from:
+            hasher = hashlib.sha256()
+
+        shutil.rmtree(self.staging_dir, ignore_errors=True)
+        growing = GrowingFile(self.part_path)
+        extraction = {}
+        extractor = threading.Thread(target=self._extract_stream, args=(growing, extraction), daemon=True)
+        extractor.start()
+        try:
+            self.stage = "downloading"
+            self._download(response, hasher, growing)
+            growing.finish()
+        except BaseException as e:
+            growing.finish(DownloadCancelled() if isinstance(e, DownloadCancelled) else e)
+            raise
+        finally:
+            extractor.join()
+            growing.close()
+
+        self.sha256 = hasher.hexdigest()
+        self.on_message(f"SHA-256 {self.sha256}")
+        if self.expected_sha256 and self.sha256 != self.expected_sha256:
+            os.remove(self.part_path)
+            shutil.rmtree(self.staging_dir, ignore_errors=True)
+            raise ChecksumMismatch(f"SHA-256 mismatch: expected {self.expected_sha256}, got {self.sha256}; "
+                                   f"the corrupt download was deleted")
+        if not self.expected_sha256:
+            self.on_message("No published checksum; verified member CRCs only.")
+
+        error = extraction.get('error')
+        if isinstance(error, StreamingUnsupported):
+            self.on_message(f"Extracting after download ({error})")
+            self.stage = "extracting"
+            shutil.rmtree(self.staging_dir, ignore_errors=True)
+            self.extracted = 0
+            extract_parallel(self.part_path, self.staging_dir, progress=self._extract_progress)
+        elif error is not None:
+            raise error
+
+        self.model_path = self._move_into_place()
+        os.remove(self.part_path)
+        self.on_message(f"Model extracted to {self.model_path}")
+
+    def _hash_existing(self, hasher):
+        """Feed an existing partial download to the hasher; returns its length"""
+        if not os.path.exists(self.part_path):
+            return 0
+        offset = 0
+        with open(self.part_path, 'rb') as f:
+            for block in iter(lambda: f.read(self.block_size), b""):
+                hasher.update(block)
+                offset += len(block)
+        self.on_message(f"Resuming download at {offset / 2**20:.0f} MB")
+        return offset
+
+    def _open(self, offset, restart=True):
+        """Request the archive from offset; returns the response or None if already complete.
+
+        With restart (the first request of a run), a server that ignores the
+        Range header makes the download start over; otherwise (a reconnect)
+        that is an error.
+        """
+        headers = {'Range': f"bytes={offset}-"} if offset else {}
+        try:
+            response = urlopen(Request(self.url, headers=headers), timeout=self.timeout)
+        except HTTPError as e:
+            if e.code == 416 and offset:
+                # Range starts at the end: the previous run had already fetched everything
+                self.total = self.downloaded = offset
+                if restart:
+                    self.resumed_from = offset
+                return None
+            raise
+        if offset and response.status == 206:
+            content_range = response.headers.get('Content-Range', '')
+            start = int(content_range.split()[1].split('-')[0]) if ' ' in content_range else -1
+            if start != offset:
+                response.close()
+                raise IOError(f"server resumed at byte {start} instead of {offset}")
+            total = content_range.rsplit('/', 1)[-1]
+            self.total = int(total) if total.isdigit() else None
+        else:
+            if offset and not restart:
+                response.close()
+                raise IOError("server stopped honouring range requests; cannot resume")
+            if offset:
+                self.on_message("Server does not support resuming; starting over")
+                with open(self.part_path, 'wb'):
+                    pass
+                offset = 0
+            length = response.headers.get('Content-Length')
+            self.total = int(length) if length else None
+        self.downloaded = offset
+        if restart:
+            # Reconnects keep the run's starting point, so download_rate stays right
+            self.resumed_from = offset
+        return response
+
+    def _download(self, response, hasher, growing):
+        growing.grew(self.downloaded)
+        if response is None:
+            return
+        self.on_message(f"Downloading from {self.url}")
+        attempts = 0
+        with open(self.part_path, 'ab') as f:
+            while True:
+                try:
+                    if response is None:
+                        # Reconnecting often fails too right after a drop, so it is retried the same way
+                        response = self._open(self.downloaded, restart=False)
+                        if response is None:
+                            break
+                    block = response.read(self.block_size)
+                    if not block and self.total is not None and self.downloaded < self.total:
+                        raise IOError("connection closed early")
+                except (OSError, URLError) as e:
+                    # Connection dropped: pick up where it stopped
+                    if response is not None:
+                        response.close()
+                        response = None
+                    attempts += 1
+                    if attempts > self.retries:
+                        raise
+                    self.on_message(f"Connection lost ({str(e)}), resuming (attempt {attempts})")
+                    time.sleep(min(2 ** attempts, 30))
+                    continue
+                if not block:
+                    break
+                if self._cancel.is_set():
+                    response.close()
+                    raise DownloadCancelled()
+                f.write(block)
+                f.flush()
+                hasher.update(block)
+                self.downloaded += len(block)
+                growing.grew(self.downloaded)
+        if response is not None:
+            response.close()
+        if self.total is not None and self.downloaded != self.total:
+            raise IOError(f"download ended at {self.downloaded} of {self.total} bytes")
+
+    def _extract_stream(self, growing, extraction):
+        try:
+            stream_extract(growing, self.staging_dir, self._extract_progress, self.block_size)
+        except Exception as e:
+            extraction['error'] = e
+
+    def _extract_progress(self, archive_offset, extracted):
+        self.extracted = extracted
+
+    def _move_into_place(self):
+        """Replace existing copies of the extracted top-level entries; returns the model directory"""
+        entries = os.listdir(self.staging_dir)
+        for entry in entries:
+            target = os.path.join(self.dest_dir, entry)
+            if os.path.isdir(target):
+                shutil.rmtree(target)
+            elif os.path.exists(target):
+                os.remove(target)
+            os.replace(os.path.join(self.staging_dir, entry), target)
+        os.rmdir(self.staging_dir)
+        if self.model_name in entries:
+            return os.path.join(self.dest_dir, self.model_name)
+        return self.dest_dir
+
+    def progress_text(self):
+        if self.stage == "downloading":
+            total = f" of {self.total / 2**20:.0f}" if self.total else ""
+            return (f"Downloaded {self.downloaded / 2**20:.0f}{total} MB at {self.download_rate / 2**20:.1f} MB/s, "
+                    f"extracted {self.extracted / 2**20:.0f} MB")
+        if self.stage == "extracting":
+            return f"Extracted {self.extracted / 2**20:.0f} MB"
+        return self.stage.capitalize()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Download and install a Vosk model")
+    parser.add_argument('model', help="Model name, e.g. vosk-model-small-en-us-0.15")
+    parser.add_argument('--dest', default=os.path.join(os.path.dirname(os.path.abspath(__file__)), "models"))
+    parser.add_argument('--base-url', default=None, help=f"Where <model>.zip is served (default {DEFAULT_BASE_URL})")
+    parser.add_argument('--sha256', default=None, help="Expected SHA-256 of the archive")
+    args = parser.parse_args(argv)
+
+    download = ModelDownload(args.model, args.dest, args.base_url, args.sha256, on_message=print)
+    download.start()
+    try:
+        while not download.done:
+            download.join(1.0)
+            if not download.done:
+                print(download.progress_text())
+    except KeyboardInterrupt:
+        download.cancel()
+        download.join()
+    return 0 if download.stage == "done" else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,222 @@
+import os
+import time
+import heapq
+import threading
+
+from transcription import TranscriptionPipeline
+from latency import DEFAULT_PROFILE
+from metrics import MetricsRegistry
+
+
+class CaptureSource:
+    """One device transcribed by a MultiSourceTranscriber"""
+
+    def __init__(self, name, device_index):
+        self.name = name
+        self.device_index = device_index
+        self.pipeline = None
+        self.finals = 0
+        # Held by the worker currently decoding this source; recognizers are not thread-safe
+        self.lock = threading.Lock()
+
+
+class MultiSourceTranscriber:
+    """Transcribes several capture devices at once with a single loaded model.
+
+    Every source gets its own capture thread, ring buffer, VAD and
+    KaldiRecognizer, but all recognizers share one Model, so memory does not
+    grow with the number of sources. Decoding runs on a bounded pool of
+    worker threads (Vosk releases the GIL while decoding); a source is only
+    ever decoded by one worker at a time. Finals from all sources are merged
+    into one time-ordered stream after a short reordering delay.
+    create_recognizer() may return None when sources only spot keywords.
+
+    Callbacks run on worker threads:
+      on_final(source_name, result, time_base)   time_base + result['start'] is wall-clock time
+      on_partial(source_name, text)
+      on_status(text), on_message(text)
+    """
+
+    def __init__(self, audio, sources, create_recognizer, rate=16000, profile=DEFAULT_PROFILE,
+                 vad_mode="energy", workers=None, merge_delay=1.0, metrics=None, keep_audio=False,
+                 histories=None, create_spotter=None, fingerprint_cache=None, endpoint_seconds=None,
+                 endpoint_mode="final", on_final=None, on_partial=None, on_status=None, on_message=None):
+        self.audio = audio
+        self.sources = [CaptureSource(name, index) for name, index in sources]
+        self.create_recognizer = create_recognizer
+        self.rate = rate
+        self.profile = profile
+        self.vad_mode = vad_mode
+        self.workers = max(1, min(workers or os.cpu_count() or 1, len(self.sources)))
+        self.merge_delay = merge_delay
+        # Attach each final's audio for a second pass (see refinement.Refiner)
+        self.keep_audio = keep_audio
+        # Optional {source name: AudioHistory} recording each source's audio
+        self.histories = histories or {}
+        # Optional create_spotter(source name) -> KeywordSpotter sharing the model
+        self.create_spotter = create_spotter
+        # Optional FingerprintCache shared by all sources, so a repeat is recognized on any of them
+        self.fingerprint_cache = fingerprint_cache
+        # Pause after which a sentence is finalized (None: the profile's) and how
+        self.endpoint_seconds = endpoint_seconds
+        self.endpoint_mode = endpoint_mode
+        # Each source's pipeline records into this registry under a source label
+        self.metrics = metrics or MetricsRegistry()
+        self.on_final = on_final or (lambda *args: None)
+        self.on_partial = on_partial or (lambda *args: None)
+        self.on_status = on_status or (lambda *args: None)
+        self.on_message = on_message or (lambda *args: None)
+
+        self.running = False
+        self.paused = False
+        self._stopped = False
+        self.started_at = None
+        self._data_ready = threading.Event()
+        self._merge_lock = threading.Lock()
+        self._pending = []   # heap of (wall start, sequence, source name, result, time base)
+        self._sequence = 0
+
+    def build_pipelines(self):
+        for source in self.sources:
+            source.pipeline = TranscriptionPipeline(
+                self.audio, source.device_index, self.create_recognizer(),
+                rate=self.rate, profile=self.profile, vad_mode=self.vad_mode,
+                metrics=self.metrics.child(source=source.name), keep_audio=self.keep_audio,
+                history=self.histories.get(source.name),
+                spotter=self.create_spotter(source.name) if self.create_spotter else None,
+                fingerprint_cache=self.fingerprint_cache,
+                endpoint_seconds=self.endpoint_seconds, endpoint_mode=self.endpoint_mode,
+                on_final=lambda result, s=source: self._queue_final(s, result),
+                on_partial=lambda text, s=source: self.on_partial(s.name, text),
+                on_status=self.on_status,
+                on_message=lambda text, s=source: self.on_message(f"[{s.name}] {text}"),
+            )
+            source.pipeline.ring.data_event = self._data_ready
+            if self.paused:
+                source.pipeline.pause()
+
+    def stop(self):
+        self._stopped = True
+        self.running = False
+        for source in self.sources:
+            if source.pipeline:
+                source.pipeline.stop()
+        self._data_ready.set()
+
+    def pause(self):
+        """Stop decoding every source; streams and recognizers stay open"""
+        self.paused = True
+        for source in self.sources:
+            if source.pipeline:
+                source.pipeline.pause()
+
+    def resume(self):
+        self.paused = False
+        for source in self.sources:
+            if source.pipeline:
+                source.pipeline.resume()
+
+    def run(self):
+        """Open all sources, decode until stop() and flush; blocks like TranscriptionPipeline.run()"""
+        self.build_pipelines()
+        opened = []
+        try:
+            for source in self.sources:
+                source.pipeline.open()
+                opened.append(source)
+            self.started_at = time.time()
+            self.running = True
+            if self._stopped:
+                # stop() arrived while the sources were opening
+                self.stop()
+
+            threads = [threading.Thread(target=self._worker, daemon=True) for _ in range(self.workers)]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+
+            for source in opened:
+                source.pipeline.flush()
+                source.pipeline.report_summary()
+            self._release_finals(flush=True)
+            for line in self.stats_lines():
+                self.on_message(line)
+
+        except Exception as e:
+            self.on_message(f"Transcription error: {str(e)}")
+            self.on_status("Error")
+
+        finally:
+            self.running = False
+            for source in opened:
+                source.pipeline.close()
+
+    def time_base(self, name):
+        """Wall-clock start of a source's stream, which its result times are relative to"""
+        for source in self.sources:
+            if source.name == name and source.pipeline:
+                return source.pipeline.started_at
+        return None
+
+    def busy(self, fill_ratio=0.2):
+        """True while any source has more than fill_ratio of its ring buffer waiting"""
+        return self.running and any(s.pipeline.ring.fill_ratio > fill_ratio for s in self.sources)
+
+    def _worker(self):
+        # Keep going until every ring is closed (stop() or end of stream) and drained
+        while any(not s.pipeline.ring.closed or s.pipeline.ready for s in self.sources):
+            self._data_ready.clear()
+            did_work = False
+            for source in self.sources:
+                if not source.pipeline.ready or not source.lock.acquire(blocking=False):
+                    continue
+                try:
+                    did_work = bool(source.pipeline.decode_next(timeout=0)) or did_work
+                finally:
+                    source.lock.release()
+            self._release_finals()
+            if not did_work:
+                self._data_ready.wait(0.1)
+
+    def _queue_final(self, source, result):
+        source.finals += 1
+        time_base = source.pipeline.started_at
+        with self._merge_lock:
+            self._sequence += 1
+            heapq.heappush(self._pending, (time_base + result['start'], self._sequence,
+                                           source.name, result, time_base))
+
+    def _release_finals(self, flush=False):
+        """Emit merged finals in start-time order once they are older than merge_delay"""
+        cutoff = time.time() - self.merge_delay
+        ready = []
+        with self._merge_lock:
+            while self._pending and (flush or self._pending[0][3]['end'] + self._pending[0][4] <= cutoff):
+                ready.append(heapq.heappop(self._pending))
+        for _, _, name, result, time_base in ready:
+            self.on_final(name, result, time_base)
+
+    def source_stats(self):
+        """Per-source throughput: audio decoded, real-time factor, lag and drops"""
+        stats = []
+        elapsed = time.time() - self.started_at if self.started_at else 0.0
+        for source in self.sources:
+            if not source.pipeline:
+                continue
+            snapshot = source.pipeline.stats.snapshot()
+            audio_seconds = snapshot['decoded_frames'] / self.rate
+            stats.append(dict(
+                snapshot,
+                name=source.name,
+                audio_seconds=audio_seconds,
+                throughput=audio_seconds / elapsed if elapsed else 0.0,
+                finals=source.finals,
+            ))
+        return stats
+
+    def stats_lines(self):
+        return [f"[{s['name']}] decoded {s['audio_seconds']:.1f}s, RTF {s['real_time_factor']:.2f}, "
+                f"lag {s['decode_lag']:.2f}s, dropped {s['dropped_frames'] / self.rate:.2f}s, "
+                f"{s['finals']} sentence(s)"
+                for s in self.source_stats()]
@@ -0,0 +1,424 @@
+"""Recognizers running in worker processes, fed through shared memory.
+
+RemoteRecognizer has the KaldiRecognizer methods TranscriptionPipeline and
+the server use, but the model and the decoding live in a separate process.
+Audio is written into a multiprocessing.shared_memory ring and only
+positions cross the pipe, so audio is never pickled; results come back as
+the JSON strings Vosk produces. A recognizer crash or stall therefore cannot
+take down the window, and decoding does not compete for the window's GIL.
+
+A worker that dies or stops answering is restarted. Each recognizer then
+re-opens itself in the new process and replays the audio since its last
+final result from the ring, so the session continues with at most a short
+delay.
+"""
+import os
+import sys
+import json
+import threading
+import multiprocessing
+from multiprocessing import shared_memory
+from multiprocessing.connection import wait
+import numpy as np
+
+# Audio kept per recognizer for replay after a restart
+RING_SECONDS = 60
+# A request that takes longer than this is treated as a hung worker
+STALL_TIMEOUT = 15.0
+# Waiting for a (re)started worker to load its model
+START_TIMEOUT = 300.0
+# Samples fed to the recognizer per call when replaying
+REPLAY_BLOCK = 8000
+
+
+class WorkerDied(Exception):
+    pass
+
+
+def attach_shared_memory(name):
+    """Open a segment created by another process without taking ownership of it.
+
+    Before Python 3.13 attaching registers the segment with the
+    resource_tracker as if this process had created it, which leads to
+    "leaked shared_memory" warnings or an unlink behind the parent's back.
+    Unregistering afterwards is no fix either: the tracker is shared with
+    the parent, so that would drop the parent's own registration.
+    """
+    if sys.version_info >= (3, 13):
+        return shared_memory.SharedMemory(name=name, track=False)
+    if os.name != "posix":
+        # Windows frees a segment with its last handle and never tracks it
+        return shared_memory.SharedMemory(name=name)
+    from multiprocessing import resource_tracker
+    register = resource_tracker.register
+
+    def register_others(resource, rtype):
+        if rtype != "shared_memory":
+            register(resource, rtype)
+
+    resource_tracker.register = register_others
+    try:
+        return shared_memory.SharedMemory(name=name)
+    finally:
+        resource_tracker.register = register
+
+
+class SharedAudioRing:
+    """int16 ring in shared memory. Positions are absolute sample counts.
+
+    The parent writes and a worker process reads by position. Calls are
+    synchronous, so a range is never overwritten while it is being read as
+    long as it is within the last `capacity` samples.
+    """
+
+    def __init__(self, capacity, name=None):
+        self.capacity = int(capacity)
+        if name is None:
+            self.shm = shared_memory.SharedMemory(create=True, size=self.capacity * 2)
+        else:
+            self.shm = attach_shared_memory(name)
+        self.name = self.shm.name
+        self.samples = np.ndarray((self.capacity,), dtype=np.int16, buffer=self.shm.buf)
+        self.write_pos = 0
+
+    def write(self, samples):
+        """Append samples; returns their start position"""
+        samples = samples[-self.capacity:]
+        n = len(samples)
+        start = self.write_pos % self.capacity
+        first = min(n, self.capacity - start)
+        self.samples[start:start + first] = samples[:first]
+        if first < n:
+            self.samples[:n - first] = samples[first:]
+        position = self.write_pos
+        self.write_pos += n
+        return position
+
+    def read_bytes(self, position, n):
+        start = position % self.capacity
+        first = min(n, self.capacity - start)
+        if first == n:
+            return self.samples[start:start + n].tobytes()
+        return self.samples[start:].tobytes() + self.samples[:n - first].tobytes()
+
+    def close(self, unlink=False):
+        self.samples = None
+        self.shm.close()
+        if unlink:
+            self.shm.unlink()
+
+
+def _shift_times(result_json, offset):
+    """Word times of a recognizer opened mid-stream, moved back onto the stream clock"""
+    if not offset:
+        return result_json
+    result = json.loads(result_json)
+    for word in result.get('result', []):
+        word['start'] += offset
+        word['end'] += offset
+    return json.dumps(result)
+
+
+def _merge_results(carried, result_json):
+    """Combine finals produced while replaying with the next result"""
+    if not carried:
+        return result_json
+    results = [json.loads(r) for r in carried] + [json.loads(result_json)]
+    return json.dumps({
+        'text': " ".join(r.get('text', '') for r in results if r.get('text')),
+        'result': [w for r in results for w in r.get('result', [])],
+    })
+
+
+class _Hosted:
+    """Worker-side state of one recognizer"""
+
+    def __init__(self, model, message):
+        from vosk import KaldiRecognizer
+
+        _, _, shm_name, capacity, rate, grammar, words, offset = message[:8]
+        self.ring = SharedAudioRing(capacity, shm_name)
+        if grammar:
+            self.recognizer = KaldiRecognizer(model, rate, grammar)
+        else:
+            self.recognizer = KaldiRecognizer(model, rate)
+        self.recognizer.SetWords(words)
+        self.offset = offset / rate
+        self.carried = []
+
+    def replay(self, position, n):
+        end = position + n
+        while position < end:
+            block = min(REPLAY_BLOCK, end - position)
+            if self.recognizer.AcceptWaveform(self.ring.read_bytes(position, block)):
+                self.carried.append(self.recognizer.Result())
+            position += block
+
+    def result(self, result_json):
+        result_json = _merge_results(self.carried, _shift_times(result_json, self.offset))
+        self.carried = []
+        return result_json
+
+
+def _serve(conn, model_path):
+    """Worker process: load the model once, then answer requests until told to quit"""
+    try:
+        from vosk import Model, SetLogLevel
+        SetLogLevel(-1)
+        model = Model(model_path)
+    except Exception as e:
+        conn.send(("error", f"Could not load model: {str(e)}"))
+        return
+    conn.send(("ready", os.getpid()))
+
+    hosted = {}
+    while True:
+        try:
+            message = conn.recv()
+        except EOFError:
+            break
+        kind, rid = message[0], message[1] if len(message) > 1 else None
+        try:
+            if kind == "quit":
+                break
+            elif kind == "open":
+                if rid in hosted:
+                    hosted.pop(rid).ring.close()
+                hosted[rid] = _Hosted(model, message)
+                if message[9]:
+                    hosted[rid].replay(message[8], message[9])
+                reply = None
+            elif kind == "accept":
+                entry = hosted[rid]
+                accepted = entry.recognizer.AcceptWaveform(entry.ring.read_bytes(message[2], message[3]))
+                reply = (True, entry.result(entry.recognizer.Result())) if accepted else (False, None)
+            elif kind == "partial":
+                reply = hosted[rid].recognizer.PartialResult()
+            elif kind == "final":
+                entry = hosted[rid]
+                reply = entry.result(entry.recognizer.FinalResult())
+            elif kind == "reset":
+                hosted[rid].recognizer.Reset()
+                hosted[rid].carried = []
+                reply = None
+            elif kind == "close":
+                entry = hosted.pop(rid, None)
+                if entry:
+                    entry.ring.close()
+                reply = None
+            else:
+                raise ValueError(f"Unknown request {kind!r}")
+            conn.send(("ok", reply))
+        except Exception as e:
+            conn.send(("error", str(e)))
+    for entry in hosted.values():
+        entry.ring.close()
+
+
+class RecognizerProcess:
+    """One worker process hosting any number of recognizers.
+
+    Requests are serialized: the process decodes one call at a time, like a
+    single decode thread. generation changes on every restart so recognizers
+    know to re-open themselves.
+    """
+
+    def __init__(self, model_path, on_message=None):
+        self.model_path = model_path
+        self.on_message = on_message or (lambda text: None)
+        self.generation = 0
+        self.restarts = 0
+        self.pid = None
+        self._context = multiprocessing.get_context('spawn')
+        self._lock = threading.Lock()
+        self._conn = None
+        self._process = None
+        self._start()
+
+    def _start(self):
+        parent_conn, child_conn = self._context.Pipe()
+        self._process = self._context.Process(target=_serve, args=(child_conn, self.model_path), daemon=True)
+        self._process.start()
+        child_conn.close()
+        self._conn = parent_conn
+        # The worker answers once its model is loaded, or exits
+        ready = wait([parent_conn, self._process.sentinel], START_TIMEOUT)
+        if parent_conn not in ready:
+            self._kill()
+            raise RuntimeError("Recognizer process failed to start")
+        status, detail = parent_conn.recv()
+        if status != "ready":
+            self._kill()
+            raise RuntimeError(detail)
+        self.pid = detail
+        self.generation += 1
+
+    def _kill(self):
+        if self._process is not None and self._process.is_alive():
+            self._process.kill()
+        if self._process is not None:
+            self._process.join()
+        if self._conn is not None:
+            self._conn.close()
+
+    def request(self, *message, generation=None):
+        """Send one request and wait for its reply.
+
+        Raises WorkerDied if the process exits, hangs for STALL_TIMEOUT or
+        was restarted since `generation`.
+        """
+        with self._lock:
+            if generation is not None and generation != self.generation:
+                raise WorkerDied("worker was restarted")
+            try:
+                self._conn.send(message)
+                ready = wait([self._conn, self._process.sentinel], STALL_TIMEOUT)
+                if self._conn not in ready:
+                    raise WorkerDied("no reply" if not ready else "exited")
+                status, reply = self._conn.recv()
+            except (EOFError, OSError) as e:
+                raise WorkerDied(str(e))
+        if status == "error":
+            raise RuntimeError(reply)
+        return reply
+
+    def restart(self, failed_generation):
+        """Replace the worker unless another caller already did"""
+        with self._lock:
+            if failed_generation != self.generation:
+                return
+            exitcode = self._process.exitcode
+            self._kill()
+            self.restarts += 1
+            self.on_message(f"Recognizer process {self.pid} "
+                            f"{'stopped responding' if exitcode is None else f'exited ({exitcode})'}; restarting")
+            self._start()
+
+    def close(self):
+        with self._lock:
+            try:
+                self._conn.send(("quit",))
+            except (OSError, ValueError):
+                pass
+            self._process.join(5)
+            self._kill()
+
+
+class RemoteRecognizer:
+    """KaldiRecognizer-compatible proxy for a recognizer hosted by a RecognizerProcess"""
+
+    def __init__(self, process, rid, rate=16000, grammar=None, ring_seconds=RING_SECONDS):
+        self.process = process
+        self.rid = rid
+        self.rate = rate
+        self.grammar = grammar
+        self.words = False
+        self.ring = SharedAudioRing(rate * ring_seconds)
+        # Ring position after the last final; audio from here on is replayed after a restart
+        self._segment_start = 0
+        # Ring position up to which the worker has decoded
+        self._decoded_pos = 0
+        self._generation = None
+        self._result = None
+        self.replayed_seconds = 0.0
+
+    def _open(self):
+        generation = self.process.generation
+        # The new recognizer starts at replay_start, so its times are offset by that much
+        replay_start = max(self._segment_start, self._decoded_pos - self.ring.capacity)
+        replay = self._decoded_pos - replay_start
+        self.process.request("open", self.rid, self.ring.name, self.ring.capacity, self.rate, self.grammar,
+                             self.words, replay_start, replay_start, replay, generation=generation)
+        self.replayed_seconds += replay / self.rate
+        self._generation = generation
+
+    def _call(self, *message):
+        for _ in range(3):
+            generation = self._generation
+            try:
+                if generation != self.process.generation:
+                    self._open()
+                    generation = self._generation
+                return self.process.request(*message, generation=generation)
+            except WorkerDied:
+                self.process.restart(self.process.generation if generation is None else generation)
+        raise RuntimeError("Recognizer process keeps failing")
+
+    def SetWords(self, words):
+        self.words = bool(words)
+        if self._generation is not None:
+            # Re-open so the worker applies it
+            self._generation = -1
+
+    def AcceptWaveform(self, data):
+        samples = np.frombuffer(data, dtype=np.int16)
+        position = self.ring.write(samples)
+        accepted, result = self._call("accept", self.rid, position, len(samples))
+        self._decoded_pos = self.ring.write_pos
+        if accepted:
+            self._result = result
+            self._segment_start = self._decoded_pos
+        return accepted
+
+    def Result(self):
+        result, self._result = self._result, None
+        return result if result is not None else json.dumps({'text': ""})
+
+    def PartialResult(self):
+        return self._call("partial", self.rid)
+
+    def FinalResult(self):
+        result = self._call("final", self.rid)
+        self._segment_start = self._decoded_pos
+        return result
+
+    def Reset(self):
+        self._call("reset", self.rid)
+        self._segment_start = self._decoded_pos
+        self._result = None
+
+    def close(self):
+        try:
+            if self._generation == self.process.generation:
+                self.process.request("close", self.rid, generation=self._generation)
+        except (WorkerDied, RuntimeError, OSError):
+            pass
+        self.ring.close(unlink=True)
+
+
+class RecognizerProcessPool:
+    """`processes` worker processes, each with its own copy of the model.
+
+    create_recognizer() spreads recognizers over the workers round-robin.
+    """
+
+    def __init__(self, model_path, processes=1, rate=16000, on_message=None):
+        self.model_path = model_path
+        self.rate = rate
+        self.workers = [RecognizerProcess(model_path, on_message) for _ in range(max(1, processes))]
+        self.recognizers = []
+        self._next_id = 0
+        self._lock = threading.Lock()
+
+    def create_recognizer(self, grammar=None):
+        with self._lock:
+            self._next_id += 1
+            process = self.workers[self._next_id % len(self.workers)]
+            recognizer = RemoteRecognizer(process, self._next_id, self.rate, grammar)
+            self.recognizers.append(recognizer)
+        return recognizer
+
+    @property
+    def restarts(self):
+        return sum(w.restarts for w in self.workers)
+
+    def close_recognizers(self):
+        with self._lock:
+            recognizers, self.recognizers = self.recognizers, []
+        for recognizer in recognizers:
+            recognizer.close()
+
+    def close(self):
+        self.close_recognizers()
+        for worker in self.workers:
+            worker.close()
@@ -0,0 +1,217 @@
+"""Second-pass decoding of finalized segments with a larger model.
+
+The live pipeline stays on a small, fast model. Finals that carry their
+audio (TranscriptionPipeline(keep_audio=True)) are queued here and decoded
+again by a larger model on low-priority threads. The queue is bounded: when
+refinement cannot keep up, the oldest waiting segments are dropped rather
+than letting work pile up, and workers pause while the live decoder is
+falling behind, so refinement only ever uses spare CPU.
+"""
+import os
+import sys
+import json
+import time
+import threading
+from collections import deque
+
+from model_cache import model_cache
+from metrics import MetricsRegistry
+
+# Audio fed to the recognizer per call, so a busy live path is noticed mid-segment
+FEED_SECONDS = 1.0
+# How long a worker waits before checking again whether the live path is still busy
+BUSY_BACKOFF = 0.5
+
+# Windows THREAD_PRIORITY_IDLE
+_THREAD_PRIORITY_IDLE = -15
+
+
+def lower_thread_priority():
+    """Best effort: let the calling thread run only when the CPU is otherwise idle"""
+    try:
+        if sys.platform == "win32":
+            import ctypes
+            kernel32 = ctypes.windll.kernel32
+            return bool(kernel32.SetThreadPriority(kernel32.GetCurrentThread(), _THREAD_PRIORITY_IDLE))
+        if sys.platform.startswith("linux"):
+            # Linux applies nice values per thread
+            os.setpriority(os.PRIO_PROCESS, threading.get_native_id(), 19)
+            return True
+    except (OSError, AttributeError):
+        pass
+    return False
+
+
+class RefineJob:
+    def __init__(self, key, audio, context):
+        self.key = key
+        self.audio = audio
+        self.context = context
+        self.queued = time.monotonic()
+
+
+class Refiner:
+    """Re-decodes SegmentAudio with a large model on idle cores.
+
+    submit() never blocks. busy() is polled before and during every job;
+    while it returns True the workers wait. Callbacks run on a worker thread:
+      on_refined(key, result, context)   result is a Vosk-style result with
+                                         stream times, like the live final
+      on_dropped(key, context)           the segment will not be refined
+      on_message(text)
+    """
+
+    def __init__(self, model_path, rate=16000, max_pending=8, workers=1, busy=None, metrics=None,
+                 on_refined=None, on_dropped=None, on_message=None):
+        self.model_path = model_path
+        self.rate = rate
+        self.max_pending = max_pending
+        self.workers = max(1, workers)
+        self.busy = busy or (lambda: False)
+        self.on_refined = on_refined or (lambda key, result, context: None)
+        self.on_dropped = on_dropped or (lambda key, context: None)
+        self.on_message = on_message or (lambda text: None)
+
+        self.model = None
+        self.submitted = 0
+        self.refined = 0
+        self.dropped = 0
+        self._pending = deque()
+        self._cond = threading.Condition()
+        self._stopped = False
+        self._threads = []
+
+        metrics = metrics or MetricsRegistry()
+        self._decode_timer = metrics.histogram("refine_decode_seconds", "Second-pass decode per segment")
+        self._wait_timer = metrics.histogram("refine_queue_wait_seconds", "Segment waiting for refinement")
+        self._depth_gauge = metrics.gauge("refine_queue_depth", "Segments waiting for refinement")
+        self._dropped_counter = metrics.counter("refine_dropped_total", "Segments dropped under load")
+        self._refined_counter = metrics.counter("refine_segments_total", "Segments refined")
+
+    def start(self):
+        for _ in range(self.workers):
+            thread = threading.Thread(target=self._worker, daemon=True)
+            thread.start()
+            self._threads.append(thread)
+
+    def stop(self):
+        """Stop the workers; segments still waiting are dropped"""
+        with self._cond:
+            self._stopped = True
+            dropped, self._pending = list(self._pending), deque()
+            self._cond.notify_all()
+        for job in dropped:
+            self._drop(job)
+
+    @property
+    def depth(self):
+        with self._cond:
+            return len(self._pending)
+
+    def submit(self, key, audio, context=None):
+        """Queue a segment; the oldest waiting one is dropped when the queue is full"""
+        dropped = None
+        with self._cond:
+            if self._stopped:
+                dropped = RefineJob(key, audio, context)
+            else:
+                if len(self._pending) >= self.max_pending:
+                    dropped = self._pending.popleft()
+                self._pending.append(RefineJob(key, audio, context))
+                self.submitted += 1
+                self._depth_gauge.set(len(self._pending))
+                self._cond.notify()
+        if dropped is not None:
+            self._drop(dropped)
+
+    def _drop(self, job):
+        self.dropped += 1
+        self._dropped_counter.inc()
+        self.on_dropped(job.key, job.context)
+
+    def _next_job(self):
+        with self._cond:
+            self._cond.wait_for(lambda: self._stopped or self._pending)
+            if self._stopped:
+                return None
+            job = self._pending.popleft()
+            self._depth_gauge.set(len(self._pending))
+            return job
+
+    def _wait_until_idle(self):
+        """False if stopped while waiting for the live path"""
+        while self.busy():
+            with self._cond:
+                if self._cond.wait_for(lambda: self._stopped, timeout=BUSY_BACKOFF):
+                    return False
+        return not self._stopped
+
+    def _worker(self):
+        lower_thread_priority()
+        try:
+            # Loaded here so a large model never delays the live path or the window
+            self.model = model_cache.get(self.model_path)
+            self.create_recognizer()
+        except Exception as e:
+            self.on_message(f"Refinement disabled: {str(e)}")
+            self.stop()
+            return
+
+        while True:
+            job = self._next_job()
+            if job is None:
+                return
+            try:
+                # A fresh recognizer per segment: Reset() does not rewind a recognizer's word times
+                result = self.decode(self.create_recognizer(), job)
+            except Exception as e:
+                self.on_message(f"Refinement error: {str(e)}")
+                result = None
+            if result is None:
+                self._drop(job)
+                continue
+            self.refined += 1
+            self._refined_counter.inc()
+            self.on_refined(job.key, result, job.context)
+
+    def create_recognizer(self):
+        from vosk import KaldiRecognizer
+        recognizer = KaldiRecognizer(self.model, self.rate)
+        recognizer.SetWords(True)
+        return recognizer
+
+    def decode(self, recognizer, job):
+        """Decode one segment, pausing while the live path is busy; None if stopped"""
+        if not self._wait_until_idle():
+            return None
+        self._wait_timer.observe(time.monotonic() - job.queued)
+        samples = job.audio.samples
+        step = int(self.rate * FEED_SECONDS)
+        decode_seconds = 0.0
+        texts, words = [], []
+        for offset in range(0, len(samples), step):
+            if not self._wait_until_idle():
+                return None
+            start = time.perf_counter()
+            if recognizer.AcceptWaveform(samples[offset:offset + step].tobytes()):
+                self._collect(json.loads(recognizer.Result()), texts, words)
+            decode_seconds += time.perf_counter() - start
+        start = time.perf_counter()
+        self._collect(json.loads(recognizer.FinalResult()), texts, words)
+        self._decode_timer.observe(decode_seconds + time.perf_counter() - start)
+        if not texts:
+            return None
+        audio = job.audio
+        return audio.remap({'text': " ".join(texts), 'result': words},
+                           audio.timeline.to_stream_seconds(audio.fed_start))
+
+    @staticmethod
+    def _collect(result, texts, words):
+        text = result.get('text', '').strip()
+        if text:
+            texts.append(text)
+            words.extend(result.get('result', []))
+
+    def stats_line(self):
+        return (f"Refinement: {self.refined} of {self.submitted} sentence(s) refined, "
+                f"{self.dropped} dropped under load")
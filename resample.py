@@ -0,0 +1,138 @@
+import math
+import time
+import numpy as np
+
+
+def design_lowpass(up, down, taps_per_phase, rolloff=0.9, beta=8.0):
+    """Kaiser-windowed sinc prototype filter for resampling by up/down.
+
+    Returned as a (up, taps_per_phase) polyphase matrix where row p holds the
+    taps h[p], h[p + up], h[p + 2*up], ...
+    """
+    length = up * taps_per_phase
+    # Cutoff in cycles per sample at the upsampled rate
+    cutoff = 0.5 * rolloff / max(up, down)
+    n = np.arange(length) - (length - 1) / 2.0
+    h = 2 * cutoff * np.sinc(2 * cutoff * n) * np.kaiser(length, beta)
+    h *= up / h.sum()
+    return h.reshape(taps_per_phase, up).T.astype(np.float32).copy()
+
+
+class PolyphaseResampler:
+    """Streaming downmix + rational resampler from interleaved int16 to mono int16.
+
+    All working memory (history, gather matrix, filter rows per output and
+    the output buffer) is allocated once for max_input_frames, so process()
+    does not allocate per chunk apart from NumPy's small internal temporaries.
+    """
+
+    def __init__(self, in_rate, out_rate, channels, max_input_frames, taps_per_phase=16):
+        """taps_per_phase is the filter length per output sample when upsampling"""
+        self.in_rate = int(in_rate)
+        self.out_rate = int(out_rate)
+        self.channels = int(channels)
+        self.max_input_frames = int(max_input_frames)
+        g = math.gcd(self.in_rate, self.out_rate)
+        self.up = self.out_rate // g
+        self.down = self.in_rate // g
+        if self.up == self.down:
+            self.taps = 1
+        else:
+            # Decimation needs proportionally longer filters for the same stopband
+            self.taps = int(math.ceil(taps_per_phase * max(1.0, self.down / self.up)))
+        self.passthrough = self.up == self.down and self.channels == 1
+
+        history = self.taps - 1
+        max_out = self.max_input_frames * self.up // self.down + 2
+        # Mono float input with history in front: absolute input index of _ext[0] is _ext_start
+        self._ext = np.zeros(history + self.max_input_frames + self.down + 1, dtype=np.float32)
+        self._ext_len = history
+        self._ext_start = -history
+        self._next_out = 0
+
+        if self.up == self.down:
+            self._phases = np.ones((1, 1), dtype=np.float32)
+        else:
+            self._phases = design_lowpass(self.up, self.down, self.taps)
+
+        # Output j of a cycle reads input (j * down) // up with filter phase (j * down) % up.
+        # Tables cover one full cycle plus a block so any starting phase is a plain slice.
+        j = np.arange(self.up + max_out)
+        rel_input = (j * self.down) // self.up
+        phase = (j * self.down) % self.up
+        self._gather = (rel_input[:, None] - np.arange(self.taps)[None, :]).astype(np.intp)
+        self._rows = self._phases[phase]
+        self._rel_input = rel_input
+
+        self._index = np.empty((max_out, self.taps), dtype=np.intp)
+        self._matrix = np.empty((max_out, self.taps), dtype=np.float32)
+        self._mixed = np.empty(max_out, dtype=np.float32)
+        self._out = np.empty(max_out, dtype=np.int16)
+
+        self.chunks = 0
+        self.seconds = 0.0
+
+    def process(self, data):
+        """Convert one block of interleaved int16 bytes; returns a view valid until the next call"""
+        start = time.perf_counter()
+        samples = np.frombuffer(data, dtype=np.int16)
+        if self.passthrough:
+            self.chunks += 1
+            self.seconds += time.perf_counter() - start
+            return samples
+
+        frames = len(samples) // self.channels
+        if frames > self.max_input_frames:
+            raise ValueError(f"block of {frames} frames exceeds max_input_frames={self.max_input_frames}")
+
+        # Downmix straight into the history buffer
+        target = self._ext[self._ext_len:self._ext_len + frames]
+        if self.channels == 1:
+            target[:] = samples
+        else:
+            np.add.reduce(samples[:frames * self.channels].reshape(frames, self.channels),
+                          axis=1, dtype=np.float32, out=target)
+            target *= 1.0 / self.channels
+        self._ext_len += frames
+        available_end = self._ext_start + self._ext_len   # one past the last absolute input index
+
+        # Outputs whose newest input sample is available
+        cycle = self._next_out % self.up
+        cycle_input = (self._next_out - cycle) // self.up * self.down
+        last_rel = available_end - 1 - cycle_input
+        count = int(np.searchsorted(self._rel_input[cycle:], last_rel, side='right'))
+        count = min(count, len(self._index))
+
+        if count:
+            index = self._index[:count]
+            np.add(self._gather[cycle:cycle + count], cycle_input - self._ext_start, out=index)
+            matrix = self._matrix[:count]
+            np.take(self._ext, index, out=matrix, mode='clip')  # 'raise' would buffer a copy
+            mixed = self._mixed[:count]
+            np.einsum('ij,ij->i', self._rows[cycle:cycle + count], matrix, out=mixed)
+            np.rint(mixed, out=mixed)
+            np.clip(mixed, -32768, 32767, out=mixed)
+            self._out[:count] = mixed
+            self._next_out += count
+
+        # Keep only the history the next output still needs
+        next_cycle = self._next_out % self.up
+        next_input = (self._next_out - next_cycle) // self.up * self.down + self._rel_input[next_cycle]
+        keep_from = min(next_input - (self.taps - 1) - self._ext_start, self._ext_len)
+        if keep_from > 0:
+            remaining = self._ext_len - keep_from
+            self._ext[:remaining] = self._ext[keep_from:self._ext_len]
+            self._ext_len = remaining
+            self._ext_start += keep_from
+
+        self.chunks += 1
+        self.seconds += time.perf_counter() - start
+        return self._out[:count]
+
+    @property
+    def mean_chunk_us(self):
+        return self.seconds / self.chunks * 1e6 if self.chunks else 0.0
+
+    def describe(self):
+        return (f"{self.in_rate} Hz x{self.channels} -> {self.out_rate} Hz mono "
+                f"({self.up}/{self.down}, {self.taps} taps/phase)")
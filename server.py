@@ -0,0 +1,665 @@
+"""Headless streaming recognition server.
+
+Loads one Vosk model and serves any number of clients from it over a plain
+asyncio socket, without the Tk window:
+
+  WebSocket  ws://host:port/?rate=44100
+             Send raw 16-bit mono PCM as binary messages and '{"eof": 1}' when
+             done. Optionally start with
+             '{"config": {"sample_rate": 44100, "words": false}}'.
+             Every partial ({"partial": "..."}) and final result (Vosk result
+             JSON with 'start'/'end' in stream seconds) comes back as a text
+             message; the last message is always a final result.
+  HTTP       POST /transcribe?rate=16000&words=0 with the PCM as the request body
+             (Content-Length or chunked); results stream back as JSON lines.
+             GET /health returns server statistics.
+
+Each session borrows a KaldiRecognizer from a pool sharing the model,
+decoding runs on a bounded thread pool, sessions beyond --max-sessions are
+refused with 503, and a session stops reading its socket while
+--max-pending chunks are waiting to be decoded, so slow decoding pushes back
+on the client through TCP flow control. A sentence is finalized once the
+client's audio pauses for --endpoint seconds; words=0 leaves out per-word
+timing.
+
+Usage:
+    python server.py --model models/vosk-model-small-en-us-0.15 --port 2700
+"""
+import os
+import sys
+import json
+import time
+import base64
+import struct
+import asyncio
+import hashlib
+import argparse
+from urllib.parse import urlsplit, parse_qs
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+
+from transcription import FedTimeline, remap_result_times
+from resample import PolyphaseResampler
+from vad import create_vad, Endpointer, VAD_TYPES
+
+RECOGNIZER_RATE = 16000
+WEBSOCKET_GUID = "258EAFA5-E914-47DA-95CA-C5AB0DC85B11"
+
+OP_CONTINUATION = 0x0
+OP_TEXT = 0x1
+OP_BINARY = 0x2
+OP_CLOSE = 0x8
+OP_PING = 0x9
+OP_PONG = 0xA
+
+HTTP_REASONS = {
+    101: "Switching Protocols", 200: "OK", 400: "Bad Request", 404: "Not Found",
+    405: "Method Not Allowed", 503: "Service Unavailable",
+}
+
+
+class WebSocketError(Exception):
+    def __init__(self, code, reason):
+        super().__init__(reason)
+        self.code = code
+
+
+def apply_mask(payload, mask):
+    """XOR a payload with the 4-byte WebSocket mask"""
+    if not payload:
+        return payload
+    data = np.frombuffer(payload, dtype=np.uint8)
+    key = np.frombuffer(mask * (len(payload) // 4 + 1), dtype=np.uint8)[:len(payload)]
+    return (data ^ key).tobytes()
+
+
+def websocket_accept(key):
+    return base64.b64encode(hashlib.sha1((key + WEBSOCKET_GUID).encode()).digest()).decode()
+
+
+def write_frame(writer, opcode, payload, mask=False):
+    """Write one unfragmented frame in a single write() so frames never interleave"""
+    length = len(payload)
+    mask_bit = 0x80 if mask else 0
+    if length < 126:
+        header = struct.pack('!BB', 0x80 | opcode, mask_bit | length)
+    elif length < 1 << 16:
+        header = struct.pack('!BBH', 0x80 | opcode, mask_bit | 126, length)
+    else:
+        header = struct.pack('!BBQ', 0x80 | opcode, mask_bit | 127, length)
+    if mask:
+        key = os.urandom(4)
+        header += key
+        payload = apply_mask(payload, key)
+    writer.write(header + payload)
+
+
+async def read_frame(reader, max_size):
+    head = await reader.readexactly(2)
+    fin = bool(head[0] & 0x80)
+    opcode = head[0] & 0x0F
+    masked = head[1] & 0x80
+    length = head[1] & 0x7F
+    if length == 126:
+        length = struct.unpack('!H', await reader.readexactly(2))[0]
+    elif length == 127:
+        length = struct.unpack('!Q', await reader.readexactly(8))[0]
+    if length > max_size:
+        raise WebSocketError(1009, "message too big")
+    mask = await reader.readexactly(4) if masked else None
+    payload = await reader.readexactly(length)
+    if mask:
+        payload = apply_mask(payload, mask)
+    return fin, opcode, payload
+
+
+async def read_message(reader, writer, max_size=1 << 20, mask=False):
+    """Read one complete data message, answering pings on the way.
+
+    Returns (opcode, payload); opcode is OP_CLOSE when the peer closed.
+    """
+    opcode = None
+    parts = []
+    size = 0
+    while True:
+        fin, frame_opcode, payload = await read_frame(reader, max_size)
+        if frame_opcode == OP_PING:
+            write_frame(writer, OP_PONG, payload, mask)
+            continue
+        if frame_opcode == OP_PONG:
+            continue
+        if frame_opcode == OP_CLOSE:
+            return OP_CLOSE, payload
+        if frame_opcode == OP_CONTINUATION:
+            if opcode is None:
+                raise WebSocketError(1002, "unexpected continuation frame")
+        elif opcode is not None:
+            raise WebSocketError(1002, "expected continuation frame")
+        else:
+            opcode = frame_opcode
+        size += len(payload)
+        if size > max_size:
+            raise WebSocketError(1009, "message too big")
+        parts.append(payload)
+        if fin:
+            return opcode, b"".join(parts)
+
+
+async def read_http_head(reader):
+    """Parse a request or status line plus headers; header names are lower-cased"""
+    start_line = (await reader.readline()).decode('latin-1').strip()
+    headers = {}
+    while True:
+        line = (await reader.readline()).decode('latin-1')
+        if line in ('\r\n', '\n', ''):
+            break
+        name, _, value = line.partition(':')
+        headers[name.strip().lower()] = value.strip()
+    return start_line, headers
+
+
+def parse_rate(value):
+    """Client sample rate from a query string or config message"""
+    try:
+        rate = int(value)
+    except (TypeError, ValueError):
+        raise ValueError(f"invalid sample rate {value!r}")
+    if rate <= 0:
+        raise ValueError(f"sample rate must be positive, got {rate}")
+    return rate
+
+
+def control_message(payload):
+    """Decode a WebSocket text message, which must be a JSON object"""
+    try:
+        message = json.loads(payload)
+    except ValueError:
+        raise ValueError("text messages must be JSON")
+    if not isinstance(message, dict):
+        raise ValueError("text messages must be JSON objects")
+    return message
+
+
+def http_response(status, body=b"", content_type="application/json", headers=None):
+    lines = [f"HTTP/1.1 {status} {HTTP_REASONS.get(status, '')}"]
+    if content_type and status != 101:
+        lines.append(f"Content-Type: {content_type}")
+    if status != 101 and not (headers and 'Transfer-Encoding' in headers):
+        lines.append(f"Content-Length: {len(body)}")
+    for name, value in (headers or {}).items():
+        lines.append(f"{name}: {value}")
+    return ("\r\n".join(lines) + "\r\n\r\n").encode('latin-1') + body
+
+
+class StreamSession:
+    """Incremental recognition of one client stream.
+
+    Mirrors TranscriptionPipeline for audio pushed by a client: converts the
+    client's rate to the recognizer rate, skips non-speech with the VAD and
+    reports times in stream seconds. accept() and finish() block on the
+    recognizer and are run on the decode thread pool, one call at a time.
+    """
+
+    # Largest block handed to the resampler at once, in input frames
+    MAX_BLOCK_FRAMES = 8192
+
+    def __init__(self, recognizer, rate, input_rate, vad_mode="energy", partial_interval=0.25,
+                 endpoint_seconds=0.0, words=True, time_offset=0.0):
+        self.recognizer = recognizer
+        # Audio the (pooled) recognizer decoded before this session; Reset() does not rewind its clock
+        self.time_offset = time_offset
+        self.words = words
+        if not words:
+            recognizer.SetWords(False)
+        self.rate = rate
+        self.input_rate = input_rate
+        self.resampler = PolyphaseResampler(input_rate, rate, 1, self.MAX_BLOCK_FRAMES)
+        self.vad = create_vad(vad_mode, rate)
+        self.timeline = FedTimeline(rate)
+        self.endpointer = Endpointer(rate, endpoint_seconds)
+        self.partial_samples = int(partial_interval * rate)
+        self.position = 0
+        self.decode_seconds = 0.0
+        self._carry = b""
+        self._last_partial_position = 0
+        self._last_partial = ""
+
+    @property
+    def audio_seconds(self):
+        return self.position / self.rate
+
+    def accept(self, data):
+        """Decode a block of client PCM; returns the messages to send back"""
+        start = time.perf_counter()
+        messages = []
+        data = self._carry + data
+        usable = len(data) - len(data) % 2
+        self._carry = data[usable:]
+        block_bytes = self.MAX_BLOCK_FRAMES * 2
+        for offset in range(0, usable, block_bytes):
+            samples = self.resampler.process(data[offset:min(offset + block_bytes, usable)])
+            self._decode(samples, messages)
+        self.decode_seconds += time.perf_counter() - start
+        return messages
+
+    def _decode(self, samples, messages):
+        n = len(samples)
+        chunk_start = self.position
+        self.position += n
+        speech = self.vad.process(samples)
+        if speech is None:
+            if self.endpointer.due(self.position):
+                # The client paused: finalize now rather than when it speaks again
+                self._last_partial = ""
+                final = self._final(self.recognizer.FinalResult())
+                if final.get('text'):
+                    messages.append(final)
+            return
+        self.timeline.feed(chunk_start + n - len(speech), len(speech))
+        self.endpointer.speech(self.position)
+        if self.recognizer.AcceptWaveform(speech.tobytes()):
+            self._last_partial = ""
+            self.endpointer.reset()
+            messages.append(self._final(self.recognizer.Result()))
+        elif self.position - self._last_partial_position >= self.partial_samples:
+            self._last_partial_position = self.position
+            partial = json.loads(self.recognizer.PartialResult()).get('partial', '')
+            if partial != self._last_partial:
+                self._last_partial = partial
+                messages.append({'partial': partial})
+
+    def finish(self):
+        """Final result for whatever the recognizer still holds"""
+        start = time.perf_counter()
+        result = self._final(self.recognizer.FinalResult())
+        self.decode_seconds += time.perf_counter() - start
+        return result
+
+    @property
+    def fed_seconds(self):
+        return self.timeline.fed_samples / self.rate
+
+    def _final(self, result_json):
+        result = json.loads(result_json)
+        for word in result.get('result', []):
+            word['start'] -= self.time_offset
+            word['end'] -= self.time_offset
+        return remap_result_times(result, self.timeline, self.audio_seconds)
+
+
+class RecognizerPool:
+    """At most `size` recognizers over one model, reset and reused between sessions.
+
+    A recognizer's word times keep counting across Reset(), so the pool
+    remembers how much audio each one has decoded; acquire() returns it
+    with the recognizer as the offset to subtract.
+    """
+
+    def __init__(self, factory, size, executor):
+        self.factory = factory
+        self.size = size
+        self.executor = executor
+        self.created = 0
+        self._idle = []
+        self._slots = None
+
+    async def acquire(self):
+        if self._slots is None:
+            self._slots = asyncio.Semaphore(self.size)
+        await self._slots.acquire()
+        if self._idle:
+            return self._idle.pop()
+        try:
+            recognizer = await asyncio.get_running_loop().run_in_executor(self.executor, self.factory)
+        except Exception:
+            self._slots.release()
+            raise
+        self.created += 1
+        return recognizer, 0.0
+
+    async def release(self, recognizer, offset):
+        """offset: the recognizer's clock in seconds, including the session just ended"""
+        try:
+            await asyncio.get_running_loop().run_in_executor(self.executor, recognizer.Reset)
+            self._idle.append((recognizer, offset))
+        except Exception:
+            # A recognizer that cannot be reset is dropped and recreated on demand
+            self.created -= 1
+        finally:
+            self._slots.release()
+
+    @property
+    def idle(self):
+        return len(self._idle)
+
+
+class RecognitionServer:
+    def __init__(self, recognizer_factory, host="127.0.0.1", port=2700, max_sessions=8, workers=None,
+                 vad_mode="energy", partial_interval=0.25, max_pending=8, idle_timeout=30.0,
+                 max_message_bytes=1 << 20, endpoint_seconds=0.8):
+        self.host = host
+        self.port = port
+        self.max_sessions = max_sessions
+        self.vad_mode = vad_mode
+        self.partial_interval = partial_interval
+        self.max_pending = max_pending
+        self.idle_timeout = idle_timeout
+        self.max_message_bytes = max_message_bytes
+        self.endpoint_seconds = endpoint_seconds
+        # Vosk releases the GIL while decoding, so threads give real parallelism
+        self.executor = ThreadPoolExecutor(max_workers=workers or os.cpu_count() or 1,
+                                           thread_name_prefix="decode")
+        self.pool = RecognizerPool(recognizer_factory, max_sessions, self.executor)
+        self.server = None
+
+        self.started_at = time.time()
+        self.active = 0
+        self.sessions = 0
+        self.rejected = 0
+        self.failed = 0
+        self.audio_seconds = 0.0
+        self.decode_seconds = 0.0
+        self.forced_finals = 0
+
+    async def start(self):
+        self.server = await asyncio.start_server(self.handle_client, self.host, self.port)
+        self.port = self.server.sockets[0].getsockname()[1]
+        return self.server
+
+    async def serve_forever(self):
+        if self.server is None:
+            await self.start()
+        async with self.server:
+            await self.server.serve_forever()
+
+    def close(self):
+        if self.server:
+            self.server.close()
+        self.executor.shutdown(wait=False)
+
+    def stats(self):
+        return {
+            'uptime_seconds': time.time() - self.started_at,
+            'active_sessions': self.active,
+            'max_sessions': self.max_sessions,
+            'sessions': self.sessions,
+            'rejected': self.rejected,
+            'failed': self.failed,
+            'audio_seconds': self.audio_seconds,
+            'decode_seconds': self.decode_seconds,
+            'real_time_factor': self.decode_seconds / self.audio_seconds if self.audio_seconds else 0.0,
+            'forced_finals': self.forced_finals,
+            'recognizers': self.pool.created,
+            'idle_recognizers': self.pool.idle,
+        }
+
+    async def handle_client(self, reader, writer):
+        try:
+            request_line, headers = await asyncio.wait_for(read_http_head(reader), self.idle_timeout)
+            parts = request_line.split()
+            if len(parts) != 3:
+                writer.write(http_response(400, b'{"error": "bad request"}'))
+                return
+            method, target, _ = parts
+            url = urlsplit(target)
+            query = parse_qs(url.query)
+
+            if headers.get('upgrade', '').lower() == 'websocket':
+                await self.handle_websocket(reader, writer, headers, query)
+            elif url.path == '/transcribe':
+                if method != 'POST':
+                    writer.write(http_response(405, b'{"error": "use POST"}'))
+                else:
+                    await self.handle_http(reader, writer, headers, query)
+            elif url.path == '/health':
+                writer.write(http_response(200, json.dumps(self.stats()).encode()))
+            else:
+                writer.write(http_response(404, b'{"error": "not found"}'))
+            await writer.drain()
+
+        except (asyncio.IncompleteReadError, asyncio.TimeoutError, ConnectionError, WebSocketError):
+            # Client went away, stalled or broke the protocol; nothing left to tell it
+            pass
+
+        finally:
+            writer.close()
+
+    def admit(self, writer):
+        """Reserve a session slot, or answer 503 when the server is full"""
+        if self.active >= self.max_sessions:
+            self.rejected += 1
+            writer.write(http_response(503, b'{"error": "server busy"}', headers={'Retry-After': '1'}))
+            return False
+        self.active += 1
+        return True
+
+    def input_rate(self, query, default=RECOGNIZER_RATE):
+        return parse_rate(query.get('rate', [default])[0])
+
+    def word_times(self, query):
+        return query.get('words', ['1'])[0].lower() not in ('0', 'false', 'no')
+
+    async def handle_websocket(self, reader, writer, headers, query):
+        key = headers.get('sec-websocket-key')
+        if not key or headers.get('sec-websocket-version') != '13':
+            writer.write(http_response(400, b'{"error": "unsupported websocket handshake"}'))
+            return
+        try:
+            rate = self.input_rate(query)
+        except ValueError as e:
+            writer.write(http_response(400, json.dumps({'error': str(e)}).encode()))
+            return
+        words = self.word_times(query)
+        if not self.admit(writer):
+            return
+        try:
+            writer.write(http_response(101, content_type=None, headers={
+                'Upgrade': 'websocket',
+                'Connection': 'Upgrade',
+                'Sec-WebSocket-Accept': websocket_accept(key),
+            }))
+            await writer.drain()
+
+            async def next_message():
+                return await asyncio.wait_for(
+                    read_message(reader, writer, self.max_message_bytes), self.idle_timeout)
+
+            async def configure(rate, words):
+                """Configuration may only precede the audio; returns the first audio block too"""
+                while True:
+                    opcode, payload = await next_message()
+                    if opcode == OP_CLOSE:
+                        return None, rate, words, True
+                    if opcode == OP_BINARY:
+                        return payload, rate, words, False
+                    message = control_message(payload)
+                    if 'config' in message:
+                        config = message['config']
+                        if not isinstance(config, dict):
+                            raise ValueError("config must be a JSON object")
+                        rate = parse_rate(config.get('sample_rate', rate))
+                        words = bool(config.get('words', words))
+                    elif message.get('eof'):
+                        return None, rate, words, False
+
+            async def audio():
+                if first is None:
+                    return
+                yield first
+                while True:
+                    opcode, payload = await next_message()
+                    if opcode == OP_BINARY:
+                        yield payload
+                    elif opcode == OP_CLOSE or control_message(payload).get('eof'):
+                        return
+
+            async def send(message):
+                write_frame(writer, OP_TEXT, json.dumps(message).encode())
+                await writer.drain()
+
+            try:
+                first, rate, words, closed = await configure(rate, words)
+                if not closed:
+                    await self.run_session(audio(), send, rate, words)
+                write_frame(writer, OP_CLOSE, struct.pack('!H', 1000))
+            except WebSocketError as e:
+                write_frame(writer, OP_CLOSE, struct.pack('!H', e.code) + str(e).encode())
+            except (ValueError, TypeError, AttributeError, KeyError) as e:
+                # Unusable client data: 1007 (invalid payload) instead of a dead connection task
+                write_frame(writer, OP_CLOSE, struct.pack('!H', 1007) + str(e).encode()[:100])
+        finally:
+            self.active -= 1
+
+    async def handle_http(self, reader, writer, headers, query):
+        try:
+            rate = self.input_rate(query)
+        except ValueError as e:
+            writer.write(http_response(400, json.dumps({'error': str(e)}).encode()))
+            return
+        if not self.admit(writer):
+            return
+        try:
+            writer.write(http_response(200, content_type="application/x-ndjson",
+                                       headers={'Transfer-Encoding': 'chunked'}))
+
+            async def send(message):
+                line = json.dumps(message).encode() + b"\n"
+                writer.write(f"{len(line):x}\r\n".encode() + line + b"\r\n")
+                await writer.drain()
+
+            try:
+                await self.run_session(self.request_body(reader, headers), send, rate, self.word_times(query))
+            except ValueError as e:
+                # Malformed body framing; the 200 is already out, so report it as the last line
+                await send({'error': str(e)})
+            writer.write(b"0\r\n\r\n")
+        finally:
+            self.active -= 1
+
+    async def request_body(self, reader, headers):
+        read = lambda coro: asyncio.wait_for(coro, self.idle_timeout)
+        if headers.get('transfer-encoding', '').lower() == 'chunked':
+            while True:
+                size = int((await read(reader.readline())).split(b';')[0], 16)
+                if size == 0:
+                    await read(read_http_head(reader))   # trailers
+                    return
+                yield await read(reader.readexactly(size))
+                await read(reader.readline())
+        else:
+            remaining = int(headers.get('content-length', 0))
+            while remaining > 0:
+                data = await read(reader.read(min(remaining, 64 * 1024)))
+                if not data:
+                    raise asyncio.IncompleteReadError(b"", remaining)
+                remaining -= len(data)
+                yield data
+
+    async def run_session(self, chunks, send, input_rate, words=True):
+        """Decode an async stream of PCM blocks, sending results as they appear"""
+        loop = asyncio.get_running_loop()
+        recognizer, offset = await self.pool.acquire()
+        session = StreamSession(recognizer, RECOGNIZER_RATE, input_rate, self.vad_mode, self.partial_interval,
+                                self.endpoint_seconds, words, offset)
+        self.sessions += 1
+        # Bounded read-ahead: once it is full the socket is not read until decoding catches up
+        pending = asyncio.Queue(self.max_pending)
+
+        async def read_ahead():
+            try:
+                async for chunk in chunks:
+                    await pending.put(chunk)
+            finally:
+                await pending.put(None)
+
+        reader_task = asyncio.ensure_future(read_ahead())
+        try:
+            while True:
+                chunk = await pending.get()
+                if chunk is None:
+                    break
+                for message in await loop.run_in_executor(self.executor, session.accept, chunk):
+                    await send(message)
+            # Re-raises a read error instead of reporting a truncated stream as complete
+            reader_task.result()
+            await send(await loop.run_in_executor(self.executor, session.finish))
+
+        except Exception:
+            self.failed += 1
+            raise
+
+        finally:
+            reader_task.cancel()
+            self.audio_seconds += session.audio_seconds
+            self.decode_seconds += session.decode_seconds
+            self.forced_finals += session.endpointer.forced
+            if not session.words:
+                recognizer.SetWords(True)   # Pooled recognizers are shared with sessions that want word times
+            await self.pool.release(recognizer, offset + session.fed_seconds)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Serve streaming speech recognition from one shared Vosk model")
+    parser.add_argument('--model', required=True, help="Vosk model directory")
+    parser.add_argument('--host', default="127.0.0.1")
+    parser.add_argument('--port', type=int, default=2700)
+    parser.add_argument('--max-sessions', type=int, default=8,
+                        help="Concurrent sessions (and pooled recognizers); further clients get 503")
+    parser.add_argument('--workers', type=int, default=None, help="Decode threads (default: CPU count)")
+    parser.add_argument('--vad', default="energy", choices=sorted(VAD_TYPES), help="Skip non-speech before decoding")
+    parser.add_argument('--partial-interval', type=float, default=0.25,
+                        help="Seconds of audio between partial results")
+    parser.add_argument('--max-pending', type=int, default=8,
+                        help="Audio messages buffered per session before the socket stops being read")
+    parser.add_argument('--idle-timeout', type=float, default=30.0,
+                        help="Seconds without data before a session is dropped")
+    parser.add_argument('--endpoint', type=float, default=0.8,
+                        help="Seconds of pause after which a sentence is finalized (0: leave it to the recognizer)")
+    parser.add_argument('--processes', type=int, default=0,
+                        help="Decode in this many worker processes (restarted if they crash) instead of in-process")
+    args = parser.parse_args(argv)
+
+    from vosk import KaldiRecognizer, SetLogLevel
+    from model_cache import model_cache
+
+    SetLogLevel(-1)
+    print(f"Loading model {args.model}...")
+    if args.processes > 0:
+        from process_recognizer import RecognizerProcessPool
+        process_pool = RecognizerProcessPool(args.model, args.processes, RECOGNIZER_RATE, on_message=print)
+
+        def create_recognizer():
+            recognizer = process_pool.create_recognizer()
+            recognizer.SetWords(True)
+            return recognizer
+    else:
+        process_pool = None
+        model = model_cache.get(args.model)
+
+        def create_recognizer():
+            recognizer = KaldiRecognizer(model, RECOGNIZER_RATE)
+            recognizer.SetWords(True)
+            return recognizer
+
+    server = RecognitionServer(create_recognizer, args.host, args.port, args.max_sessions, args.workers,
+                               args.vad, args.partial_interval, args.max_pending, args.idle_timeout,
+                               endpoint_seconds=args.endpoint)
+
+    async def serve():
+        await server.start()
+        print(f"Listening on ws://{args.host}:{server.port}/ and http://{args.host}:{server.port}/transcribe")
+        await server.serve_forever()
+
+    try:
+        asyncio.run(serve())
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.close()
+        if process_pool:
+            process_pool.close()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,17 +1,19 @@
 import os
 import sys
-import zipfile
-import tempfile
-from urllib.request import urlretrieve
 import tkinter as tk
-from tkinter import ttk, messagebox
+from tkinter import ttk, messagebox, filedialog
 from tkinter.scrolledtext import ScrolledText
+from model_download import ModelDownload, DEFAULT_BASE_URL
+from ui_queue import UIUpdateQueue
+
+# Progress refresh; the download itself runs on a worker thread
+PROGRESS_POLL_MS = 100
 
 class ModelDownloaderApp:
     def __init__(self, root):
         self.root = root
         self.root.title("Vosk Model Downloader")
-        self.root.geometry("600x400")
+        self.root.geometry("600x480")
         
         # Create main frame
         main_frame = ttk.Frame(root, padding=10)
@@ -49,10 +51,12 @@ class ModelDownloaderApp:
         self.location_var = tk.StringVar(value=self.models_dir)
         ttk.Entry(location_frame, textvariable=self.location_var, width=50).pack(side=tk.LEFT, padx=5, pady=5)
         ttk.Button(location_frame, text="Browse", command=self.browse_location).pack(side=tk.LEFT, padx=5, pady=5)
-
-
-        # add donwload button
-        ttk.Button(main_frame, text="Download", command=self.download_model).pack(pady=10)
+        
+        # Optional checksum; a <model>.zip.sha256 published next to the archive is used otherwise
+        checksum_frame = ttk.LabelFrame(main_frame, text="SHA-256 (optional)", padding=5)
+        checksum_frame.pack(fill=tk.X, pady=5)
+        self.sha256_var = tk.StringVar()
+        ttk.Entry(checksum_frame, textvariable=self.sha256_var, width=70).pack(fill=tk.X, padx=5, pady=5)
         
         # Progress frame
         progress_frame = ttk.LabelFrame(main_frame, text="Progress", padding=5)
@@ -62,16 +66,27 @@ class ModelDownloaderApp:
         self.progress = ttk.Progressbar(progress_frame, orient=tk.HORIZONTAL, length=100, mode='determinate')
         self.progress.pack(fill=tk.X, padx=5, pady=5)
         
+        self.progress_label = ttk.Label(progress_frame, text="")
+        self.progress_label.pack(fill=tk.X, padx=5)
+        
         # Log text area
         self.log = ScrolledText(progress_frame, height=10)
         self.log.pack(fill=tk.BOTH, expand=True, padx=5, pady=5)
         
-        # Download button
-        self.download_button = ttk.Button(main_frame, text="Download", command=self.download_model)
-        self.download_button.pack(pady=10)
+        # Download and cancel buttons
+        button_frame = ttk.Frame(main_frame)
+        button_frame.pack(pady=10)
+        self.download_button = ttk.Button(button_frame, text="Download", command=self.download_model)
+        self.download_button.pack(side=tk.LEFT, padx=5)
+        self.cancel_button = ttk.Button(button_frame, text="Cancel", command=self.cancel_download, state='disabled')
+        self.cancel_button.pack(side=tk.LEFT, padx=5)
+        
+        self.download = None
+        self.messages = UIUpdateQueue()
+        self.root.protocol("WM_DELETE_WINDOW", self.close_window)
     
     def browse_location(self):
-        directory = tk.filedialog.askdirectory(initialdir=self.models_dir, 
+        directory = filedialog.askdirectory(initialdir=self.models_dir, 
                                              title="Select download location")
         if directory:
             self.location_var.set(directory)
@@ -81,7 +96,16 @@ class ModelDownloaderApp:
         self.log.insert(tk.END, message + "\n")
         self.log.see(tk.END)
         self.log.configure(state='disabled')
-        self.root.update()
+    
+    def close_window(self):
+        # A cancelled download keeps its partial file and resumes next time
+        self.cancel_download()
+        self.root.destroy()
+    
+    def cancel_download(self):
+        if self.download and not self.download.done:
+            self.download.cancel()
+            self.cancel_button.configure(state='disabled')
     
     def download_model(self):
         model_name = self.model_var.get()
@@ -97,51 +121,41 @@ class ModelDownloaderApp:
         
         self.log_message(f"Downloading {model_name}...")
         self.download_button.configure(state='disabled')
-        
-        # Download URL
-        url = f"https://alphacephei.com/vosk/models/{model_name}.zip"
-        
-        try:
-            # Progress callback
-            def progress_callback(count, block_size, total_size):
-                percentage = count * block_size * 100 / total_size
-                self.progress['value'] = min(percentage, 100)
-                self.root.update()
-            
-            # Download file
-            temp_zip = os.path.join(tempfile.gettempdir(), f"{model_name}.zip")
-            self.log_message(f"Downloading from {url}")
-            urlretrieve(url, temp_zip, progress_callback)
-            
-            # Extract zip
-            self.log_message("Download complete. Extracting files...")
-            self.progress['value'] = 0
-            
-            with zipfile.ZipFile(temp_zip, 'r') as zip_ref:
-                # Get total size for progress calculation
-                total_size = sum(file.file_size for file in zip_ref.infolist())
-                extracted_size = 0
-                
-                for file in zip_ref.infolist():
-                    zip_ref.extract(file, download_dir)
-                    extracted_size += file.file_size
-                    self.progress['value'] = min(extracted_size * 100 / total_size, 100)
-                    self.root.update()
-            
-            os.remove(temp_zip)
-            
-            self.log_message(f"Model extracted to {download_dir}")
-            self.log_message("Setup complete! You can now start the transcription app.")
-            
+        self.cancel_button.configure(state='normal')
+        self.progress['value'] = 0
+        
+        self.download = ModelDownload(model_name, download_dir, DEFAULT_BASE_URL,
+                                      self.sha256_var.get().strip() or None,
+                                      on_message=self.messages.post_line)
+        self.download.start()
+        self.root.after(PROGRESS_POLL_MS, self.poll_download)
+    
+    def poll_download(self):
+        """Reflect the worker's progress; runs on the Tk thread every PROGRESS_POLL_MS"""
+        download = self.download
+        _, lines, _ = self.messages.drain()
+        for line in lines:
+            self.log_message(line)
+        
+        if download.total:
+            # Extraction trails the download closely, so the bar follows the download
+            self.progress['value'] = min(download.downloaded * 100 / download.total, 100)
+        self.progress_label.configure(text=download.progress_text())
+        
+        if not download.done:
+            self.root.after(PROGRESS_POLL_MS, self.poll_download)
+            return
+        
+        self.download_button.configure(state='normal')
+        self.cancel_button.configure(state='disabled')
+        if download.stage == "done":
+            self.progress['value'] = 100
+            self.log_message(f"Setup complete in {download.finished - download.started:.0f}s! "
+                             f"You can now start the transcription app.")
             messagebox.showinfo("Download Complete", 
-                               f"Model {model_name} has been downloaded and extracted successfully.")
-            
-        except Exception as e:
-            self.log_message(f"Error: {str(e)}")
-            messagebox.showerror("Error", f"An error occurred: {str(e)}")
-        
-        finally:
-            self.download_button.configure(state='normal')
+                               f"Model {download.model_name} has been downloaded and extracted successfully.")
+        elif download.stage == "failed":
+            messagebox.showerror("Error", f"An error occurred: {str(download.error)}")
 
 def main():
     root = tk.Tk()
@@ -0,0 +1,39 @@
+import os
+import sys
+
+import numpy as np
+import pytest
+
+# The modules live at the top level of the repository
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+def speech_like(seconds, seed=0, rate=16000):
+    """Voiced syllables with formants and pauses, a stand-in for recorded speech"""
+    rng = np.random.default_rng(seed)
+    parts = []
+    total = 0
+    while total < seconds * rate:
+        n = int(rng.uniform(0.12, 0.3) * rate)
+        t = np.arange(n) / rate
+        f0 = rng.uniform(100, 250) * np.linspace(1, rng.uniform(0.8, 1.2), n)
+        phase = 2 * np.pi * np.cumsum(f0) / rate
+        f1, f2 = rng.uniform(300, 900), rng.uniform(900, 2500)
+        syllable = np.zeros(n)
+        for k in range(1, 25):
+            fk = f0.mean() * k
+            syllable += (np.exp(-((fk - f1) / 200) ** 2) + 0.6 * np.exp(-((fk - f2) / 300) ** 2) + 0.02) * np.sin(k * phase)
+        syllable *= np.sqrt(np.abs(np.sin(np.pi * t / t[-1]))) * rng.uniform(700, 2000)
+        parts.append(syllable)
+        total += n
+        if rng.random() < 0.3:
+            gap = int(rng.uniform(0.05, 0.2) * rate)
+            parts.append(np.zeros(gap))
+            total += gap
+    x = np.concatenate(parts)[:int(seconds * rate)]
+    return np.clip(x + rng.standard_normal(len(x)) * 20, -32768, 32767).astype(np.int16)
+
+
+@pytest.fixture
+def speech():
+    return speech_like
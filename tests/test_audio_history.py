@@ -0,0 +1,45 @@
+import numpy as np
+
+from audio_history import AudioHistory
+
+RATE = 16000
+
+
+def test_silence_keeps_the_clock_and_overwrites_old_audio(tmp_path):
+    history = AudioHistory(str(tmp_path / "h.pcm"), capacity=RATE, rate=RATE)
+    history.reset(0.0)
+    history.write(np.full(RATE * 3 // 4, 7, dtype=np.int16))
+    history.write_silence(RATE // 2)
+    assert history.end_seconds == 1.25
+
+    samples, start = history.read(0.0, 2.0)
+    # Only the newest second is kept: 0.5 s of audio, then 0.5 s of silence
+    assert start == 0.25
+    assert (samples[:RATE // 2] == 7).all()
+    assert (samples[RATE // 2:] == 0).all()
+
+    history.write_silence(RATE * 3)
+    assert history.end_seconds == 4.25
+    assert not history.read(0.0, 5.0)[0].any()
+
+
+def test_write_longer_than_capacity_keeps_the_stream_clock(tmp_path):
+    history = AudioHistory(str(tmp_path / "h.pcm"), capacity=RATE, rate=RATE)
+    history.reset(0.0)
+    history.write(np.zeros(RATE // 4, dtype=np.int16))
+    history.write(np.arange(RATE * 2, dtype=np.int16))
+    assert history.end_seconds == 2.25
+
+    samples, start = history.read(1.5, 2.0)
+    assert start == 1.5
+    # Stream sample 1.5 s is sample 1.25 s of the long block
+    assert samples.tolist() == list(range(RATE * 5 // 4, RATE * 7 // 4))
+
+
+def test_read_after_close_returns_nothing(tmp_path):
+    history = AudioHistory(str(tmp_path / "h.pcm"), capacity=RATE, rate=RATE)
+    history.reset(0.0)
+    history.write(np.ones(RATE // 2, dtype=np.int16))
+    history.close()
+    samples, _ = history.read(0.0, 1.0)
+    assert len(samples) == 0
@@ -0,0 +1,51 @@
+import threading
+
+import numpy as np
+
+from audio_pipeline import AudioRingBuffer
+
+
+def test_ring_buffer_wraps_around():
+    ring = AudioRingBuffer(10)
+    out = np.zeros(4, dtype=np.int16)
+    for start in range(0, 40, 4):
+        assert ring.write(np.arange(start, start + 4)) == 0
+        assert ring.read_into(out, timeout=0) == 4
+        assert out.tolist() == list(range(start, start + 4))
+        assert ring.last_read_start == start
+    assert ring.fill == 0
+
+
+def test_ring_buffer_drops_oldest_when_full():
+    ring = AudioRingBuffer(8)
+    ring.write(np.arange(6))
+    assert ring.write(np.arange(6, 12)) == 4
+    assert ring.dropped_samples == 4
+    out = np.zeros(8, dtype=np.int16)
+    assert ring.read_into(out, timeout=0) == 8
+    assert out.tolist() == list(range(4, 12))
+    assert ring.last_read_start == 4
+
+
+def test_ring_buffer_write_larger_than_capacity_keeps_newest():
+    ring = AudioRingBuffer(4)
+    assert ring.write(np.arange(10)) == 6
+    out = np.zeros(4, dtype=np.int16)
+    ring.read_into(out, timeout=0)
+    assert out.tolist() == [6, 7, 8, 9]
+
+
+def test_ring_buffer_read_waits_for_data_and_close_drains():
+    ring = AudioRingBuffer(16)
+    out = np.zeros(4, dtype=np.int16)
+    assert ring.read_into(out, timeout=0.01) == 0
+
+    writer = threading.Timer(0.05, ring.write, args=(np.arange(4),))
+    writer.start()
+    assert ring.read_into(out, timeout=5) == 4
+    writer.join()
+
+    ring.write(np.arange(2))
+    ring.close()
+    assert ring.read_into(out, timeout=5) == 2
+    assert ring.read_into(out, timeout=5) == 0
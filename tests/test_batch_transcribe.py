@@ -0,0 +1,43 @@
+import os
+import wave
+
+import numpy as np
+import pytest
+
+from batch_transcribe import file_frame_energy, frame_energy, output_paths, split_at_silence, split_energy
+
+RATE = 16000
+
+
+def write_wav(path, samples, channels=1):
+    with wave.open(str(path), 'wb') as wf:
+        wf.setnchannels(channels)
+        wf.setsampwidth(2)
+        wf.setframerate(RATE)
+        wf.writeframes(samples.astype(np.int16).tobytes())
+
+
+def test_streamed_scan_matches_in_memory_split(tmp_path, speech):
+    samples = np.concatenate([speech(12, seed=i) for i in range(5)])
+    path = tmp_path / "long.wav"
+    write_wav(path, samples)
+    energy, frame_len, total, rate = file_frame_energy(str(path), scan_seconds=7.0)
+    assert np.allclose(energy, frame_energy(samples, RATE)[0])
+    segments = split_energy(energy, frame_len, total, rate, 20.0, 20.0 / 3)
+    assert segments == split_at_silence(samples, RATE, 20.0, 20.0 / 3)
+    assert segments[0][0] == 0 and segments[-1][1] == len(samples)
+    assert all(end - start <= 20 * RATE for start, end in segments)
+    assert all(a[1] == b[0] for a, b in zip(segments, segments[1:]))
+
+
+def test_output_dir_keeps_inputs_apart(tmp_path):
+    out = str(tmp_path / "out")
+    targets = output_paths(["a/x.wav", "b/x.wav"], out, 'txt')
+    assert targets == [os.path.join(out, "a", "x.txt"), os.path.join(out, "b", "x.txt")]
+    assert output_paths(["rec/x.wav"], out, 'json') == [os.path.join(out, "x.json")]
+    assert output_paths(["rec/x.wav"], None, 'txt') == [os.path.abspath("rec/x.txt")]
+
+
+def test_same_input_twice_is_an_error(tmp_path):
+    with pytest.raises(ValueError):
+        output_paths(["a/x.wav", "a/../a/x.wav"], str(tmp_path), 'txt')
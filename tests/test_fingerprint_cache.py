@@ -0,0 +1,116 @@
+import sqlite3
+
+import numpy as np
+import pytest
+
+import fingerprint_cache
+from fingerprint_cache import FingerprintCache, SegmentMatcher, fingerprint, bit_error_rate
+
+RATE = 16000
+CHUNK = 4000
+
+
+@pytest.fixture
+def cache(tmp_path):
+    cache = FingerprintCache(str(tmp_path / "fingerprints.db"), max_entries=10, rate=RATE)
+    cache.start()
+    yield cache
+    cache.close()
+
+
+def feed(matcher, samples):
+    actions = []
+    for i in range(0, len(samples), CHUNK):
+        actions += matcher.accept(samples[i:i + CHUNK])
+    return actions + matcher.resolve()
+
+
+def decoded(actions):
+    return sum(len(a[1]) for a in actions if a[0] == "decode")
+
+
+def test_fingerprint_tolerates_level_changes_and_noise(speech):
+    a = speech(2, seed=1)
+    louder = np.clip(a * 1.8 + np.random.default_rng(0).normal(0, 100, len(a)), -32768, 32767).astype(np.int16)
+    assert bit_error_rate(fingerprint(a), fingerprint(louder)) < 0.15
+    assert bit_error_rate(fingerprint(a), fingerprint(speech(2, seed=2))) > 0.35
+
+
+def test_repeated_sentence_is_reused(cache, speech):
+    sentence = speech(2.5, seed=3)
+    matcher = SegmentMatcher(cache, RATE)
+
+    first = feed(matcher, sentence)
+    assert decoded(first) == len(sentence)
+    words = [{'word': "hello", 'start': 0.1, 'end': 0.9, 'conf': 1.0},
+             {'word': "again", 'start': 1.2, 'end': 2.3, 'conf': 1.0}]
+    matcher.finish_segment({'text': "hello again", 'result': [dict(w) for w in words]})
+    assert len(cache) == 1
+
+    second = feed(matcher, sentence)
+    assert decoded(second) == 0
+    (kind, result), = second
+    assert kind == "hit" and result['cached'] and result['text'] == "hello again"
+    # Times are on the fed clock: the repeat started 2.5 s in
+    assert result['result'][0]['start'] == pytest.approx(2.6, abs=0.05)
+    assert matcher.hits == 1 and matcher.skipped_samples == len(sentence)
+
+
+def test_different_audio_is_decoded(cache, speech):
+    matcher = SegmentMatcher(cache, RATE)
+    feed(matcher, speech(2.5, seed=4))
+    matcher.finish_segment({'text': "stored", 'result': []})
+
+    other = speech(2.5, seed=5)
+    actions = feed(matcher, other)
+    assert decoded(actions) == len(other)
+    assert matcher.hits == 0
+
+
+def test_diverging_repeat_falls_back_to_decoding(cache, speech):
+    sentence = speech(4, seed=6)
+    matcher = SegmentMatcher(cache, RATE)
+    feed(matcher, sentence)
+    matcher.finish_segment({'text': "long sentence", 'result': []})
+
+    # Starts the same, then turns into something else
+    changed = np.concatenate((sentence[:int(1.5 * RATE)], speech(2.5, seed=7)))
+    actions = feed(matcher, changed)
+    assert decoded(actions) == len(changed)
+    assert matcher.hits == 0
+
+
+def test_entries_persist_and_are_evicted(tmp_path, speech):
+    path = str(tmp_path / "fingerprints.db")
+    cache = FingerprintCache(path, max_entries=2, rate=RATE)
+    cache.start()
+    for seed in range(3):
+        cache.add(fingerprint(speech(1, seed=seed)), RATE, {'text': f"s{seed}", 'result': []})
+    cache.close()
+    assert len(cache) == 2
+
+    reopened = FingerprintCache(path, max_entries=2, rate=RATE)
+    assert sorted(e.result['text'] for e in reopened._entries.values()) == ["s1", "s2"]
+
+
+def test_failed_writes_are_retried_and_reported(tmp_path, monkeypatch, speech):
+    monkeypatch.setattr(fingerprint_cache, "RETRY_SECONDS", 0.01)
+    messages = []
+    path = str(tmp_path / "fingerprints.db")
+    cache = FingerprintCache(path, rate=RATE, on_message=messages.append)
+    write_batch = cache._write_batch
+    failures = [2]
+
+    def flaky(conn, batch):
+        if failures[0]:
+            failures[0] -= 1
+            raise sqlite3.OperationalError("database is locked")
+        write_batch(conn, batch)
+
+    cache._write_batch = flaky
+    cache.start()
+    cache.add(fingerprint(speech(1, seed=1)), RATE, {'text': "kept", 'result': []})
+    cache.close()
+    assert cache.lost == 0
+    assert "write failed" in messages[0]
+    assert [e.result['text'] for e in FingerprintCache(path, rate=RATE)._entries.values()] == ["kept"]
@@ -0,0 +1,169 @@
+"""ModelDownload against a local HTTP server standing in for the model site."""
+import io
+import os
+import hashlib
+import zipfile
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+import model_download
+from model_download import ModelDownload, ChecksumMismatch, safe_member_path, stream_extract
+
+MODEL = "vosk-model-test"
+
+
+def make_archive():
+    buffer = io.BytesIO()
+    with zipfile.ZipFile(buffer, 'w', zipfile.ZIP_DEFLATED) as archive:
+        archive.writestr(f"{MODEL}/am/final.mdl", os.urandom(300_000))
+        archive.writestr(f"{MODEL}/conf/model.conf", b"--sample-frequency=16000\n" * 100)
+        archive.writestr(f"{MODEL}/README", b"test model\n")
+    return buffer.getvalue()
+
+
+class ModelServer:
+    """Serves one archive; the behaviour of each request can be scripted.
+
+    script is a list of actions used in order by archive requests (then "ok"):
+      "ok"    honour Range, send everything
+      "drop"  send the headers and half the body, then close the connection
+      "fail"  answer 503
+    """
+
+    def __init__(self, data, honour_range=True, script=()):
+        self.data = data
+        self.honour_range = honour_range
+        self.script = list(script)
+        self.ranges = []
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def log_message(self, *args):
+                pass
+
+            def do_GET(self):
+                if not self.path.endswith(".zip"):
+                    self.send_error(404)
+                    return
+                action = server.script.pop(0) if server.script else "ok"
+                server.ranges.append(self.headers.get('Range'))
+                if action == "fail":
+                    self.send_error(503)
+                    return
+                start = 0
+                range_header = self.headers.get('Range')
+                if server.honour_range and range_header:
+                    start = int(range_header.split('=')[1].split('-')[0])
+                body = server.data[start:]
+                if start:
+                    self.send_response(206)
+                    self.send_header('Content-Range', f"bytes {start}-{len(server.data) - 1}/{len(server.data)}")
+                else:
+                    self.send_response(200)
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                if action == "drop":
+                    self.wfile.write(body[:len(body) // 2])
+                    self.close_connection = True
+                    return
+                self.wfile.write(body)
+
+        self.httpd = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.url = f"http://127.0.0.1:{self.httpd.server_address[1]}"
+        self.thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+
+    def __enter__(self):
+        self.thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+
+@pytest.fixture
+def archive():
+    return make_archive()
+
+
+@pytest.fixture(autouse=True)
+def no_backoff(monkeypatch):
+    monkeypatch.setattr(model_download.time, "sleep", lambda seconds: None)
+
+
+def download(server, dest, sha256=None):
+    job = ModelDownload(MODEL, str(dest), base_url=server.url, sha256=sha256, block_size=16 * 1024, timeout=5)
+    job.run()
+    return job
+
+
+def assert_installed(dest, job):
+    assert job.stage == "done", job.error
+    assert job.model_path == os.path.join(str(dest), MODEL)
+    with open(os.path.join(job.model_path, "README"), 'rb') as f:
+        assert f.read() == b"test model\n"
+    assert not os.path.exists(job.part_path)
+
+
+def test_download_and_extract(tmp_path, archive):
+    with ModelServer(archive) as server:
+        job = download(server, tmp_path, hashlib.sha256(archive).hexdigest())
+    assert_installed(tmp_path, job)
+    assert os.path.getsize(os.path.join(job.model_path, "am", "final.mdl")) == 300_000
+
+
+def test_resume_after_dropped_connection(tmp_path, archive):
+    # The first reconnect fails as well, as is typical right after a drop
+    with ModelServer(archive, script=["drop", "fail", "ok"]) as server:
+        job = download(server, tmp_path, hashlib.sha256(archive).hexdigest())
+    assert_installed(tmp_path, job)
+    assert server.ranges[0] is None
+    assert server.ranges[-1] == f"bytes={len(archive) // 2}-"
+    assert job.resumed_from == 0
+
+
+def test_resume_existing_partial_download(tmp_path, archive):
+    half = len(archive) // 2
+    with open(tmp_path / f"{MODEL}.zip.part", 'wb') as f:
+        f.write(archive[:half])
+    with ModelServer(archive) as server:
+        job = download(server, tmp_path, hashlib.sha256(archive).hexdigest())
+    assert_installed(tmp_path, job)
+    assert server.ranges == [f"bytes={half}-"]
+    assert job.resumed_from == half
+
+
+def test_server_ignoring_range_starts_over(tmp_path, archive):
+    with open(tmp_path / f"{MODEL}.zip.part", 'wb') as f:
+        f.write(archive[:len(archive) // 2])
+    with ModelServer(archive, honour_range=False) as server:
+        job = download(server, tmp_path, hashlib.sha256(archive).hexdigest())
+    assert_installed(tmp_path, job)
+    assert job.sha256 == hashlib.sha256(archive).hexdigest()
+
+
+def test_checksum_mismatch_keeps_nothing(tmp_path, archive):
+    with ModelServer(archive) as server:
+        job = download(server, tmp_path, "0" * 64)
+    assert job.stage == "failed"
+    assert isinstance(job.error, ChecksumMismatch)
+    assert os.listdir(tmp_path) == []
+
+
+def test_unsafe_member_paths_are_refused(tmp_path):
+    for name in ("../evil", "/etc/passwd", "a/../../evil", "C:/evil", "\\evil"):
+        with pytest.raises(ValueError):
+            safe_member_path(str(tmp_path), name)
+    assert safe_member_path(str(tmp_path), "model/./am/final.mdl") == os.path.join(str(tmp_path), "model", "am",
+                                                                                    "final.mdl")
+
+    buffer = io.BytesIO()
+    with zipfile.ZipFile(buffer, 'w') as archive:
+        archive.writestr("../evil.txt", b"outside")
+    buffer.seek(0)
+    dest = tmp_path / "dest"
+    with pytest.raises(ValueError):
+        stream_extract(buffer, str(dest))
+    assert not (tmp_path / "evil.txt").exists()
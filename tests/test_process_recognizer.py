@@ -0,0 +1,52 @@
+import os
+import sys
+import subprocess
+import textwrap
+
+import numpy as np
+
+from process_recognizer import SharedAudioRing
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def test_ring_reads_across_the_wrap():
+    ring = SharedAudioRing(8)
+    try:
+        ring.write(np.arange(6, dtype=np.int16))
+        position = ring.write(np.arange(6, 11, dtype=np.int16))
+        assert position == 6
+        assert np.frombuffer(ring.read_bytes(position, 5), dtype=np.int16).tolist() == [6, 7, 8, 9, 10]
+    finally:
+        ring.close(unlink=True)
+
+
+def test_worker_attach_leaves_the_segment_to_its_creator(tmp_path):
+    # A separate interpreter, so the resource tracker's complaints can be seen on stderr
+    script = textwrap.dedent("""
+        import multiprocessing
+        import numpy as np
+        from process_recognizer import SharedAudioRing
+
+        def attach(name):
+            ring = SharedAudioRing(1000, name)
+            assert ring.samples[:3].tolist() == [0, 1, 2]
+            ring.close()
+
+        if __name__ == "__main__":
+            ring = SharedAudioRing(1000)
+            ring.write(np.arange(5, dtype=np.int16))
+            for _ in range(2):
+                worker = multiprocessing.get_context("spawn").Process(target=attach, args=(ring.name,))
+                worker.start()
+                worker.join()
+                assert worker.exitcode == 0
+            assert ring.samples[:3].tolist() == [0, 1, 2]
+            ring.close(unlink=True)
+    """)
+    path = tmp_path / "attach.py"
+    path.write_text(script)
+    done = subprocess.run([sys.executable, str(path)], cwd=ROOT, capture_output=True, text=True, timeout=60,
+                          env=dict(os.environ, PYTHONPATH=ROOT))
+    assert done.returncode == 0, done.stderr
+    assert "leaked" not in done.stderr and "Traceback" not in done.stderr, done.stderr
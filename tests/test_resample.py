@@ -0,0 +1,56 @@
+import numpy as np
+import pytest
+
+from resample import PolyphaseResampler
+
+
+def tone(frequency, seconds, rate, channels=1, amplitude=8000):
+    t = np.arange(int(seconds * rate)) / rate
+    mono = (amplitude * np.sin(2 * np.pi * frequency * t)).astype(np.int16)
+    return np.repeat(mono, channels)
+
+
+def run_blocks(resampler, samples, channels, block_frames):
+    out = []
+    for i in range(0, len(samples), block_frames * channels):
+        out.append(resampler.process(samples[i:i + block_frames * channels].tobytes()).copy())
+    return np.concatenate(out)
+
+
+def dominant_frequency(samples, rate):
+    spectrum = np.abs(np.fft.rfft(samples * np.hanning(len(samples))))
+    return np.fft.rfftfreq(len(samples), 1 / rate)[np.argmax(spectrum)]
+
+
+def test_passthrough_returns_input():
+    resampler = PolyphaseResampler(16000, 16000, 1, 1024)
+    assert resampler.passthrough
+    samples = tone(440, 0.05, 16000)
+    assert np.array_equal(resampler.process(samples.tobytes()), samples)
+
+
+@pytest.mark.parametrize("in_rate,channels", [(48000, 2), (44100, 2), (8000, 1), (22050, 1)])
+def test_output_length_and_pitch(in_rate, channels):
+    resampler = PolyphaseResampler(in_rate, 16000, channels, 4096)
+    out = run_blocks(resampler, tone(1000, 1.0, in_rate, channels), channels, 1000)
+    assert abs(len(out) - 16000) <= resampler.taps
+    assert abs(dominant_frequency(out[1000:], 16000) - 1000) < 10
+
+
+def test_block_size_does_not_change_output():
+    samples = tone(700, 0.5, 44100, 2)
+    a = run_blocks(PolyphaseResampler(44100, 16000, 2, 4096), samples, 2, 4096)
+    b = run_blocks(PolyphaseResampler(44100, 16000, 2, 4096), samples, 2, 333)
+    assert np.array_equal(a, b)
+
+
+def test_rejects_components_above_the_new_nyquist():
+    out = run_blocks(PolyphaseResampler(48000, 16000, 1, 4096), tone(12000, 1.0, 48000), 1, 4096)
+    # 12 kHz would alias to 4 kHz without the low-pass filter
+    assert np.abs(out[1000:]).max() < 200
+
+
+def test_block_larger_than_max_input_frames_is_an_error():
+    resampler = PolyphaseResampler(48000, 16000, 1, 100)
+    with pytest.raises(ValueError):
+        resampler.process(np.zeros(200, dtype=np.int16).tobytes())
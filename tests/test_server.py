@@ -0,0 +1,106 @@
+"""RecognitionServer against bad client input, with a stand-in recognizer."""
+import json
+import struct
+import asyncio
+
+import pytest
+
+from server import (RecognitionServer, OP_BINARY, OP_TEXT, OP_CLOSE, read_http_head, read_message,
+                    write_frame)
+
+
+class FakeRecognizer:
+    def SetWords(self, words):
+        pass
+
+    def AcceptWaveform(self, data):
+        return False
+
+    def PartialResult(self):
+        return '{"partial": ""}'
+
+    def FinalResult(self):
+        return '{"text": ""}'
+
+    def Reset(self):
+        pass
+
+
+def serve(client):
+    """Run client(port) against a fresh server and return what it returns"""
+    async def main():
+        server = RecognitionServer(FakeRecognizer, port=0, workers=1, idle_timeout=5)
+        await server.start()
+        try:
+            return await client(server.port), server
+        finally:
+            server.close()
+    return asyncio.run(main())
+
+
+async def http_status(port, target):
+    reader, writer = await asyncio.open_connection("127.0.0.1", port)
+    writer.write(f"POST {target} HTTP/1.1\r\nHost: x\r\nContent-Length: 4\r\n\r\n".encode() + b"\0" * 4)
+    status_line, _ = await read_http_head(reader)
+    body = await reader.read()
+    writer.close()
+    return int(status_line.split()[1]), body
+
+
+async def websocket(port, messages, query="?rate=16000"):
+    """Send messages after the handshake; returns the close code, or the handshake status if refused"""
+    reader, writer = await asyncio.open_connection("127.0.0.1", port)
+    writer.write((f"GET /{query} HTTP/1.1\r\nHost: x\r\nUpgrade: websocket\r\nConnection: Upgrade\r\n"
+                  "Sec-WebSocket-Key: dGhlIHNhbXBsZSBub25jZQ==\r\nSec-WebSocket-Version: 13\r\n\r\n").encode())
+    status_line, _ = await read_http_head(reader)
+    status = int(status_line.split()[1])
+    if status != 101:
+        writer.close()
+        return status
+    for opcode, payload in messages:
+        write_frame(writer, opcode, payload, mask=True)
+    while True:
+        opcode, payload = await read_message(reader, writer)
+        if opcode == OP_CLOSE:
+            writer.close()
+            return struct.unpack('!H', payload[:2])[0]
+
+
+@pytest.mark.parametrize("rate", ["abc", "0", "-8000"])
+def test_http_bad_rate_is_rejected(rate):
+    (status, body), server = serve(lambda port: http_status(port, f"/transcribe?rate={rate}"))
+    assert status == 400
+    assert "rate" in json.loads(body)['error']
+    assert server.active == 0
+
+
+def test_http_session_completes():
+    (status, body), server = serve(lambda port: http_status(port, "/transcribe?rate=8000"))
+    assert status == 200
+    assert server.sessions == 1 and server.failed == 0
+
+
+def test_websocket_bad_rate_is_refused():
+    status, _ = serve(lambda port: websocket(port, [], query="?rate=0"))
+    assert status == 400
+
+
+@pytest.mark.parametrize("text", [b"not json", b"[1, 2]", b'"eof"', b'{"config": 5}',
+                                  b'{"config": {"sample_rate": 0}}', b'{"config": {"sample_rate": "fast"}}'])
+def test_websocket_bad_message_closes_with_1007(text):
+    code, server = serve(lambda port: websocket(port, [(OP_TEXT, text)]))
+    assert code == 1007
+    assert server.active == 0
+
+
+def test_websocket_bad_message_after_audio_closes_with_1007():
+    code, _ = serve(lambda port: websocket(port, [(OP_BINARY, b"\0" * 640), (OP_TEXT, b"[]")]))
+    assert code == 1007
+
+
+def test_websocket_session_completes():
+    messages = [(OP_TEXT, b'{"config": {"sample_rate": 8000}}'), (OP_BINARY, b"\0" * 640),
+                (OP_TEXT, b'{"eof": 1}')]
+    code, server = serve(lambda port: websocket(port, messages))
+    assert code == 1000
+    assert server.sessions == 1 and server.failed == 0
@@ -0,0 +1,54 @@
+import sqlite3
+
+import transcript_store
+from transcript_store import TranscriptStore
+
+
+def segment(i, **fields):
+    return dict({'session': "s", 'source': "system", 'start_time': float(i), 'end_time': i + 1.0,
+                 'text': f"segment {i}", 'words': []}, **fields)
+
+
+def test_failed_writes_are_retried_and_reported(tmp_path, monkeypatch):
+    monkeypatch.setattr(transcript_store, "RETRY_SECONDS", 0.01)
+    messages = []
+    store = TranscriptStore(str(tmp_path / "t.db"), commit_interval=0.01, on_message=messages.append)
+    write_batch = store._write_batch
+    failures = [2]
+
+    def flaky(conn, batch):
+        if failures[0]:
+            failures[0] -= 1
+            raise sqlite3.OperationalError("database is locked")
+        write_batch(conn, batch)
+
+    store._write_batch = flaky
+    store.start()
+    store.append(segment(1))
+    store.append(segment(2))
+    store.close()
+    assert sorted(row['text'] for row in store.recent()) == ["segment 1", "segment 2"]
+    assert store.lost == 0
+    assert "write failed" in messages[0]
+
+
+def test_unsavable_segment_does_not_take_the_batch_with_it(tmp_path):
+    messages = []
+    store = TranscriptStore(str(tmp_path / "t.db"), on_message=messages.append)
+    store.start()
+    store.append(segment(1))
+    store.append(segment(2, start_time=None))
+    store.append(segment(3))
+    store.close()
+    assert sorted(row['text'] for row in store.recent()) == ["segment 1", "segment 3"]
+    assert store.lost == 1 and len(messages) == 1
+
+
+def test_search_finds_replaced_text(tmp_path):
+    store = TranscriptStore(str(tmp_path / "t.db"), commit_interval=0.01)
+    store.start()
+    store.append(segment(1, text="quarterly numbers look fine"))
+    store.replace(segment(1, text="quarterly numbers look great"), 1.0)
+    store.close()
+    assert [row['text'] for row in store.search("great")] == ["quarterly numbers look great"]
+    assert store.search("fine") == []
@@ -0,0 +1,48 @@
+import numpy as np
+import pytest
+
+from transcription import FedTimeline, SegmentAudio, remap_result_times
+
+RATE = 16000
+
+
+def timeline_with_gap():
+    # 1 s of speech, 2 s skipped by the VAD, then 1 s more
+    timeline = FedTimeline(RATE)
+    timeline.feed(0, RATE)
+    timeline.feed(3 * RATE, RATE)
+    return timeline
+
+
+def test_fed_time_maps_across_skipped_gaps():
+    timeline = timeline_with_gap()
+    assert timeline.fed_samples == 2 * RATE
+    assert timeline.to_stream_seconds(0.5) == 0.5
+    assert timeline.to_stream_seconds(1.5) == 3.5
+
+
+def test_contiguous_feeds_add_no_discontinuity():
+    timeline = FedTimeline(RATE)
+    for start in range(0, 4 * RATE, RATE // 4):
+        timeline.feed(start, RATE // 4)
+    assert timeline.to_stream_seconds(3.9) == pytest.approx(3.9)
+
+
+def test_remap_result_times():
+    result = {'text': "a b", 'result': [{'word': "a", 'start': 0.2, 'end': 0.6},
+                                         {'word': "b", 'start': 1.1, 'end': 1.4}]}
+    remap_result_times(result, timeline_with_gap(), default_time=9.0)
+    assert (result['start'], result['end']) == (0.2, pytest.approx(3.4))
+    assert result['result'][1]['start'] == pytest.approx(3.1)
+
+    empty = remap_result_times({'text': ""}, timeline_with_gap(), default_time=9.0)
+    assert empty['start'] == empty['end'] == 9.0
+
+
+def test_segment_audio_remap_offsets_a_second_pass():
+    # The segment starts 0.8 s into the fed audio; a second decoder sees only its samples
+    audio = SegmentAudio(np.zeros(RATE, dtype=np.int16), 0.8, timeline_with_gap())
+    assert audio.duration == 1.0
+    result = audio.remap({'text': "b", 'result': [{'word': "b", 'start': 0.1, 'end': 0.5}]}, default_time=0.0)
+    assert result['start'] == pytest.approx(0.9)
+    assert result['end'] == pytest.approx(3.3)
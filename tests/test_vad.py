@@ -0,0 +1,88 @@
+import numpy as np
+
+from vad import EnergyVAD, Endpointer, create_vad
+
+RATE = 16000
+CHUNK = 4000
+
+
+def chunks(samples):
+    return [samples[i:i + CHUNK] for i in range(0, len(samples), CHUNK)]
+
+
+def detected(vad, samples):
+    return [vad.process(chunk) is not None for chunk in chunks(samples)]
+
+
+def test_silence_is_skipped():
+    vad = EnergyVAD(RATE)
+    assert not any(detected(vad, np.zeros(RATE * 2, dtype=np.int16)))
+    assert vad.stats.skipped_ratio == 1.0
+
+
+def test_speech_passes(speech):
+    vad = EnergyVAD(RATE)
+    quiet = np.random.default_rng(1).normal(0, 20, RATE).astype(np.int16)
+    results = detected(vad, np.concatenate((quiet, speech(3))))
+    assert not any(results[:4])
+    assert all(results[5:])
+
+
+def test_broadband_noise_is_skipped():
+    vad = EnergyVAD(RATE)
+    noise = np.random.default_rng(2).normal(0, 3000, RATE * 3).astype(np.int16)
+    assert sum(detected(vad, noise)) <= 1
+
+
+def test_sustained_music_is_skipped():
+    # Held three-note chords with harmonics, changing every half second
+    rng = np.random.default_rng(3)
+    t = np.arange(RATE // 2) / RATE
+    chords = []
+    for _ in range(10):
+        chord = sum(np.sin(2 * np.pi * f * k * t) / k
+                    for f in rng.choice([220.0, 261.6, 329.6, 392.0, 440.0, 523.3], 3, replace=False)
+                    for k in range(1, 6))
+        chords.append(chord * 1500)
+    music = np.concatenate(chords).astype(np.int16)
+    results = detected(EnergyVAD(RATE), music)
+    # Its onset looks like a syllable; once the modulation window is full it is skipped
+    assert not any(results[6:])
+
+
+def test_preroll_is_replayed_at_speech_onset(speech):
+    vad = EnergyVAD(RATE, preroll_ms=300)
+    vad.process(np.zeros(CHUNK, dtype=np.int16))
+    output = vad.process(speech(1)[:CHUNK])
+    # Only one silent chunk arrived before, less than the 300 ms pre-roll
+    assert output is not None
+    assert len(output) == 2 * CHUNK
+    assert vad.stats.replayed_samples == CHUNK
+
+
+def test_passthrough_vad():
+    vad = create_vad("off", RATE)
+    samples = np.zeros(CHUNK, dtype=np.int16)
+    assert vad.process(samples) is samples
+
+
+def test_endpointer_fires_once_after_the_pause():
+    endpointer = Endpointer(RATE, 0.5)
+    assert not endpointer.due(RATE)
+    endpointer.speech(RATE)
+    assert not endpointer.due(RATE + RATE // 4)
+    assert endpointer.due(RATE + RATE // 2)
+    assert not endpointer.due(RATE * 3)
+    assert endpointer.forced == 1
+
+
+def test_endpointer_reset_and_disabled():
+    endpointer = Endpointer(RATE, 0.5)
+    endpointer.speech(RATE)
+    endpointer.reset()
+    assert not endpointer.due(RATE * 3)
+
+    off = Endpointer(RATE, 0)
+    off.speech(RATE)
+    assert not off.due(RATE * 100)
+    assert off.pause_seconds == 0
@@ -0,0 +1,300 @@
+"""Persistent, searchable store of finalized transcript segments.
+
+Segments are appended to an SQLite database with an FTS5 full-text index.
+Writes go through a background thread that commits in groups, so the decode
+thread only ever enqueues. A batch that fails (database locked, disk full)
+is kept and retried with a growing delay instead of being dropped.
+
+Usage:
+    python transcript_store.py search "quarterly numbers" --days 7
+    python transcript_store.py recent --limit 20
+"""
+import os
+import sys
+import json
+import time
+import queue
+import sqlite3
+import argparse
+import threading
+
+from app_paths import data_dir
+
+# Delay before retrying a failed write, doubled up to the maximum while it keeps failing
+RETRY_SECONDS = 1.0
+MAX_RETRY_SECONDS = 30.0
+# Segments kept for retrying at most; the oldest are given up beyond this
+MAX_UNSAVED = 10000
+# Attempts to save what is still unsaved when the store is closed
+SHUTDOWN_ATTEMPTS = 3
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS segments (
+    id INTEGER PRIMARY KEY,
+    session TEXT NOT NULL,
+    source TEXT NOT NULL,
+    start_time REAL NOT NULL,
+    end_time REAL NOT NULL,
+    text TEXT NOT NULL,
+    words TEXT
+);
+CREATE INDEX IF NOT EXISTS segments_start_time ON segments(start_time);
+CREATE VIRTUAL TABLE IF NOT EXISTS segments_fts USING fts5(
+    text, content='segments', content_rowid='id'
+);
+"""
+
+
+def default_db_path():
+    return os.path.join(data_dir(), "transcripts.db")
+
+
+def segment_from_result(result, time_base, session, source="system"):
+    """Build a storable segment from a final result of TranscriptionPipeline.
+
+    Times in the result are seconds since the stream started; time_base is
+    the wall-clock time at which it started.
+    """
+    words = [
+        {'word': w['word'], 'start': time_base + w['start'], 'end': time_base + w['end'],
+         'conf': w.get('conf', 1.0)}
+        for w in result.get('result', [])
+    ]
+    return {
+        'session': session,
+        'source': source,
+        'start_time': time_base + result['start'],
+        'end_time': time_base + result['end'],
+        'text': result.get('text', '').strip(),
+        'words': words,
+    }
+
+
+class TranscriptStore:
+    """Append-only segment store with group-commit writes and full-text search"""
+
+    def __init__(self, path=None, commit_interval=0.5, max_batch=256, on_message=None):
+        self.path = path or default_db_path()
+        self.commit_interval = commit_interval
+        self.max_batch = max_batch
+        # on_message(text) reports write failures and recoveries from the writer thread
+        self.on_message = on_message or (lambda text: None)
+        self._queue = queue.Queue()
+        self._writer = None
+        self.written = 0
+        self.commits = 0
+        self.lost = 0
+        self.error = None
+
+        conn = self._connect()
+        conn.executescript(SCHEMA)
+        conn.close()
+
+    def _connect(self):
+        conn = sqlite3.connect(self.path, timeout=10)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        conn.row_factory = sqlite3.Row
+        return conn
+
+    def start(self):
+        if self._writer is None:
+            self._writer = threading.Thread(target=self._write_loop, daemon=True)
+            self._writer.start()
+
+    def append(self, segment):
+        """Queue a segment for writing; never blocks on disk I/O"""
+        if segment['text']:
+            self._queue.put(segment)
+
+    def replace(self, segment, start_time):
+        """Queue a new version of the stored segment of the same session and source starting at start_time"""
+        if segment['text']:
+            self._queue.put(dict(segment, replaces=start_time))
+
+    def close(self):
+        """Flush queued segments and stop the writer"""
+        if self._writer is not None:
+            self._queue.put(None)
+            self._writer.join()
+            self._writer = None
+
+    def _write_loop(self):
+        conn = self._connect()
+        unsaved = []   # segments of failed writes, retried ahead of newer ones
+        retry = RETRY_SECONDS
+        running = True
+        try:
+            while running:
+                try:
+                    batch = [self._queue.get(timeout=retry if unsaved else None)]
+                except queue.Empty:
+                    batch = []
+                # Collect whatever else arrives within the commit interval
+                deadline = time.monotonic() + self.commit_interval
+                while batch and len(batch) < self.max_batch:
+                    timeout = deadline - time.monotonic()
+                    if timeout <= 0:
+                        break
+                    try:
+                        batch.append(self._queue.get(timeout=timeout))
+                    except queue.Empty:
+                        break
+                if None in batch:
+                    running = False
+                    batch = [s for s in batch if s is not None]
+                batch = unsaved + batch
+                if not batch:
+                    continue
+                try:
+                    self._write_batch(conn, batch)
+                except sqlite3.Error as e:
+                    unsaved = self._failed(conn, batch, e, first=not unsaved)
+                    retry = min(retry * 2, MAX_RETRY_SECONDS)
+                    continue
+                if unsaved:
+                    self.on_message(f"Transcript store: saved {len(unsaved)} delayed segment(s)")
+                    self.error = None
+                unsaved = []
+                retry = RETRY_SECONDS
+            for _ in range(SHUTDOWN_ATTEMPTS):
+                if not unsaved:
+                    break
+                # A few last attempts at shutdown; after that they are gone
+                time.sleep(RETRY_SECONDS)
+                try:
+                    self._write_batch(conn, unsaved)
+                    unsaved = []
+                except sqlite3.Error as e:
+                    self.error = e
+            if unsaved:
+                self.lost += len(unsaved)
+                self.on_message(f"Transcript store: {len(unsaved)} segment(s) could not be saved ({str(self.error)})")
+        finally:
+            conn.close()
+
+    def _failed(self, conn, batch, error, first):
+        """Segments of a failed batch that are worth retrying"""
+        self.error = error
+        if not isinstance(error, sqlite3.OperationalError):
+            # Not a passing condition like a lock or a full disk: save what can be saved one by one
+            keep = []
+            for segment in batch:
+                try:
+                    self._write_batch(conn, [segment])
+                except sqlite3.OperationalError:
+                    keep.append(segment)
+                except sqlite3.Error as e:
+                    self.lost += 1
+                    self.on_message(f"Transcript store: dropped a segment that cannot be saved ({str(e)})")
+            batch = keep
+        if len(batch) > MAX_UNSAVED:
+            self.lost += len(batch) - MAX_UNSAVED
+            self.on_message(f"Transcript store: gave up on {len(batch) - MAX_UNSAVED} unsaved segment(s)")
+            batch = batch[-MAX_UNSAVED:]
+        if first and batch:
+            self.on_message(f"Transcript store: write failed ({str(error)}); keeping {len(batch)} segment(s) "
+                            f"and retrying")
+        return batch
+
+    def _write_batch(self, conn, batch):
+        with conn:
+            for segment in batch:
+                if 'replaces' in segment:
+                    self._replace_segment(conn, segment)
+                    continue
+                cursor = conn.execute(
+                    "INSERT INTO segments (session, source, start_time, end_time, text, words) "
+                    "VALUES (?, ?, ?, ?, ?, ?)",
+                    (segment['session'], segment['source'], segment['start_time'],
+                     segment['end_time'], segment['text'], json.dumps(segment['words'])))
+                conn.execute("INSERT INTO segments_fts (rowid, text) VALUES (?, ?)",
+                             (cursor.lastrowid, segment['text']))
+        self.written += len(batch)
+        self.commits += 1
+
+    def _replace_segment(self, conn, segment):
+        row = conn.execute("SELECT id, text FROM segments WHERE session = ? AND source = ? AND start_time = ?",
+                           (segment['session'], segment['source'], segment['replaces'])).fetchone()
+        if row is None:
+            return
+        # External-content FTS tables need the old text to remove it from the index
+        conn.execute("INSERT INTO segments_fts (segments_fts, rowid, text) VALUES ('delete', ?, ?)",
+                     (row['id'], row['text']))
+        conn.execute("UPDATE segments SET start_time = ?, end_time = ?, text = ?, words = ? WHERE id = ?",
+                     (segment['start_time'], segment['end_time'], segment['text'],
+                      json.dumps(segment['words']), row['id']))
+        conn.execute("INSERT INTO segments_fts (rowid, text) VALUES (?, ?)", (row['id'], segment['text']))
+
+    def search(self, query, limit=50, since=None, until=None):
+        """Full-text search, newest first. Plain words are matched as prefixes"""
+        terms = [t for t in query.replace('"', ' ').split() if t]
+        if not terms:
+            return []
+        match = " ".join(f'"{t}"*' for t in terms)
+        sql = ("SELECT s.*, snippet(segments_fts, 0, '[', ']', '...', 12) AS snippet "
+               "FROM segments_fts JOIN segments s ON s.id = segments_fts.rowid "
+               "WHERE segments_fts MATCH ?")
+        params = [match]
+        if since is not None:
+            sql += " AND s.start_time >= ?"
+            params.append(since)
+        if until is not None:
+            sql += " AND s.start_time < ?"
+            params.append(until)
+        sql += " ORDER BY s.start_time DESC LIMIT ?"
+        params.append(limit)
+        return self._query(sql, params)
+
+    def recent(self, limit=50):
+        return self._query("SELECT *, text AS snippet FROM segments ORDER BY start_time DESC LIMIT ?",
+                           [limit])
+
+    def _query(self, sql, params):
+        conn = self._connect()
+        try:
+            rows = conn.execute(sql, params).fetchall()
+        finally:
+            conn.close()
+        return [dict(row, words=json.loads(row['words'] or '[]')) for row in rows]
+
+
+def format_row(row):
+    stamp = time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(row['start_time']))
+    return f"[{stamp}] ({row['source']}) {row['snippet']}"
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Query stored transcripts")
+    parser.add_argument('--db', default=None, help="Transcript database (default: per-user data directory)")
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    search_parser = subparsers.add_parser('search', help="Full-text search of stored segments")
+    search_parser.add_argument('query')
+    search_parser.add_argument('--days', type=float, default=None, help="Only search the last N days")
+    search_parser.add_argument('--limit', type=int, default=50)
+    search_parser.add_argument('--json', action='store_true', help="Print results as JSON lines")
+
+    recent_parser = subparsers.add_parser('recent', help="Show the most recent segments")
+    recent_parser.add_argument('--limit', type=int, default=20)
+    recent_parser.add_argument('--json', action='store_true', help="Print results as JSON lines")
+
+    args = parser.parse_args(argv)
+    store = TranscriptStore(args.db)
+
+    started = time.perf_counter()
+    if args.command == 'search':
+        since = time.time() - args.days * 86400 if args.days else None
+        rows = store.search(args.query, args.limit, since=since)
+    else:
+        rows = store.recent(args.limit)
+    elapsed = time.perf_counter() - started
+
+    for row in reversed(rows):
+        print(json.dumps(row) if args.json else format_row(row))
+    print(f"{len(rows)} result(s) in {elapsed * 1000:.1f} ms", file=sys.stderr)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,531 @@
+import json
+import time
+import bisect
+import numpy as np
+
+from audio_pipeline import AudioRingBuffer, CaptureThread, PipelineStats
+from vad import create_vad, Endpointer
+from latency import ChunkTuner, get_profile, DEFAULT_PROFILE
+from resample import PolyphaseResampler
+from metrics import MetricsRegistry
+
+
+def _ignore(*args):
+    pass
+
+
+class FedTimeline:
+    """Maps recognizer time back to stream time.
+
+    The recognizer only sees the audio the VAD lets through, so its word
+    timestamps drift from the stream clock at every skipped gap. Each
+    discontinuity is recorded as (fed sample, stream sample) so times can be
+    mapped back exactly.
+    """
+
+    def __init__(self, rate):
+        self.rate = rate
+        self.fed_samples = 0
+        self._fed = [0]
+        self._stream = [0]
+        self._stream_end = 0
+
+    def feed(self, stream_start, n):
+        if stream_start != self._stream_end:
+            self._fed.append(self.fed_samples)
+            self._stream.append(stream_start)
+        self.fed_samples += n
+        self._stream_end = stream_start + n
+
+    def to_stream_seconds(self, fed_seconds):
+        fed = fed_seconds * self.rate
+        i = bisect.bisect_right(self._fed, fed) - 1
+        return (self._stream[i] + fed - self._fed[i]) / self.rate
+
+
+def remap_result_times(result, timeline, default_time):
+    """Convert a Vosk result's word times to stream seconds and add 'start' and 'end'.
+
+    default_time is used for results without word timings.
+    """
+    words = result.get('result', [])
+    for word in words:
+        word['start'] = timeline.to_stream_seconds(word['start'])
+        word['end'] = timeline.to_stream_seconds(word['end'])
+    if words:
+        result['start'] = words[0]['start']
+        result['end'] = words[-1]['end']
+    else:
+        result['start'] = result['end'] = default_time
+    return result
+
+
+class SegmentAudio:
+    """The audio a final result was decoded from, kept so it can be decoded again.
+
+    Samples are in recognizer (fed) time, starting fed_start seconds into
+    what the recognizer was given; remap() turns times from a decoder that
+    saw only these samples into stream seconds.
+    """
+
+    def __init__(self, samples, fed_start, timeline):
+        self.samples = samples
+        self.fed_start = fed_start
+        self.timeline = timeline
+
+    @property
+    def duration(self):
+        return len(self.samples) / self.timeline.rate
+
+    def remap(self, result, default_time):
+        for word in result.get('result', []):
+            word['start'] += self.fed_start
+            word['end'] += self.fed_start
+        return remap_result_times(result, self.timeline, default_time)
+
+
+class TranscriptionPipeline:
+    """Capture -> ring buffer -> VAD -> recognizer -> parsed results, without any UI.
+
+    run() blocks until stop() is called or the stream ends, so it is meant to
+    run on its own thread. Alternatively open(), decode_next() and close()
+    let a scheduler drive several pipelines from a shared pool of threads.
+    Results are delivered through callbacks on the decoding thread:
+      on_final(result)   Vosk result dict; 'start', 'end' and word times are
+                         seconds since the stream started. With keep_audio,
+                         'audio' holds the SegmentAudio it was decoded from
+      on_partial(text)   current partial hypothesis
+      on_status(text)    short state for a status bar
+      on_message(text)   informational lines and warnings
+
+    An optional spotter (keywords.KeywordSpotter) is fed the same speech. With
+    recognizer=None the pipeline only spots keywords. With a fingerprint_cache
+    (fingerprint_cache.FingerprintCache) sentences heard before are taken
+    from the cache instead of being decoded; their results have 'cached'.
+    pause() stops decoding while the stream stays open, so resume() is
+    immediate.
+
+    Once speech has paused for endpoint_seconds (default: the profile's) the
+    sentence is finalized at once instead of when speech resumes, with
+    FinalResult() or, with endpoint_mode="silence", by letting the recognizer
+    hear up to a second of silence first. 0 turns endpointing off.
+    """
+
+    HEALTH_INTERVAL = 1.0
+    # Longest block read from the device at a time, independent of the decode chunk
+    CAPTURE_MS = 100
+    # Longest sentence whose audio is kept with keep_audio; longer ones are finalized without it
+    MAX_KEPT_SECONDS = 30
+
+    def __init__(self, audio, device_index, recognizer, rate=16000, profile=DEFAULT_PROFILE,
+                 chunk=None, vad_mode="energy", metrics=None, keep_audio=False, history=None, spotter=None,
+                 fingerprint_cache=None, endpoint_seconds=None, endpoint_mode="final",
+                 on_final=None, on_partial=None, on_status=None, on_message=None):
+        self.audio = audio
+        self.device_index = device_index
+        self.recognizer = recognizer
+        self.spotter = spotter
+        self.rate = rate
+
+        # An explicit chunk size overrides the profile and disables auto tuning
+        self.profile = get_profile(profile)
+        self.chunk = chunk or int(rate * self.profile.chunk_ms / 1000)
+        self.partial_interval = self.profile.partial_interval_ms / 1000
+        self.tuner = ChunkTuner(rate, self.chunk) if self.profile.auto and not chunk else None
+        self.on_final = on_final or _ignore
+        self.on_partial = on_partial or _ignore
+        self.on_status = on_status or _ignore
+        self.on_message = on_message or _ignore
+
+        self.stats = PipelineStats(rate)
+        self.vad = create_vad(vad_mode, rate)
+        if endpoint_seconds is None:
+            endpoint_seconds = self.profile.endpoint_ms / 1000
+        self.endpointer = Endpointer(rate, endpoint_seconds)
+        self.endpoint_mode = endpoint_mode
+        self.final_count = 0
+        self.timeline = FedTimeline(rate)
+        self.ring = AudioRingBuffer(rate * self.profile.buffer_seconds)
+        self.running = False
+        self.paused = False
+        self._paused_flushed = False
+        self.started_at = None
+        # Stream position (seconds) of the end of the last chunk taken off the ring
+        self.decoded_until = 0.0
+        self._reported_dropped = 0
+        self._reported_overflows = 0
+        self._last_partial = 0.0
+        self.resampler = None
+        self._stream = None
+        self._capture = None
+        self._chunk_buffer = None
+        # Speech fed to the recognizer since the last final, when keep_audio is set
+        self.keep_audio = keep_audio
+        # Optional audio_history.AudioHistory that records everything captured
+        self.history = history
+        self._kept = []
+        self._kept_samples = 0
+        self._kept_start = 0
+        self._init_metrics(metrics or MetricsRegistry())
+        self.matcher = None
+        if fingerprint_cache is not None and recognizer is not None:
+            from fingerprint_cache import SegmentMatcher
+            self.matcher = SegmentMatcher(fingerprint_cache, rate, self.metrics)
+
+    def _init_metrics(self, metrics):
+        self.metrics = metrics
+        self._wait_timer = metrics.histogram("ring_wait_seconds", "Decoder waiting for a full chunk")
+        self._vad_timer = metrics.histogram("vad_seconds", "Voice activity check per chunk")
+        self._accept_timer = metrics.histogram("accept_waveform_seconds", "KaldiRecognizer.AcceptWaveform()")
+        self._partial_timer = metrics.histogram("partial_result_seconds", "KaldiRecognizer.PartialResult()")
+        self._parse_timer = metrics.histogram("result_parse_seconds", "json.loads() of recognizer results")
+        self._spot_timer = metrics.histogram("keyword_spot_seconds", "Grammar recognizer per chunk")
+        self._final_latency_timer = metrics.histogram("final_latency_seconds", "End of speech to its final text")
+        self._endpoint_counter = metrics.counter("endpoint_finals_total", "Finals forced after a pause")
+        self._chunk_timer = metrics.histogram("decode_chunk_seconds", "Everything done per decoded chunk")
+        self._fill_gauge = metrics.gauge("buffer_fill_ratio", "Ring buffer fill")
+        self._lag_gauge = metrics.gauge("decode_lag_seconds", "Audio waiting to be decoded")
+        self._rtf_gauge = metrics.gauge("real_time_factor", "Decode time per second of audio")
+        self._overflow_counter = metrics.counter("overflows_total", "Device input overflows")
+        self._dropped_counter = metrics.counter("dropped_samples_total", "Samples dropped by the ring buffer")
+        self._decoded_counter = metrics.counter("decoded_samples_total", "Samples taken off the ring buffer")
+
+    def stop(self):
+        """Ask run() to finish; the stream is closed by the pipeline thread itself"""
+        self.running = False
+        self.ring.close()
+
+    def pause(self):
+        """Discard audio instead of decoding it; what the recognizer holds is finalized first"""
+        self.paused = True
+        if self._capture:
+            self._capture.paused = True
+
+    def resume(self):
+        self.paused = False
+        if self._capture:
+            self._capture.paused = False
+
+    def run(self):
+        try:
+            self.open()
+            while self.running and self.decode_next(timeout=0.5) is not None:
+                pass
+            self.flush()
+            self.report_summary()
+
+        except Exception as e:
+            self.on_message(f"Transcription error: {str(e)}")
+            self.on_status("Error")
+
+        finally:
+            self.close()
+
+    def open(self):
+        """Open the device and start capturing; decoding is driven by decode_next()"""
+        self.running = True
+        self.on_message(f"Opening audio stream from device {self.device_index}")
+        self._stream, capture_chunk = self.open_stream()
+        self.on_message(f"Audio stream opened successfully ({self.resampler.describe()})")
+
+        # Sized for the largest chunk the tuner may pick, so retuning never reallocates
+        max_chunk = self.tuner.max_chunk if self.tuner else self.chunk
+        self._chunk_buffer = np.zeros(max(max_chunk, self.chunk), dtype=np.int16)
+        self._silent_samples = 0
+        self._last_health_check = time.monotonic()
+
+        # Capture runs on its own thread so slow decoding never stalls the device
+        self.started_at = time.time()
+        if self.history is not None:
+            self.history.reset(self.started_at)
+        self._capture = CaptureThread(self._stream, self.ring, capture_chunk, self.stats, self.resampler,
+                                      self.metrics, self.history)
+        self._capture.paused = self.paused
+        self._capture.start()
+
+    def close(self):
+        """Stop capturing and close the stream; only called from the decoding thread"""
+        self.running = False
+        if self._capture:
+            self._capture.stop()
+            self._capture.join()
+            self._capture = None
+        if self._stream:
+            self._stream.stop_stream()
+            self._stream.close()
+            self._stream = None
+
+    def report_summary(self):
+        self.update_metrics()
+        if self._capture and self._capture.error is not None:
+            self.on_message(f"Audio error: {str(self._capture.error)}")
+        self.on_message(self.vad.stats.summary())
+        if self.matcher:
+            self.on_message(self.matcher.summary())
+        latency = self._final_latency_timer.percentiles()
+        if self.endpointer.pause_samples and latency['count']:
+            self.on_message(f"Endpointing: {self.endpointer.forced} final(s) forced after "
+                            f"{self.endpointer.pause_seconds:.1f}s pauses; end of speech to final text "
+                            f"p50 {latency['p50']:.2f}s, p95 {latency['p95']:.2f}s")
+        if self.spotter:
+            self.on_message(f"Keyword spotting: {self.spotter.alerts} alert(s), "
+                            f"{self.spotter.decode_seconds:.2f}s of decoding")
+        if self.resampler and not self.resampler.passthrough:
+            self.on_message(f"Resampling cost {self.resampler.mean_chunk_us:.0f} us per "
+                            f"{self.CAPTURE_MS} ms block")
+
+    def device_format(self):
+        """Native (rate, channels) of the capture device"""
+        if self.device_index is None:
+            info = self.audio.get_default_input_device_info()
+        else:
+            info = self.audio.get_device_info_by_index(self.device_index)
+        rate = int(info.get('defaultSampleRate') or self.rate)
+        # Downmixing more than stereo only wastes bandwidth on loopback devices
+        channels = max(1, min(int(info.get('maxInputChannels') or 1), 2))
+        return rate, channels
+
+    def open_stream(self):
+        """Open the device at its native format, falling back to letting the host resample"""
+        # Imported here so the headless server can use this module without PortAudio
+        import pyaudio
+        try:
+            formats = [self.device_format()]
+        except Exception:
+            formats = []
+        if (self.rate, 1) not in formats:
+            formats.append((self.rate, 1))
+
+        for i, (rate, channels) in enumerate(formats):
+            capture_chunk = int(rate * self.CAPTURE_MS / 1000)
+            try:
+                stream = self.audio.open(
+                    format=pyaudio.paInt16,
+                    channels=channels,
+                    rate=rate,
+                    input=True,
+                    frames_per_buffer=capture_chunk,
+                    input_device_index=self.device_index
+                )
+            except Exception:
+                if i == len(formats) - 1:
+                    raise
+                continue
+            self.resampler = PolyphaseResampler(rate, self.rate, channels, capture_chunk)
+            return stream, capture_chunk
+
+    @property
+    def ready(self):
+        """True when a full chunk is waiting, or the ring is closed with audio left"""
+        fill = self.ring.fill
+        return fill >= self.chunk or (self.ring.closed and fill > 0)
+
+    def decode_next(self, timeout=0.5):
+        """Decode one chunk from the ring buffer.
+
+        Returns the number of samples processed, 0 if nothing was ready within
+        the timeout, or None once the ring is closed and drained.
+        """
+        wait_start = time.perf_counter()
+        n = self.ring.read_into(self._chunk_buffer[:self.chunk], timeout=timeout)
+        decode_start = time.perf_counter()
+        self._wait_timer.observe(decode_start - wait_start)
+        if n == 0:
+            return None if self.ring.closed else 0
+
+        try:
+            chunk_start = self.ring.last_read_start
+            self.decoded_until = (chunk_start + n) / self.rate
+
+            # Paused audio is read off the ring so the stream clock keeps running, then dropped
+            if self.paused:
+                if not self._paused_flushed:
+                    self._paused_flushed = True
+                    self.flush()
+                    self.vad.reset()
+                    self.endpointer.reset()
+                    self.on_status("Paused")
+                return n
+            self._paused_flushed = False
+
+            # Only speech (plus replayed pre-roll) reaches the recognizer
+            speech = self.vad.process(self._chunk_buffer[:n])
+            self._vad_timer.observe(time.perf_counter() - decode_start)
+            if speech is None:
+                if self.matcher is not None:
+                    # A pause ends the sentence being held: reuse it or decode it now
+                    self.apply(self.matcher.resolve())
+                if self.endpointer.due(chunk_start + n):
+                    self.endpoint(chunk_start + n)
+                self._silent_samples += n
+                if self._silent_samples >= self.rate * 2.5:
+                    self._silent_samples = 0
+                    self.on_status("Listening (silent)")
+                return n
+            self._silent_samples = 0
+            self.on_status("Transcribing...")
+
+            recognize_start = time.perf_counter()
+            self.timeline.feed(chunk_start + n - len(speech), len(speech))
+            self.endpointer.speech(chunk_start + n)
+            self.accept(speech)
+            self.vad.stats.record_decode(len(speech), time.perf_counter() - recognize_start)
+            if self.tuner:
+                self.retune(n, time.perf_counter() - decode_start)
+
+        except Exception as e:
+            self.on_message(f"Error processing audio: {str(e)}")
+
+        finally:
+            elapsed = time.perf_counter() - decode_start
+            self._chunk_timer.observe(elapsed)
+            self.stats.record_decode(n, elapsed, self.ring)
+            if time.monotonic() - self._last_health_check >= self.HEALTH_INTERVAL:
+                self._last_health_check = time.monotonic()
+                self.report_health()
+        return n
+
+    def endpoint(self, position):
+        """Finalize the sentence before a pause instead of waiting for the next speech"""
+        self._endpoint_counter.inc()
+        if self.endpoint_mode != "silence" or not self.feed_silence(position):
+            self.flush()
+        self.on_status("Listening (silent)")
+
+    def feed_silence(self, position):
+        """Let the recognizer hear the pause so its own endpointing can finish; True if it did"""
+        if self.recognizer is None or (self.matcher is not None and self.matcher.state != "decoding"):
+            return False
+        start = self.endpointer.speech_end
+        n = min(position - start, self.rate)
+        finals = self.final_count
+        # The zeros stand in for the skipped silence right after the speech
+        self.timeline.feed(start, n)
+        self.accept(np.zeros(n, dtype=np.int16))
+        return self.final_count > finals
+
+    def retune(self, samples, elapsed):
+        previous = self.chunk
+        self.chunk = self.tuner.record(samples, elapsed, self.ring.fill_ratio)
+        if self.chunk != previous:
+            # Poll partials once per chunk; more often only adds overhead
+            self.partial_interval = self.chunk / self.rate
+            if self.chunk > previous:
+                self.on_message(f"Decoder load {self.tuner.load:.0%} of real time, "
+                                f"increasing chunk to {self.chunk * 1000 // self.rate} ms")
+
+    def accept(self, samples):
+        """Feed samples to the recognizer and emit the resulting final or partial"""
+        if self.keep_audio:
+            self._keep(samples)
+        if self.spotter is not None:
+            start = time.perf_counter()
+            self.spotter.accept(samples, self.timeline)
+            self._spot_timer.observe(time.perf_counter() - start)
+        if self.recognizer is None:
+            return
+        if self.matcher is not None:
+            self.apply(self.matcher.accept(samples))
+        else:
+            self.recognize(samples)
+
+    def apply(self, actions):
+        """Carry out the matcher's decisions in order"""
+        for kind, value in actions:
+            if kind == "decode":
+                self.recognize(value)
+            else:
+                self.emit_final(value, cached=True)
+
+    def recognize(self, samples):
+        start = time.perf_counter()
+        accepted = self.recognizer.AcceptWaveform(samples.tobytes())
+        self._accept_timer.observe(time.perf_counter() - start)
+        if accepted:
+            self.final_count += 1
+            self.endpointer.reset()   # The recognizer ended the sentence by itself
+            self.emit_final(self.parse_result(self.recognizer.Result()))
+        elif time.monotonic() - self._last_partial >= self.partial_interval:
+            self._last_partial = time.monotonic()
+            start = time.perf_counter()
+            partial_json = self.recognizer.PartialResult()
+            self._partial_timer.observe(time.perf_counter() - start)
+            partial = self.parse_result(partial_json)
+            if partial.get('partial', '').strip():
+                self.on_partial(partial['partial'])
+
+    def _keep(self, samples):
+        if not self._kept:
+            # accept() runs after timeline.feed(), so these samples end at fed_samples
+            self._kept_start = self.timeline.fed_samples - len(samples)
+        if self._kept_samples + len(samples) > self.MAX_KEPT_SECONDS * self.rate:
+            # Too long to keep; nothing more is kept until the next final
+            self._kept = []
+            self._kept_samples = -1
+        if self._kept_samples >= 0:
+            self._kept.append(samples.copy())
+            self._kept_samples += len(samples)
+
+    def take_kept_audio(self):
+        """SegmentAudio for everything fed since the last final, or None; starts a new segment"""
+        kept, complete = self._kept, self._kept_samples > 0
+        self._kept = []
+        self._kept_samples = 0
+        if not complete:
+            return None
+        return SegmentAudio(np.concatenate(kept), self._kept_start / self.rate, self.timeline)
+
+    def parse_result(self, result_json):
+        start = time.perf_counter()
+        result = json.loads(result_json)
+        self._parse_timer.observe(time.perf_counter() - start)
+        return result
+
+    def flush(self):
+        """Finalize whatever the recognizer still holds"""
+        if self.spotter is not None:
+            self.spotter.flush(self.timeline)
+        if self.recognizer is None:
+            return
+        if self.matcher is not None:
+            self.apply(self.matcher.resolve())
+        self.emit_final(self.parse_result(self.recognizer.FinalResult()))
+
+    def emit_final(self, result, cached=False):
+        audio = self.take_kept_audio() if self.keep_audio else None
+        if cached:
+            audio = None  # Nothing to refine; the text is already known
+        elif self.matcher is not None:
+            self.matcher.finish_segment(result)
+        if not result.get('text', '').strip():
+            return
+        remap_result_times(result, self.timeline, self.decoded_until)
+        # Newest captured audio minus the end of the last word (or of the fed speech without word times)
+        speech_end = result['end'] if result.get('result') else self.endpointer.speech_end / self.rate
+        self._final_latency_timer.observe(max(0.0, self.decoded_until + self.ring.fill / self.rate - speech_end))
+        if audio is not None:
+            result['audio'] = audio
+        self.on_final(result)
+
+    def update_metrics(self):
+        """Copy the pipeline counters into the metrics registry; returns the snapshot"""
+        stats = self.stats.snapshot()
+        self._fill_gauge.set(stats['buffer_fill'])
+        self._lag_gauge.set(stats['decode_lag'])
+        self._rtf_gauge.set(stats['real_time_factor'])
+        self._overflow_counter.set(stats['overflows'])
+        self._dropped_counter.set(stats['dropped_frames'])
+        self._decoded_counter.set(stats['decoded_frames'])
+        return stats
+
+    def report_health(self):
+        """Warn when capture had to drop audio since the last check"""
+        stats = self.update_metrics()
+        lost = stats['dropped_frames'] - self._reported_dropped
+        overflows = stats['overflows'] - self._reported_overflows
+        if lost > 0 or overflows > 0:
+            self._reported_dropped = stats['dropped_frames']
+            self._reported_overflows = stats['overflows']
+            self.on_message(f"Warning: decoder cannot keep up - dropped {lost / self.rate:.2f}s of audio, "
+                            f"{overflows} device overflow(s), lag {stats['decode_lag']:.2f}s, "
+                            f"buffer {stats['buffer_fill']:.0%} full")
@@ -0,0 +1,123 @@
+import threading
+import time
+import tkinter as tk
+
+
+class UIUpdateQueue:
+    """Thread-safe queue of UI updates that the Tk loop drains at a fixed frame rate.
+
+    Worker threads post into it instead of scheduling one root.after()
+    callback per update. Transcript lines are batched in order, while status
+    and partial text keep only the newest value, so superseded partials never
+    reach the widget.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._lines = []
+        self._calls = []
+        self._status = None
+        self.posted = 0
+        self.coalesced = 0
+
+    def post_line(self, text, tag=None):
+        """Queue a transcript line; a tag lets BoundedTranscript.replace() rewrite it later"""
+        with self._lock:
+            self._lines.append(text if tag is None else (text, tag))
+            self.posted += 1
+
+    def post_status(self, text):
+        with self._lock:
+            if self._status is not None:
+                self.coalesced += 1
+            self._status = text
+            self.posted += 1
+
+    def post_partial(self, text, width=20):
+        self.post_status(f"Partial: {text[:width]}{'...' if len(text) > width else ''}")
+
+    def post_call(self, func):
+        """Run func on the Tk thread at the next frame"""
+        with self._lock:
+            self._calls.append(func)
+            self.posted += 1
+
+    def discard_lines(self):
+        with self._lock:
+            self._lines.clear()
+
+    @property
+    def depth(self):
+        with self._lock:
+            return len(self._lines) + len(self._calls) + (self._status is not None)
+
+    def drain(self):
+        """Take everything posted since the last frame: (calls, lines, status)"""
+        with self._lock:
+            calls, self._calls = self._calls, []
+            lines, self._lines = self._lines, []
+            status, self._status = self._status, None
+        return calls, lines, status
+
+
+class BoundedTranscript:
+    """Keeps a tk.Text widget to at most max_lines lines.
+
+    Lines scrolled off the top are appended to spill_path so long sessions
+    keep their full history on disk while the widget stays small.
+    """
+
+    def __init__(self, text_widget, max_lines=2000, spill_path=None):
+        self.text = text_widget
+        self.max_lines = max_lines
+        self.spill_path = spill_path
+        self.spilled_lines = 0
+
+    @property
+    def line_count(self):
+        return int(self.text.index('end-1c').split('.')[0])
+
+    def append(self, lines):
+        """Insert a batch of lines with one widget update and trim the overflow"""
+        if not lines:
+            return
+        if all(isinstance(line, str) for line in lines):
+            self.text.insert(tk.END, "\n".join(lines) + "\n")
+        else:
+            # Still one insert: Tk takes alternating text and tag arguments
+            args = []
+            for line in lines:
+                text, tag = (line, ()) if isinstance(line, str) else line
+                args += [text + "\n", tag]
+            self.text.insert(tk.END, *args)
+        excess = self.line_count - 1 - self.max_lines
+        if excess > 0:
+            self._spill(excess)
+        self.text.see(tk.END)
+
+    def replace(self, tag, text, new_tag="refined"):
+        """Rewrite a tagged line in place; False if it already scrolled off or was cleared"""
+        ranges = self.text.tag_ranges(tag)
+        self.text.tag_delete(tag)
+        if not ranges:
+            return False
+        start, end = ranges[0], ranges[-1]
+        # The tag covers the trailing newline, which stays in place
+        self.text.delete(start, f"{end}-1c")
+        self.text.insert(start, text, new_tag)
+        return True
+
+    def _spill(self, count):
+        end = f"{count + 1}.0"
+        if self.spill_path:
+            with open(self.spill_path, 'a', encoding='utf-8') as f:
+                f.write(self.text.get("1.0", end))
+        self.text.delete("1.0", end)
+        self.spilled_lines += count
+
+    def clear(self):
+        self.text.delete("1.0", tk.END)
+
+
+def spill_file_name():
+    return time.strftime("transcript-%Y%m%d-%H%M%S.txt")
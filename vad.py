@@ -0,0 +1,284 @@
+import time
+import numpy as np
+
+
+class VADStats:
+    """Counts how much audio the VAD kept away from the recognizer and what that saved"""
+
+    def __init__(self, rate):
+        self.rate = rate
+        self.total_samples = 0
+        self.skipped_samples = 0
+        self.replayed_samples = 0
+        self.vad_seconds = 0.0
+        self.decoded_samples = 0
+        self.decode_seconds = 0.0
+
+    def record_decode(self, samples, elapsed):
+        """Called by the decode stage so savings are estimated from the measured decode cost"""
+        self.decoded_samples += samples
+        self.decode_seconds += elapsed
+
+    @property
+    def skipped_ratio(self):
+        return self.skipped_samples / self.total_samples if self.total_samples else 0.0
+
+    @property
+    def saved_decode_seconds(self):
+        """Estimated decode CPU saved by skipping audio, net of the VAD's own cost"""
+        if not self.decoded_samples:
+            return 0.0
+        cost_per_sample = self.decode_seconds / self.decoded_samples
+        return self.skipped_samples * cost_per_sample - self.vad_seconds
+
+    def summary(self):
+        return (f"VAD skipped {self.skipped_samples / self.rate:.1f}s of "
+                f"{self.total_samples / self.rate:.1f}s audio ({self.skipped_ratio:.0%}), "
+                f"saving ~{self.saved_decode_seconds:.1f}s of decode CPU "
+                f"(VAD cost {self.vad_seconds:.2f}s)")
+
+
+class VoiceActivityDetector:
+    """Base class for VAD stages sitting between capture and the recognizer.
+
+    process() takes one capture chunk and returns the samples the recognizer
+    should see, or None for non-speech. Skipped audio is kept in a pre-roll
+    buffer and replayed in front of the chunk where speech starts, so word
+    onsets are not clipped. Subclasses implement detect().
+    """
+
+    def __init__(self, rate, preroll_ms=300):
+        self.rate = rate
+        self.stats = VADStats(rate)
+        self.in_speech = False
+        self._preroll = np.zeros(int(rate * preroll_ms / 1000), dtype=np.int16)
+        self._preroll_fill = 0
+
+    def detect(self, samples):
+        """Return True if the chunk contains speech (including hangover)"""
+        raise NotImplementedError
+
+    def process(self, samples):
+        start = time.perf_counter()
+        active = self.detect(samples)
+        if active:
+            if not self.in_speech and self._preroll_fill:
+                preroll = self._preroll[len(self._preroll) - self._preroll_fill:]
+                output = np.concatenate((preroll, samples))
+                self.stats.replayed_samples += self._preroll_fill
+                self._preroll_fill = 0
+            else:
+                output = samples
+        else:
+            self._push_preroll(samples)
+            output = None
+        self.in_speech = active
+
+        self.stats.total_samples += len(samples)
+        if output is None:
+            self.stats.skipped_samples += len(samples)
+        else:
+            # Replayed pre-roll was counted as skipped when it arrived
+            self.stats.skipped_samples -= len(output) - len(samples)
+        self.stats.vad_seconds += time.perf_counter() - start
+        return output
+
+    def _push_preroll(self, samples):
+        size = len(self._preroll)
+        n = len(samples)
+        if size == 0:
+            return
+        if n >= size:
+            self._preroll[:] = samples[n - size:]
+        else:
+            self._preroll[:size - n] = self._preroll[n:]
+            self._preroll[size - n:] = samples
+        self._preroll_fill = min(size, self._preroll_fill + n)
+
+    def reset(self):
+        self.in_speech = False
+        self._preroll_fill = 0
+
+
+class PassthroughVAD(VoiceActivityDetector):
+    """Sends every chunk to the recognizer"""
+
+    def __init__(self, rate, preroll_ms=0):
+        super().__init__(rate, preroll_ms)
+
+    def detect(self, samples):
+        return True
+
+
+class EnergyVAD(VoiceActivityDetector):
+    """Frame-level VAD using energy above an adaptive noise floor plus spectral shape.
+
+    Each chunk is cut into frame_ms frames and all features are computed for
+    every frame at once with NumPy:
+      - log energy relative to a noise floor that drops immediately and rises slowly
+      - fraction of energy in the 250-4000 Hz speech band (rejects rumble and bass)
+      - spectral flatness (rejects broadband noise such as fans and hiss)
+      - zero-crossing rate (rejects high-frequency hiss)
+      - syllable-rate modulation, once per chunk: share of the energy envelope
+        that rises and falls at 2-8 Hz over the last modulation_ms (rejects
+        sustained tones and held chords, which the spectral features above
+        cannot tell from voiced speech)
+    A frame stays active for hangover_ms after the last speech frame so word
+    endings and short pauses are not cut. Music with a strong beat in the
+    syllable range still modulates like speech and is not rejected.
+    """
+
+    def __init__(self, rate, frame_ms=20, hangover_ms=300, preroll_ms=300,
+                 margin_db=10.0, min_energy_db=-55.0, min_band_ratio=0.3,
+                 max_flatness=0.5, max_zcr=0.45, min_speech_frames=3,
+                 modulation_ms=1000, min_modulation=0.05):
+        super().__init__(rate, preroll_ms)
+        self.frame_len = int(rate * frame_ms / 1000)
+        self.hangover_frames = int(hangover_ms / frame_ms)
+        self.margin_db = margin_db
+        self.min_energy_db = min_energy_db
+        self.min_band_ratio = min_band_ratio
+        self.max_flatness = max_flatness
+        self.max_zcr = max_zcr
+        self.min_speech_frames = min_speech_frames
+        self.min_modulation = min_modulation
+        self.noise_floor_db = -60.0
+        self.frame_rate = 1000.0 / frame_ms
+        self._envelope = np.zeros(max(int(modulation_ms / frame_ms), 2), dtype=np.float32)
+
+        self._window = np.hanning(self.frame_len).astype(np.float32)
+        freqs = np.fft.rfftfreq(self.frame_len, 1.0 / rate)
+        self._band = (freqs >= 250) & (freqs <= 4000)
+        self._tail = np.zeros(0, dtype=np.int16)
+        self._frames_since_speech = self.hangover_frames + 1
+
+    def frame_features(self, samples):
+        """Return per-frame (energy_db, band_ratio, flatness, zcr) for whole frames in samples"""
+        n = len(samples) // self.frame_len
+        frames = samples[:n * self.frame_len].reshape(n, self.frame_len).astype(np.float32) / 32768.0
+
+        energy_db = 10.0 * np.log10(np.mean(frames * frames, axis=1) + 1e-10)
+        signs = np.signbit(frames)
+        zcr = np.count_nonzero(signs[:, 1:] != signs[:, :-1], axis=1) / (self.frame_len - 1)
+
+        power = np.abs(np.fft.rfft(frames * self._window, axis=1)) ** 2 + 1e-12
+        band_ratio = power[:, self._band].sum(axis=1) / power.sum(axis=1)
+        flatness = np.exp(np.mean(np.log(power), axis=1)) / np.mean(power, axis=1)
+        return energy_db, band_ratio, flatness, zcr
+
+    def modulation(self, energy_db):
+        """Share of envelope power at syllable rate (2-8 Hz) over the last modulation_ms
+
+        The amplitude envelope of speech rises and falls with every syllable,
+        around 4 times a second; held notes and chords change far less. The
+        result is normalised by the envelope's mean power so it does not
+        depend on loudness: a steady tone scores near 0, speech about 0.1 to 0.4.
+        """
+        amplitude = np.power(10.0, energy_db / 20.0).astype(np.float32)
+        envelope = np.concatenate((self._envelope, amplitude))
+        self._envelope = envelope[len(envelope) - len(self._envelope):]
+        envelope = envelope[len(envelope) - max(len(self._envelope), len(amplitude)):]
+        mean = float(envelope.mean())
+        if mean <= 0.0:
+            return 0.0
+        spectrum = np.abs(np.fft.rfft(envelope / mean - 1.0)) ** 2
+        freqs = np.fft.rfftfreq(len(envelope), 1.0 / self.frame_rate)
+        syllable = (freqs >= 2.0) & (freqs <= 8.0)
+        # Parseval: mean square of the normalised envelope restricted to the band
+        return float(2.0 * spectrum[syllable].sum() / len(envelope) ** 2)
+
+    def detect(self, samples):
+        # Carry partial frames over so frame boundaries stay continuous across chunks
+        if len(self._tail):
+            samples = np.concatenate((self._tail, samples))
+        n = len(samples) // self.frame_len
+        self._tail = samples[n * self.frame_len:].copy()
+        if n == 0:
+            return self.in_speech
+
+        energy_db, band_ratio, flatness, zcr = self.frame_features(samples)
+        candidate = ((energy_db > max(self.noise_floor_db + self.margin_db, self.min_energy_db))
+                     & (band_ratio > self.min_band_ratio)
+                     & (flatness < self.max_flatness)
+                     & (zcr < self.max_zcr))
+        if self.modulation(energy_db) < self.min_modulation:
+            candidate[:] = False
+        if not self.in_speech and np.count_nonzero(candidate) < self.min_speech_frames:
+            candidate[:] = False
+
+        # Frames since the most recent speech frame, continuing from the previous chunk
+        idx = np.arange(n)
+        last = np.maximum.accumulate(np.where(candidate, idx, -1))
+        since = np.where(last >= 0, idx - last, self._frames_since_speech + idx + 1)
+        self._frames_since_speech = int(since[-1])
+        active = since <= self.hangover_frames
+
+        # Noise floor follows quiet frames down immediately and up slowly
+        quiet = energy_db[~candidate]
+        if len(quiet):
+            level = float(np.percentile(quiet, 10))
+            if level < self.noise_floor_db:
+                self.noise_floor_db = level
+            else:
+                self.noise_floor_db += (level - self.noise_floor_db) * 0.05
+
+        return bool(active.any())
+
+    def reset(self):
+        super().reset()
+        self._tail = np.zeros(0, dtype=np.int16)
+        self._envelope[:] = 0.0
+        self._frames_since_speech = self.hangover_frames + 1
+
+
+class Endpointer:
+    """Decides when a pause is long enough to finalize what the recognizer holds.
+
+    The VAD keeps silence away from the recognizer, so Vosk never sees the
+    trailing silence its own endpointing waits for, and the last sentence
+    before a pause would only become final once speech resumes. The decode
+    stage reports where fed speech ends (in stream samples) and asks due() on
+    every skipped chunk. pause_seconds of 0 or None turns it off.
+    """
+
+    def __init__(self, rate, pause_seconds):
+        self.rate = rate
+        self.pause_samples = int(pause_seconds * rate) if pause_seconds else 0
+        self.pending = False
+        self.speech_end = 0
+        self.forced = 0
+
+    @property
+    def pause_seconds(self):
+        return self.pause_samples / self.rate
+
+    def speech(self, end):
+        """Speech up to stream sample `end` was fed to the recognizer"""
+        self.pending = True
+        self.speech_end = end
+
+    def due(self, position):
+        """True once, when the stream has reached pause_seconds past the last speech"""
+        if not self.pending or not self.pause_samples or position - self.speech_end < self.pause_samples:
+            return False
+        self.pending = False
+        self.forced += 1
+        return True
+
+    def reset(self):
+        self.pending = False
+
+
+VAD_TYPES = {
+    "energy": EnergyVAD,
+    "off": PassthroughVAD,
+}
+
+
+def create_vad(name, rate, **kwargs):
+    """Build a VAD stage by name; see VAD_TYPES"""
+    try:
+        vad_class = VAD_TYPES[name]
+    except KeyError:
+        raise ValueError(f"Unknown VAD type '{name}', expected one of: {', '.join(VAD_TYPES)}")
+    return vad_class(rate, **kwargs)